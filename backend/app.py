@@ -1,15 +1,20 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory, session, redirect, url_for, make_response, Response
+from flask import Flask, render_template, request, jsonify, send_from_directory, session, redirect, url_for, make_response, Response, g
 from flask_sock import Sock
 from threading import Event
+import asyncio
+import os
 import time
 import json
 import requests
 from datetime import datetime
 from flask_cors import CORS
 from flask_wtf.csrf import CSRFProtect
-from llm_handler import process_llm_request, process_suggestions_request
-from session_manager import apply_changes, get_sorted_sessions, get_profile, initialize_or_load_program
+from llm_handler import aprocess_llm_request, aprocess_suggestions_request, llm_gateway
+from semantic_cache import semantic_cache
+from session_manager import apply_changes, get_sorted_sessions, get_profile, ainitialize_or_load_program, get_program_etag, get_program_version, get_changes_since, query_sessions, get_next_session
 from calendar_manager import CalendarManager
+from suggestion_cache import suggestion_prefetcher
+from conversation_store import conversation_store
 from flask_restx import Api, Resource, fields
 from functools import wraps
 from flask import Response
@@ -17,6 +22,7 @@ from activity_simulator import ActivitySimulator
 import urllib.parse
 from auth import AuthManager
 import secrets
+import hmac
 
 app = Flask(__name__, 
     static_folder='static',
@@ -26,23 +32,85 @@ sock = Sock(app)
 
 app.secret_key = secrets.token_hex(32)  # Clé secrète pour les sessions
 csrf = CSRFProtect(app)  # Activation de la protection CSRF
+app.config['WTF_CSRF_CHECK_DEFAULT'] = False  # Vérifiée dans check_login, seulement pour l'authentification par cookie
 CORS(app)
 
 key_static = 'avatVRKqyldREW2vwYeBd9ltNboJGPsXRetLipCxyLY'
 
+# Batch chat API
+BATCH_MAX_ITEMS = 100
+BATCH_MAX_CONCURRENCY = int(os.environ.get('BATCH_MAX_CONCURRENCY', 8))  # Users processed at the same time
+CALENDAR_FEED_MAX_USERS = int(os.environ.get('CALENDAR_FEED_MAX_USERS', 500))  # Users per aggregated calendar feed
+
+def user_tokens_setting(name):
+    """Comma-separated user tokens of an environment variable"""
+    return frozenset(token.strip() for token in os.environ.get(name, '').split(',') if token.strip())
+
+# Optional service credentials of integrations, each allowed to act for the listed user tokens only
+BATCH_SERVICE_KEY = os.environ.get('BATCH_SERVICE_KEY')
+BATCH_SERVICE_USERS = user_tokens_setting('BATCH_SERVICE_USERS')
+CALENDAR_FEED_KEY = os.environ.get('CALENDAR_FEED_KEY')
+CALENDAR_FEED_USERS = user_tokens_setting('CALENDAR_FEED_USERS')
+# Routes authenticated by a service credential rather than a personal API key
+SERVICE_ENDPOINTS = ('api_chat_batch', 'api_calendar_feed')
+# Routes acting for the user of a personal API key (api_user_token); the others only use the session
+API_KEY_ENDPOINTS = ('api_init_program', 'api_chat', 'api_get_program', 'api_get_program_next',
+                     'api_get_program_changes', 'api_get_calendar', 'api_get_chat_suggestions')
+
 auth_manager = AuthManager()
+calendar_manager = CalendarManager()
 
 
+def current_user_token():
+    """user_token de l'utilisateur connecté, le JWT de la session n'étant vérifié qu'une fois par requête"""
+    if 'user_token' not in g:
+        g.user_token = auth_manager.get_user_token_from_jwt(session.get('user_token'))
+    return g.user_token
+
 def check_user_session():
-    jwt = session.get('user_token')
-    if not jwt or not auth_manager.verify_token(jwt):
+    if not current_user_token():
         return redirect(url_for('login'))
     return None
 
+def request_api_key():
+    """
+    Clé d'API de la requête : en-tête X-API-Key, Authorization: Bearer ou paramètre key,
+    ce dernier seulement en lecture (un formulaire d'un autre site peut le mettre dans son URL)
+    """
+    authorization = request.headers.get('Authorization', '')
+    if authorization.startswith('Bearer '):
+        return authorization[len('Bearer '):].strip()
+    if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+        return request.headers.get('X-API-Key')
+    return request.headers.get('X-API-Key') or request.args.get('key')
+
+def service_key_valid(configured_key):
+    """Whether the request's X-API-Key header is the configured service credential (never read from the URL)"""
+    service_key = request.headers.get('X-API-Key')
+    return bool(service_key and configured_key and hmac.compare_digest(service_key.encode(), configured_key.encode()))
+
+def api_user_token():
+    """Utilisateur d'une requête /api : celui de sa clé d'API personnelle, sinon l'utilisateur de démonstration"""
+    return g.get('api_user_token') or key_static
+
 @app.before_request
 def check_login():
+    # Les routes de API_KEY_ENDPOINTS acceptent une clé d'API personnelle à la place de la session
+    if request.endpoint in API_KEY_ENDPOINTS:
+        api_key = request_api_key()
+        if api_key and api_key != key_static:
+            g.api_user_token = auth_manager.resolve_api_key(api_key)
+            if not g.api_user_token:
+                return jsonify({'success': False, 'error': 'Invalid API key'}), 401
+            # Pas de CSRF : le navigateur n'envoie jamais la clé de lui-même, contrairement au cookie
+            return None
+
+    # Les routes de service s'authentifient par en-tête, les autres requêtes par le cookie de session
+    if app.config['WTF_CSRF_ENABLED'] and request.endpoint and request.endpoint not in SERVICE_ENDPOINTS:
+        csrf.protect()
+
     # Exclude login/static routes from check
-    if request.endpoint and request.endpoint not in ['login', 'static', 'favicon', 'test', 'register', 'get_activity_data', 'reset_simulation', 'get_status', 'add_time', 'get_distance', 'get_pace', 'get_time', 'api_chat']:
+    if request.endpoint and request.endpoint not in ['login', 'static', 'favicon', 'test', 'register', 'get_activity_data', 'reset_simulation', 'get_status', 'add_time', 'get_distance', 'get_pace', 'get_time', 'api_chat', 'api_chat_batch', 'api_calendar_feed']:
         redirect_response = check_user_session()
         if redirect_response:
             return redirect_response
@@ -54,9 +122,211 @@ def login_required(f):
         if 'user_token' not in session:
             print("Authentication required")
             return jsonify({'success': False, 'error': 'Authentication required'}), 401
-        return f(*args, **kwargs)
+        # Async views are run to completion by Flask
+        return app.ensure_sync(f)(*args, **kwargs)
     return decorated_function
 
+# === Réponses conditionnelles du programme ===
+
+def program_not_modified(user_token):
+    """Returns a 304 response if the client already holds the current program version"""
+    etag = get_program_etag(user_token)
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return None
+
+def program_response(payload, user_token, version):
+    """Builds a JSON program response tagged with the program version"""
+    response = jsonify({**payload, 'version': version})
+    response.set_etag(get_program_etag(user_token, version))
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def calendar_response(user_token):
+    """ICS feed of a user, answered with 304 when the client's copy (ETag or date) is current"""
+    ics_content, etag, last_modified = calendar_manager.get_feed(user_token)
+    response = Response(ics_content)
+    response.headers.update({
+        'Content-Type': 'text/calendar; charset=utf-8',
+        'Content-Disposition': f'inline; filename=running_program_{user_token}.ics',
+        'Cache-Control': 'public, max-age=3600'
+    })
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    return response.make_conditional(request)
+
+def program_changes_payload(user_token, since_version):
+    """Diff of the program since the client's version, or the full program if it can't be rebuilt"""
+    changes = get_changes_since(user_token, since_version)
+    if changes is None:
+        return {
+            'full': True,
+            'version': get_program_version(user_token),
+            'program': get_sorted_sessions(user_token)
+        }
+    return {'full': False, **changes}
+
+def program_query_payload(user_token):
+    """Program sessions, restricted to a date window and paginated when from/to/limit/cursor are given"""
+    args = request.args
+    if not any(key in args for key in ('from', 'to', 'limit', 'cursor')):
+        return {'program': get_sorted_sessions(user_token)}
+    
+    limit = args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError("limit must be an integer")
+    
+    sessions, next_cursor = query_sessions(
+        user_token,
+        from_date=args.get('from'),
+        to_date=args.get('to'),
+        limit=limit,
+        cursor=args.get('cursor')
+    )
+    return {'program': sessions, 'next_cursor': next_cursor}
+
+def resolve_conversation(user_token, conversation_id, history):
+    """
+    Returns the conversation of a chat request. Without a conversation id or history, the user's
+    latest conversation goes on; otherwise a new one is created, seeded with the client's history.
+    """
+    if conversation_id and conversation_store.belongs_to(conversation_id, user_token):
+        return conversation_id
+    history = [msg for msg in history if isinstance(msg, dict)]
+    if not conversation_id and not history:
+        latest = conversation_store.latest(user_token)
+        if latest:
+            return latest
+    return conversation_store.create(user_token, history=history)
+
+def record_chat_turn(user_token, conversation_id, message, reply, prefetch_suggestions=False):
+    """Stores a chat turn and, if the client shows suggestions, starts generating them in the background"""
+    conversation_store.append(conversation_id, 'user', message)
+    conversation_store.append(conversation_id, 'coach', reply)
+    if not prefetch_suggestions:
+        return
+    summary, history = conversation_store.get_context(conversation_id)
+    suggestion_prefetcher.prefetch(
+        (user_token, conversation_id),
+        get_program_version(user_token),
+        message,
+        context_program=get_sorted_sessions(user_token),
+        message_history=history,
+        history_summary=summary
+    )
+
+async def run_chat_turn(user_token, message, history=None, conversation_id=None, client_version=None, prefetch_suggestions=False):
+    """
+    Runs one chat turn: coach reply, program changes and conversation update.
+    client_version is the program version held by the client, so only the changes are returned.
+    Clients that don't send it get the full program, as before versions existed.
+    prefetch_suggestions is set by clients that show suggestions after the reply: they are then
+    generated in the background, an extra LLM call the other clients don't pay for.
+    """
+    if not isinstance(client_version, int):
+        client_version = None
+    
+    # Historique conservé côté serveur : le client n'envoie que l'identifiant de conversation
+    conversation_id = resolve_conversation(user_token, conversation_id, history or [])
+    summary, history = conversation_store.get_context(conversation_id)
+    
+    # Nouveau message : les suggestions préchargées du tour précédent sont obsolètes
+    suggestion_prefetcher.cancel((user_token, conversation_id))
+    
+    json_objects, explanation, response = await aprocess_llm_request(
+        message, 
+        context_program=get_sorted_sessions(user_token),
+        message_history=history,
+        history_summary=summary,
+        cache_scope=((user_token, conversation_id), get_program_version(user_token))
+    )
+    
+    if json_objects:
+        _, repairs = apply_changes(json_objects, user_token)
+        reply = explanation if explanation else response
+        if repairs:
+            # The reply describes the requested slots; the saved program may differ
+            reply += "\n\nAjustements appliqués au programme :\n" + "\n".join(f"- {repair}" for repair in repairs)
+        record_chat_turn(user_token, conversation_id, message, reply, prefetch_suggestions)
+        return {
+            'success': True, 
+            'response': reply,
+            'changes_made': True,
+            'repairs': repairs,
+            'conversation_id': conversation_id,
+            **program_changes_payload(user_token, client_version)
+        }
+    
+    record_chat_turn(user_token, conversation_id, message, response, prefetch_suggestions)
+    return {
+        'success': True,
+        'response': response,
+        'changes_made': False,
+        'conversation_id': conversation_id
+    }
+
+def batch_item_user(item, service_users):
+    """
+    user_token an item of a batch acts for: the owner of its personal API key, or, for a batch sent
+    with the service credential, its user if the service may act for them. None if not allowed.
+    """
+    api_key = item.get('api_key')
+    if api_key:
+        return auth_manager.resolve_api_key(api_key) if isinstance(api_key, str) else None
+    if item.get('user') in service_users:
+        return item['user']
+    return None
+
+async def run_chat_batch(items, service_users=frozenset()):
+    """
+    Runs the chat turns of a batch and returns their results in the same order.
+    Items of one user run in order (each turn sees the program left by the previous one),
+    users run concurrently, at most BATCH_MAX_CONCURRENCY at a time, on this request's event loop.
+    """
+    results = [None] * len(items)
+    items_by_user = {}
+    for position, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get('message'):
+            results[position] = {'success': False, 'error': 'Missing message'}
+            continue
+        user_token = batch_item_user(item, service_users)
+        if not user_token:
+            results[position] = {'success': False, 'error': 'Invalid API key or user'}
+            continue
+        items_by_user.setdefault(user_token, []).append((position, item))
+    
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+    
+    async def run_user_items(user_token, user_items):
+        async with semaphore:
+            for position, item in user_items:
+                try:
+                    results[position] = await run_chat_turn(
+                        user_token,
+                        item['message'],
+                        history=item.get('history') if isinstance(item.get('history'), list) else None,
+                        conversation_id=item.get('conversation_id'),
+                        client_version=item.get('version'),
+                        prefetch_suggestions=False
+                    )
+                except Exception as e:
+                    results[position] = {'success': False, 'error': str(e)}
+    
+    await asyncio.gather(*(run_user_items(user, user_items) for user, user_items in items_by_user.items()))
+    return results
+
+def suggestions_context(user_token, conversation_id, history):
+    """Summary and history used for the suggestions: the server-side conversation when there is one"""
+    if conversation_id and conversation_store.belongs_to(conversation_id, user_token):
+        return conversation_store.get_context(conversation_id)
+    return None, history
+
 # === Routes d'authentification ===
 
 @app.route('/')
@@ -128,12 +398,16 @@ def dashboard():
 
 @app.route('/init-program', methods=['GET'])
 @login_required
-def init_program():
+async def init_program():
     """Initialize or load the training program"""
-    jwt = session.get('user_token')
-    user_token = auth_manager.get_user_token_from_jwt(jwt)
-    result = initialize_or_load_program(user_token)
-    return jsonify(result)
+    user_token = current_user_token()
+    not_modified = program_not_modified(user_token)
+    if not_modified:
+        return not_modified
+    result = await ainitialize_or_load_program(user_token)
+    if not result['success']:
+        return jsonify(result)
+    return program_response(result, user_token, get_program_version(user_token))
 
 @app.route('/test', methods=['GET'])
 def test():
@@ -141,7 +415,7 @@ def test():
 
 @app.route('/chat', methods=['POST'])
 @login_required
-def chat():
+async def chat():
    try:
        if not request.is_json:
            return jsonify({'success': False, 'error': 'Format de requête invalide'}), 400
@@ -149,32 +423,19 @@ def chat():
        data = request.get_json()
        message = data.get('message')
        history = data.get('history', [])
-       jwt = session.get('user_token')
-       user_token = auth_manager.get_user_token_from_jwt(jwt)
+       user_token = current_user_token()
        
        if not message:
            return jsonify({'success': False, 'error': 'Message manquant'}), 400
-           
-       json_objects, explanation, response = process_llm_request(
-           message, 
-           context_program=get_sorted_sessions(user_token),
-           message_history=history
-       )
        
-       if json_objects:
-           apply_changes(json_objects, user_token)
-           return jsonify({
-               'success': True, 
-               'response': explanation if explanation else response,
-               'program': get_sorted_sessions(user_token=user_token),
-               'changes_made': True
-           })
-       
-       return jsonify({
-           'success': True,
-           'response': response,
-           'changes_made': False
-       })
+       return jsonify(await run_chat_turn(
+           user_token,
+           message,
+           history=history,
+           conversation_id=data.get('conversation_id'),
+           client_version=data.get('version'),
+           prefetch_suggestions=data.get('prefetch_suggestions') is True
+       ))
        
    except Exception as e:
        return jsonify({'success': False, 'error': str(e)}), 500
@@ -184,11 +445,41 @@ def chat():
 def get_program():
     """Récupération du programme"""
     try:
-        return jsonify({
+        user_token = current_user_token()
+        not_modified = program_not_modified(user_token)
+        if not_modified:
+            return not_modified
+        version = get_program_version(user_token)
+        return program_response({
             'success': True,
-            'profile': get_profile(),
-            'program': get_sorted_sessions()
-        })
+            'profile': get_profile(user_token),
+            **program_query_payload(user_token)
+        }, user_token, version)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/program/next', methods=['GET'])
+@login_required
+def get_program_next():
+    """Prochaine séance à venir"""
+    try:
+        user_token = current_user_token()
+        return jsonify({'success': True, 'session': get_next_session(user_token)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/program/changes', methods=['GET'])
+@login_required
+def get_program_changes():
+    """Modifications du programme depuis une version donnée"""
+    try:
+        user_token = current_user_token()
+        since_version = request.args.get('since', type=int)
+        if since_version is None:
+            return jsonify({'success': False, 'error': 'Paramètre since manquant'}), 400
+        return jsonify({'success': True, **program_changes_payload(user_token, since_version)})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -196,23 +487,12 @@ def get_program():
 def get_calendar(user_token):
     """Génération du calendrier ICS pour un utilisateur spécifique"""
     try:
-        jwt = session.get('user_token')
-        verified_user_token = auth_manager.get_user_token_from_jwt(jwt)
+        verified_user_token = current_user_token()
         
         if verified_user_token != user_token:
             return jsonify({'success': False, 'error': 'Unauthorized access'}), 403
             
-        calendar_manager = CalendarManager()
-        ics_content = calendar_manager.generate_ics(user_token)
-        
-        response = Response(ics_content)
-        response.headers.update({
-            'Content-Type': 'text/calendar; charset=utf-8',
-            'Content-Disposition': f'inline; filename=running_program_{user_token}.ics',
-            'Cache-Control': 'public, max-age=3600'
-        })
-        
-        return response
+        return calendar_response(user_token)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -221,11 +501,9 @@ def get_calendar(user_token):
 def get_calendar_url():
     """URLs du calendrier pour l'utilisateur connecté"""
     try:
-        jwt = session.get('user_token')
-        user_token = auth_manager.get_user_token_from_jwt(jwt)
+        user_token = current_user_token()
         
         base_url = request.url_root.rstrip('/')
-        calendar_manager = CalendarManager()
         feed_url = calendar_manager.generate_ics_feed_url(base_url, user_token)
         
         return jsonify({
@@ -241,7 +519,7 @@ def get_calendar_url():
 
 @app.route('/chat-suggestions', methods=['POST'])
 @login_required
-def get_chat_suggestions():
+async def get_chat_suggestions():
     """Suggestions pour le chat"""
     try:
         if not request.is_json:
@@ -250,15 +528,26 @@ def get_chat_suggestions():
         data = request.get_json()
         message = data.get('message')
         history = data.get('history', [])
+        user_token = current_user_token()
         
         if not message:
             return jsonify({'success': False, 'error': 'Message manquant'}), 400
-            
-        suggestions = process_suggestions_request(
-            message, 
-            context_program=get_sorted_sessions(),
-            message_history=history
+        
+        # Suggestions préchargées après la réponse du coach, si elles correspondent à ce tour
+        conversation_id = data.get('conversation_id')
+        suggestions = await suggestion_prefetcher.aget(
+            (user_token, conversation_id),
+            get_program_version(user_token),
+            message
         )
+        if suggestions is None:
+            summary, history = suggestions_context(user_token, conversation_id, history)
+            suggestions = await aprocess_suggestions_request(
+                message, 
+                context_program=get_sorted_sessions(user_token),
+                message_history=history,
+                history_summary=summary
+            )
         
         return jsonify({
             'success': True,
@@ -267,14 +556,22 @@ def get_chat_suggestions():
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/chat-suggestions/cancel', methods=['POST'])
+@login_required
+def cancel_chat_suggestions():
+    """Annule les suggestions préchargées (l'utilisateur a commencé à écrire)"""
+    data = request.get_json(silent=True) or {}
+    user_token = current_user_token()
+    suggestion_prefetcher.cancel((user_token, data.get('conversation_id')))
+    return jsonify({'success': True})
     
 @app.route('/user-token', methods=['GET'])
 @login_required
 def get_user_token():
     """Returns the user token for the authenticated user"""
     try:
-        jwt = session.get('user_token')
-        user_token = auth_manager.get_user_token_from_jwt(jwt)
+        user_token = current_user_token()
         return jsonify({
             'success': True,
             'user_token': user_token
@@ -295,70 +592,177 @@ def get_auth_token():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/llm-metrics', methods=['GET'])
+@login_required
+def get_llm_metrics():
+    """Métriques de la passerelle LLM (attente en file, latence des appels) et du cache sémantique"""
+    return jsonify({
+        'success': True,
+        'metrics': llm_gateway.metrics.snapshot(),
+        'semantic_cache': semantic_cache.stats()
+    })
+
 # === Routes de l'API ===
 
 # API key management
 @app.route('/api/generate-key', methods=['POST'])
+@login_required
 def api_generate_api_key():
-    return jsonify({'success': True, 'api_key': key_static})
+    """Crée une clé d'API personnelle ; elle n'est renvoyée qu'une fois, seul son hash étant conservé"""
+    data = request.get_json(silent=True) or {}
+    try:
+        api_key, key_id = auth_manager.create_api_key(current_user_token(), data.get('name'))
+        return jsonify({'success': True, 'api_key': api_key, 'id': key_id})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/keys', methods=['GET'])
+@login_required
+def api_list_api_keys():
+    """Liste les clés d'API de l'utilisateur (préfixe et nom, jamais la clé)"""
+    return jsonify({'success': True, 'keys': auth_manager.list_api_keys(current_user_token())})
+
+@app.route('/api/keys/<int:key_id>', methods=['DELETE'])
+@login_required
+def api_revoke_api_key(key_id):
+    """Révoque une clé d'API de l'utilisateur"""
+    if not auth_manager.revoke_api_key(current_user_token(), key_id):
+        return jsonify({'success': False, 'error': 'Unknown API key'}), 404
+    return jsonify({'success': True})
 
 # Program routes
 @app.route('/api/init-program', methods=['GET'])
-def api_init_program():
-    return jsonify(initialize_or_load_program(key_static))
+async def api_init_program():
+    user_token = api_user_token()
+    not_modified = program_not_modified(user_token)
+    if not_modified:
+        return not_modified
+    result = await ainitialize_or_load_program(user_token)
+    if not result['success']:
+        return jsonify(result)
+    return program_response(result, user_token, get_program_version(user_token))
 
 @app.route('/api/chat', methods=['GET'])
-def api_chat():
+async def api_chat():
+    user_token = api_user_token()
     # Récupérer les paramètres de l'URL
     message = request.args.get('message')
     history = request.args.getlist('history')  # Pour gérer plusieurs valeurs
     
     if not message:
         return jsonify({'success': False, 'error': 'Missing message'}), 400
-        
-    json_objects, explanation, response = process_llm_request(
-        message, 
-        context_program=get_sorted_sessions(key_static),
-        message_history=history
-    )
     
-    if json_objects:
-        apply_changes(json_objects, key_static)
-        return jsonify({
-            'success': True, 
-            'response': explanation if explanation else response,
-            'program': get_sorted_sessions(key_static),
-            'changes_made': True
-        })
+    try:
+        return jsonify(await run_chat_turn(
+            user_token,
+            message,
+            history=history,
+            conversation_id=request.args.get('conversation_id'),
+            client_version=request.args.get('version', type=int),
+            prefetch_suggestions=request.args.get('prefetch_suggestions') in ('1', 'true')
+        ))
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/chat/batch', methods=['POST'])
+@csrf.exempt
+async def api_chat_batch():
+    """
+    Traite en une requête les messages de plusieurs athlètes.
+    Corps : {"items": [{"api_key", "message", "history", "conversation_id", "version"}, ...]}
+    Chaque élément est authentifié par la clé d'API personnelle de son athlète. Avec la clé de
+    service (en-tête X-API-Key), un élément peut désigner par "user" un athlète de BATCH_SERVICE_USERS.
+    Les messages d'un même athlète sont traités dans l'ordre, les athlètes en parallèle.
+    """
+    service_users = frozenset()
+    if request.headers.get('X-API-Key'):
+        if not service_key_valid(BATCH_SERVICE_KEY):
+            return jsonify({'success': False, 'error': 'Invalid API key'}), 401
+        service_users = BATCH_SERVICE_USERS
+    if not request.is_json:
+        return jsonify({'success': False, 'error': 'Invalid request format'}), 400
     
-    return jsonify({
-        'success': True,
-        'response': response,
-        'changes_made': False
-    })
+    items = (request.get_json() or {}).get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'error': 'Missing items'}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({'success': False, 'error': f'At most {BATCH_MAX_ITEMS} items per batch'}), 400
+    
+    return jsonify({'success': True, 'results': await run_chat_batch(items, service_users)})
 
 
 @app.route('/api/program', methods=['GET'])
 def api_get_program():
-    return jsonify({
+    user_token = api_user_token()
+    not_modified = program_not_modified(user_token)
+    if not_modified:
+        return not_modified
+    version = get_program_version(user_token)
+    try:
+        program = program_query_payload(user_token)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return program_response({
         'success': True,
-        'profile': get_profile(key_static),
-        'program': get_sorted_sessions(key_static)
-    })
+        'profile': get_profile(user_token),
+        **program
+    }, user_token, version)
+
+@app.route('/api/program/next', methods=['GET'])
+def api_get_program_next():
+    user_token = api_user_token()
+    return jsonify({'success': True, 'session': get_next_session(user_token)})
+
+@app.route('/api/program/changes', methods=['GET'])
+def api_get_program_changes():
+    user_token = api_user_token()
+    since_version = request.args.get('since', type=int)
+    if since_version is None:
+        return jsonify({'success': False, 'error': 'Missing since parameter'}), 400
+    return jsonify({'success': True, **program_changes_payload(user_token, since_version)})
 
 @app.route('/api/calendar/<user_id>/calendar.ics')
 def api_get_calendar(user_id):
+    user_token = api_user_token()
     try:
-        calendar_manager = CalendarManager()
-        ics_content = calendar_manager.generate_ics(user_id, key_static)
+        return calendar_response(user_token)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/calendar/feed.ics')
+def api_calendar_feed():
+    """
+    Calendrier ICS regroupant les séances de plusieurs athlètes (?users=token1,token2), pour une
+    intégration disposant de la clé CALENDAR_FEED_KEY (en-tête X-API-Key, jamais dans l'URL) et
+    limité aux athlètes de CALENDAR_FEED_USERS. Le flux est écrit séance par séance.
+    """
+    if not service_key_valid(CALENDAR_FEED_KEY):
+        return jsonify({'success': False, 'error': 'Invalid API key'}), 401
+    
+    user_tokens = list(dict.fromkeys(token.strip() for token in request.args.get('users', '').split(',') if token.strip()))
+    if not user_tokens:
+        return jsonify({'success': False, 'error': 'Missing users'}), 400
+    if len(user_tokens) > CALENDAR_FEED_MAX_USERS:
+        return jsonify({'success': False, 'error': f'At most {CALENDAR_FEED_MAX_USERS} users per feed'}), 400
+    if not CALENDAR_FEED_USERS.issuperset(user_tokens):
+        return jsonify({'success': False, 'error': 'Access to these users is not allowed'}), 403
+    
+    try:
+        usernames = auth_manager.get_usernames(user_tokens)
+        unknown = [token for token in user_tokens if token not in usernames]
+        if unknown:
+            return jsonify({'success': False, 'error': f"Unknown users: {', '.join(unknown)}"}), 404
         
-        response = Response(ics_content)
+        etag, last_modified = calendar_manager.get_aggregate_etag(user_tokens)
+        response = Response(calendar_manager.stream_ics(user_tokens, usernames))
         response.headers.update({
             'Content-Type': 'text/calendar; charset=utf-8',
-            'Content-Disposition': f'inline; filename=running_program_{user_id}.ics',
+            'Content-Disposition': 'inline; filename=running_programs.ics',
             'Cache-Control': 'public, max-age=3600'
         })
-        return response
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        return response.make_conditional(request)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -366,7 +770,6 @@ def api_get_calendar(user_id):
 def api_get_calendar_url(user_id):
     try:
         base_url = request.url_root.rstrip('/')
-        calendar_manager = CalendarManager()
         feed_url = calendar_manager.generate_ics_feed_url(base_url, user_id)
         
         return jsonify({
@@ -381,7 +784,8 @@ def api_get_calendar_url(user_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/chat-suggestions', methods=['POST'])
-def api_get_chat_suggestions():
+async def api_get_chat_suggestions():
+    user_token = api_user_token()
     if not request.is_json:
         return jsonify({'success': False, 'error': 'Invalid request format'}), 400
 
@@ -391,12 +795,21 @@ def api_get_chat_suggestions():
     
     if not message:
         return jsonify({'success': False, 'error': 'Missing message'}), 400
-        
-    suggestions = process_suggestions_request(
-        message, 
-        context_program=get_sorted_sessions(key_static),
-        message_history=history
+    
+    conversation_id = data.get('conversation_id')
+    suggestions = await suggestion_prefetcher.aget(
+        (user_token, conversation_id),
+        get_program_version(user_token),
+        message
     )
+    if suggestions is None:
+        summary, history = suggestions_context(user_token, conversation_id, history)
+        suggestions = await aprocess_suggestions_request(
+            message, 
+            context_program=get_sorted_sessions(user_token),
+            message_history=history,
+            history_summary=summary
+        )
     
     return jsonify({
         'success': True,
@@ -1,34 +1,50 @@
 import sqlite3
 import hashlib
+import secrets
 import uuid
 import re
+import time
+from collections import OrderedDict
+from threading import Lock
 from datetime import datetime, timedelta
-from typing import Tuple, Optional
+from typing import Dict, List, Tuple, Optional
 import dotenv, os
 import jwt as pyjwt
+from sqlite_pool import SQLitePool
+from password_hashing import PasswordHasher, PasswordHasherBusy
 
 # Charger les variables d'environnement
 dotenv.load_dotenv()
 
 SECRET_KEY = os.getenv('SECRET_KEY')
+VERIFIED_TOKENS_CACHE_SIZE = int(os.getenv('VERIFIED_TOKENS_CACHE_SIZE', 1024))  # JWT vérifiés gardés en mémoire
+API_KEY_INDEX_REFRESH = int(os.getenv('API_KEY_INDEX_REFRESH', 30))  # Secondes avant de relire les clés modifiées par un autre processus
+API_KEY_PREFIX = "pk_"
+
+def hash_api_key(api_key: str) -> str:
+    """Hash d'une clé d'API : les clés étant aléatoires, un SHA-256 sans sel suffit et permet l'indexation"""
+    return hashlib.sha256(api_key.encode()).hexdigest()
 
 class AuthManager:
-    def __init__(self, db_file="users.db"):
+    def __init__(self, db_file="users.db", pool=None):
         self.db_file = db_file
+        # Connexions partagées entre les requêtes (WAL, requêtes préparées réutilisées)
+        self._pool = pool or SQLitePool(db_file)
         self._init_db()
         self.secret_key = SECRET_KEY
-
-    def _get_db(self):
-        """Crée une nouvelle connexion à la base de données"""
-        conn = sqlite3.connect(self.db_file)
-        conn.row_factory = sqlite3.Row
-        return conn
+        # Claims des JWT récemment vérifiés, par token
+        self._verified_tokens = OrderedDict()
+        self._verified_lock = Lock()
+        self.password_hasher = PasswordHasher()
+        self._unknown_user_hash = None
+        # Index en mémoire des clés d'API : hash -> user_token
+        self._api_keys = {}
+        self._api_keys_loaded_at = 0.0
+        self._load_api_keys()
 
     def _init_db(self) -> None:
         """Initialise la base de données avec la table users si elle n'existe pas."""
-        conn = self._get_db()
-        try:
-            conn.execute("PRAGMA foreign_keys = ON")
+        with self._pool.connection() as conn:
             conn.execute('''
                 CREATE TABLE IF NOT EXISTS users (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -39,15 +55,59 @@ class AuthManager:
                     CHECK (length(username) >= 3 AND length(username) <= 50)
                 )
             ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS api_keys (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_token TEXT NOT NULL,
+                    key_hash TEXT UNIQUE NOT NULL,
+                    key_prefix TEXT NOT NULL,
+                    name TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_token) REFERENCES users (user_token)
+                )
+            ''')
             conn.commit()
-        finally:
-            conn.close()
 
     def _hash_password(self, password: str) -> str:
-        """Hash le mot de passe avec SHA-256"""
-        salt = "votre_sel_unique_secret"  # À changer en production
-        salted = password + salt
-        return hashlib.sha256(salted.encode()).hexdigest()
+        """Hash le mot de passe avec scrypt, sur le pool de hachage"""
+        return self.password_hasher.hash(password)
+
+    def _authenticate(self, username: str, password: str) -> Optional[str]:
+        """
+        Vérifie les identifiants et renvoie le user_token, ou None.
+        Un hash à l'ancien format (SHA-256) ou d'un autre coût est remplacé après une connexion réussie.
+        """
+        with self._pool.connection() as conn:
+            row = conn.execute(
+                'SELECT user_token, password_hash FROM users WHERE username = ?', (username,)
+            ).fetchone()
+
+        if row is None:
+            # Même durée de réponse qu'avec un nom d'utilisateur existant
+            self.password_hasher.verify(password, self._dummy_hash())
+            return None
+        if not self.password_hasher.verify(password, row['password_hash']):
+            return None
+
+        if self.password_hasher.needs_rehash(row['password_hash']):
+            # Migration au mieux : le mot de passe est vérifié, un pool saturé ne doit pas bloquer la connexion
+            try:
+                new_hash = self._hash_password(password)
+            except PasswordHasherBusy:
+                print(f"Rehash of the password of {username} postponed: hashing pool busy")
+                return row['user_token']
+            with self._pool.connection() as conn:
+                conn.execute(
+                    'UPDATE users SET password_hash = ? WHERE username = ? AND password_hash = ?',
+                    (new_hash, username, row['password_hash'])
+                )
+                conn.commit()
+        return row['user_token']
+
+    def _dummy_hash(self) -> str:
+        if self._unknown_user_hash is None:
+            self._unknown_user_hash = self._hash_password(secrets.token_hex(16))
+        return self._unknown_user_hash
 
     def _generate_token(self) -> str:
         """Génère un token unique pour l'utilisateur"""
@@ -61,42 +121,39 @@ class AuthManager:
         if len(password) < 6:
             return False, "Le mot de passe doit faire au moins 6 caractères"
 
-        conn = self._get_db()
-        try:
+        with self._pool.connection() as conn:
             cursor = conn.execute('SELECT 1 FROM users WHERE username = ?', (username,))
             if cursor.fetchone():
                 return False, "Nom d'utilisateur déjà pris"
 
+        try:
+            # Calculé sans garder de connexion, le hash prenant plusieurs dizaines de ms
             password_hash = self._hash_password(password)
-            user_token = self._generate_token()
+        except PasswordHasherBusy:
+            return False, "Serveur occupé, veuillez réessayer"
 
-            conn.execute(
-                'INSERT INTO users (username, password_hash, user_token) VALUES (?, ?, ?)',
-                (username, password_hash, user_token)
-            )
-            conn.commit()
-            return True, "Inscription réussie ! Vous pouvez maintenant vous connecter."
+        with self._pool.connection() as conn:
+            try:
+                user_token = self._generate_token()
 
-        except sqlite3.Error as e:
-            return False, f"Erreur lors de l'inscription: {str(e)}"
-        finally:
-            conn.close()
+                conn.execute(
+                    'INSERT INTO users (username, password_hash, user_token) VALUES (?, ?, ?)',
+                    (username, password_hash, user_token)
+                )
+                conn.commit()
+                return True, "Inscription réussie ! Vous pouvez maintenant vous connecter."
+
+            except sqlite3.Error as e:
+                return False, f"Erreur lors de l'inscription: {str(e)}"
 
     def login(self, username: str, password: str) -> Tuple[bool, str]:
         """Authentifie un utilisateur"""
-        conn = self._get_db()
         try:
-            password_hash = self._hash_password(password)
-            cursor = conn.execute(
-                'SELECT user_token FROM users WHERE username = ? AND password_hash = ?',
-                (username, password_hash)
-            )
-            
-            result = cursor.fetchone()
-            if result:
+            user_token = self._authenticate(username, password)
+            if user_token:
                 # Création du token JWT
                 payload = {
-                    'user_token': result[0],
+                    'user_token': user_token,
                     'exp': datetime.utcnow() + timedelta(hours=24),
                     'iat': datetime.utcnow()
                 }
@@ -112,77 +169,150 @@ class AuthManager:
 
             return False, "Identifiants invalides"
 
+        except PasswordHasherBusy:
+            return False, "Serveur occupé, veuillez réessayer"
         except sqlite3.Error as e:
             return False, f"Erreur lors de la connexion: {str(e)}"
         except Exception as e:
             return False, f"Erreur inattendue: {str(e)}"
-        finally:
-            conn.close()
+
+    def verify_claims(self, token: str) -> Optional[Dict]:
+        """
+        Vérifie un JWT et renvoie ses claims, ou None s'il est invalide ou expiré.
+        Les tokens déjà vérifiés sont servis depuis un cache LRU jusqu'à leur expiration,
+        sans refaire la vérification HMAC ni le décodage.
+        """
+        if not token:
+            return None
+        now = time.time()
+        with self._verified_lock:
+            claims = self._verified_tokens.get(token)
+            if claims is not None:
+                if 'exp' not in claims or claims['exp'] > now:
+                    self._verified_tokens.move_to_end(token)
+                    return claims
+                del self._verified_tokens[token]
+                return None
+
+        try:
+            claims = pyjwt.decode(token, self.secret_key, algorithms=["HS256"])
+        except Exception:
+            return None
+
+        with self._verified_lock:
+            self._verified_tokens[token] = claims
+            while len(self._verified_tokens) > VERIFIED_TOKENS_CACHE_SIZE:
+                self._verified_tokens.popitem(last=False)
+        return claims
 
     def verify_token(self, token: str) -> bool:
         """Vérifie si un token JWT est valide"""
-        try:
-            pyjwt.decode(token, self.secret_key, algorithms=["HS256"])
-            return True
-        except:
-            return False
+        return self.verify_claims(token) is not None
 
     def change_password(self, username: str, old_password: str, new_password: str) -> Tuple[bool, str]:
         """Change le mot de passe d'un utilisateur"""
         if len(new_password) < 6:
             return False, "Le nouveau mot de passe doit faire au moins 6 caractères"
 
-        conn = self._get_db()
         try:
-            old_password_hash = self._hash_password(old_password)
-            cursor = conn.execute(
-                'SELECT 1 FROM users WHERE username = ? AND password_hash = ?',
-                (username, old_password_hash)
-            )
-            
-            if not cursor.fetchone():
+            if not self._authenticate(username, old_password):
                 return False, "Ancien mot de passe incorrect"
 
             new_password_hash = self._hash_password(new_password)
-            conn.execute(
-                'UPDATE users SET password_hash = ? WHERE username = ?',
-                (new_password_hash, username)
-            )
-            
-            conn.commit()
+            with self._pool.connection() as conn:
+                conn.execute(
+                    'UPDATE users SET password_hash = ? WHERE username = ?',
+                    (new_password_hash, username)
+                )
+                conn.commit()
             return True, "Mot de passe modifié avec succès"
 
+        except PasswordHasherBusy:
+            return False, "Serveur occupé, veuillez réessayer"
         except sqlite3.Error as e:
             return False, f"Erreur lors du changement de mot de passe: {str(e)}"
-        finally:
-            conn.close()
 
     def get_user_token(self, username: str, password: str) -> Tuple[bool, str]:
         """Récupère le token unique de l'utilisateur"""
-        conn = self._get_db()
         try:
-            password_hash = self._hash_password(password)
-            cursor = conn.execute(
-                'SELECT user_token FROM users WHERE username = ? AND password_hash = ?',
-                (username, password_hash)
-            )
-            
-            result = cursor.fetchone()
-            if result:
-                return True, result[0]
+            user_token = self._authenticate(username, password)
+            if user_token:
+                return True, user_token
 
             return False, "Identifiants invalides"
 
+        except PasswordHasherBusy:
+            return False, "Serveur occupé, veuillez réessayer"
         except sqlite3.Error as e:
             return False, f"Erreur lors de la récupération du token: {str(e)}"
-        finally:
-            conn.close()
+
+    def get_usernames(self, user_tokens: List[str]) -> Dict[str, str]:
+        """Noms d'utilisateur des user_tokens enregistrés, indexés par token"""
+        if not user_tokens:
+            return {}
+        with self._pool.connection() as conn:
+            placeholders = ','.join('?' * len(user_tokens))
+            cursor = conn.execute(
+                f'SELECT user_token, username FROM users WHERE user_token IN ({placeholders})',
+                list(user_tokens)
+            )
+            return {row['user_token']: row['username'] for row in cursor.fetchall()}
 
     def get_user_token_from_jwt(self, jwt_token: str) -> Optional[str]:
         """Extrait le user_token depuis un JWT token"""
-        try:
-            payload = pyjwt.decode(jwt_token, self.secret_key, algorithms=["HS256"])
-            return payload.get('user_token')
-        except:
+        claims = self.verify_claims(jwt_token)
+        return claims.get('user_token') if claims else None
+
+    # === Clés d'API ===
+
+    def _load_api_keys(self) -> None:
+        """Reconstruit l'index des clés d'API depuis la base"""
+        loaded_at = time.monotonic()
+        with self._pool.connection() as conn:
+            rows = conn.execute('SELECT key_hash, user_token FROM api_keys').fetchall()
+        # Le dictionnaire est remplacé d'un bloc, les lectures concurrentes n'ont pas besoin de verrou
+        self._api_keys = {row['key_hash']: row['user_token'] for row in rows}
+        self._api_keys_loaded_at = loaded_at
+
+    def resolve_api_key(self, api_key: str) -> Optional[str]:
+        """
+        Renvoie le user_token d'une clé d'API, ou None, sans accès à la base :
+        l'index est mis à jour à chaque création ou révocation, et relu toutes les
+        API_KEY_INDEX_REFRESH secondes pour les changements faits par d'autres processus.
+        """
+        if not api_key or not api_key.startswith(API_KEY_PREFIX):
             return None
+        if time.monotonic() - self._api_keys_loaded_at > API_KEY_INDEX_REFRESH:
+            self._load_api_keys()
+        return self._api_keys.get(hash_api_key(api_key))
 
+    def create_api_key(self, user_token: str, name: Optional[str] = None) -> Tuple[str, int]:
+        """Crée une clé d'API pour un utilisateur et renvoie (clé, id) ; seul son hash est enregistré"""
+        api_key = API_KEY_PREFIX + secrets.token_urlsafe(32)
+        with self._pool.connection() as conn:
+            cursor = conn.execute(
+                'INSERT INTO api_keys (user_token, key_hash, key_prefix, name) VALUES (?, ?, ?, ?)',
+                (user_token, hash_api_key(api_key), api_key[:len(API_KEY_PREFIX) + 6], name)
+            )
+            conn.commit()
+            key_id = cursor.lastrowid
+        self._load_api_keys()
+        return api_key, key_id
+
+    def list_api_keys(self, user_token: str) -> List[Dict]:
+        """Clés d'API d'un utilisateur, identifiées par leur préfixe"""
+        with self._pool.connection() as conn:
+            rows = conn.execute(
+                'SELECT id, key_prefix, name, created_at FROM api_keys WHERE user_token = ? ORDER BY id',
+                (user_token,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def revoke_api_key(self, user_token: str, key_id: int) -> bool:
+        """Supprime une clé d'API d'un utilisateur ; renvoie False si elle n'existe pas"""
+        with self._pool.connection() as conn:
+            cursor = conn.execute('DELETE FROM api_keys WHERE id = ? AND user_token = ?', (key_id, user_token))
+            conn.commit()
+            deleted = cursor.rowcount > 0
+        self._load_api_keys()
+        return deleted
@@ -0,0 +1,140 @@
+"""
+Concurrent register and login benchmark of AuthManager, on a copy of users.db.
+
+    python auth_benchmark.py --users 200 --concurrency 16 --scrypt-n 16384 --hash-workers 4
+
+Each scenario runs once as before pooling (a plain connection per call, on a copy left in
+the default rollback journal mode) and once with the pooled WAL connections. Logins are then measured for users still
+holding a legacy SHA-256 hash (rehashed with scrypt on their first login).
+The real users.db is never written.
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+class ConnectionPerCall:
+    """The connection handling of AuthManager before pooling: a new default connection per call"""
+    def __init__(self, db_file):
+        self.db_file = db_file
+
+    @contextmanager
+    def connection(self):
+        conn = sqlite3.connect(self.db_file)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def close(self):
+        pass
+
+
+def copy_database(source, destination, journal_mode):
+    """Copies a database (its WAL included) and sets the journal mode of the copy"""
+    if os.path.exists(source):
+        with sqlite3.connect(source) as src, sqlite3.connect(destination) as dst:
+            src.backup(dst)
+    conn = sqlite3.connect(destination)
+    try:
+        conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+    finally:
+        conn.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Concurrent AuthManager benchmark")
+    parser.add_argument("--users", type=int, default=200, help="Users registered, then logged in")
+    parser.add_argument("--logins", type=int, default=1000, help="Logins of the registered users")
+    parser.add_argument("--scrypt-n", type=int, help="scrypt cost (SCRYPT_N)")
+    parser.add_argument("--hash-workers", type=int, help="Password hashing workers (PASSWORD_HASH_WORKERS)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients")
+    parser.add_argument("--db", default="users.db", help="Database whose schema and users are copied")
+    return parser.parse_args()
+
+
+def run_concurrently(function, count, concurrency):
+    """Returns (per-call latencies, elapsed time) of count calls of function(index)"""
+    def call(index):
+        start = time.perf_counter()
+        function(index)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(call, range(count)))
+    return samples, time.perf_counter() - start
+
+
+def main():
+    args = parse_args()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-benchmark-secret-key")
+    # The hashing settings must be chosen before password_hashing is imported
+    if args.scrypt_n:
+        os.environ["SCRYPT_N"] = str(args.scrypt_n)
+    if args.hash_workers:
+        os.environ["PASSWORD_HASH_WORKERS"] = str(args.hash_workers)
+    import hashlib
+    import auth
+    import password_hashing
+    import sqlite_pool
+    from benchmark import report
+
+    workdir = tempfile.mkdtemp(prefix="pace_auth_bench_")
+    print(f"Work folder: {workdir}")
+    print(f"scrypt N={password_hashing.SCRYPT_N}, {password_hashing.PASSWORD_HASH_WORKERS} hashing workers\n")
+    for pool_size in (0, sqlite_pool.SQLITE_POOL_SIZE):
+        db_file = os.path.join(workdir, f"users_{pool_size}.db")
+        if pool_size:
+            copy_database(args.db, db_file, "WAL")
+            manager = auth.AuthManager(db_file, pool=sqlite_pool.SQLitePool(db_file, size=pool_size))
+        else:
+            copy_database(args.db, db_file, "DELETE")
+            manager = auth.AuthManager(db_file, pool=ConnectionPerCall(db_file))
+        label = f"pool of {pool_size}" if pool_size else "no pool, rollback journal"
+
+        def register(index):
+            success, message = manager.register(f"bench_{pool_size}_{index}", "benchmark-password")
+            assert success, message
+
+        def login(index):
+            success, message = manager.login(f"bench_{pool_size}_{index % args.users}", "benchmark-password")
+            assert success, message
+
+        samples, elapsed = run_concurrently(register, args.users, args.concurrency)
+        report(f"register ({label})", samples, elapsed)
+        samples, elapsed = run_concurrently(login, args.logins, args.concurrency)
+        report(f"login ({label})", samples, elapsed)
+
+        if pool_size:
+            legacy_hash = hashlib.sha256(("legacy-password" + password_hashing.LEGACY_SALT).encode()).hexdigest()
+            with manager._pool.connection() as conn:
+                conn.executemany(
+                    'INSERT INTO users (username, password_hash, user_token) VALUES (?, ?, ?)',
+                    [(f"legacy_{index}", legacy_hash, f"legacy-token-{index}") for index in range(args.users)]
+                )
+                conn.commit()
+
+            def legacy_login(index):
+                success, message = manager.login(f"legacy_{index}", "legacy-password")
+                assert success, message
+
+            samples, elapsed = run_concurrently(legacy_login, args.users, args.concurrency)
+            report(f"first login, legacy hash ({label})", samples, elapsed)
+            samples, elapsed = run_concurrently(legacy_login, args.users, args.concurrency)
+            report(f"login after rehash ({label})", samples, elapsed)
+        manager._pool.close()
+
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Offline throughput benchmarks of the coach backend, using the local stand-in LLM.
+
+    python benchmark.py --requests 200 --concurrency 16 --profile gpt-4o-mini
+
+Programs are written to a temporary folder, the real profiles are never touched.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmarks with the fake LLM backend")
+    parser.add_argument("--requests", type=int, default=200, help="Chat requests sent to the Flask app")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent chat clients")
+    parser.add_argument("--profile", default="instant", help="Fake LLM latency profile (instant, fast, gpt-4o-mini, slow)")
+    parser.add_argument("--iterations", type=int, default=200, help="Iterations of the parser and session manager benchmarks")
+    return parser.parse_args()
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return f"p50 {pick(0.5):.1f} ms, p95 {pick(0.95):.1f} ms, p99 {pick(0.99):.1f} ms"
+
+
+def timed(function, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def report(name, samples, elapsed=None):
+    elapsed = elapsed if elapsed is not None else sum(samples)
+    print(f"{name:<40} {len(samples) / elapsed:>10.1f} ops/s   {percentiles(samples)}")
+
+
+def main():
+    args = parse_args()
+    # The backend must be chosen before llm_handler is imported
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_PROFILE"] = args.profile
+    os.environ.setdefault("LLM_RATE_PER_SECOND", "1000")
+    os.environ.setdefault("LLM_BURST", "1000")
+    os.environ.setdefault("LLM_MAX_CONCURRENCY", str(max(args.concurrency, 8)))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    workdir = tempfile.mkdtemp(prefix="pace_bench_")
+    os.environ["CONVERSATIONS_DB"] = os.path.join(workdir, "conversations.db")
+
+    import llm_handler
+    import program_cache
+    import session_manager
+    from datetime import date, timedelta
+    from profile_runner import profile_data
+
+    session_manager.BASE_FOLDER = os.path.join(workdir, "profiles")
+    program_cache.TEMPLATE_FOLDER = os.path.join(workdir, "program_templates")
+    os.makedirs(session_manager.BASE_FOLDER)
+    profile = dict(profile_data, goal_date=(date.today() + timedelta(weeks=12)).isoformat())
+
+    print(f"Fake LLM profile: {args.profile}, work folder: {workdir}\n")
+
+    # === Program generation and parsers ===
+    program, _, compact_response = llm_handler.generate_training_program(profile, output_format="compact")
+    _, _, json_response = llm_handler.generate_training_program(profile, output_format="json")
+    print()
+    report("parse_compact_sessions", timed(lambda: llm_handler.parse_compact_sessions(compact_response), args.iterations))
+    report("extract_training_sessions (JSON)", timed(lambda: llm_handler.extract_training_sessions(json_response), args.iterations))
+
+    # === Session manager ===
+    user_token = "benchmark"
+    session_manager.create_program(profile, program, user_token)
+    first = program[0]
+    edit = [
+        {"type_action": "remove", "date": first["date"], "type_de_seance": "", "distance": 0, "description": ""},
+        {**first, "type_action": "create"}
+    ]
+    report("apply_changes", timed(lambda: session_manager.apply_changes(edit, user_token), args.iterations))
+    report("get_sorted_sessions", timed(lambda: session_manager.get_sorted_sessions(user_token), args.iterations))
+    report("query_sessions (1 week)", timed(lambda: session_manager.query_sessions(user_token, limit=4), args.iterations))
+
+    # === Flask app, end to end ===
+    import app as app_module
+    session_manager.create_program(profile, program, app_module.key_static)
+    messages = ["je suis fatigué, allège ma prochaine séance", "quelle allure pour ma sortie longue ?"]
+
+    def chat(index):
+        client = app_module.app.test_client()
+        start = time.perf_counter()
+        response = client.get("/api/chat", query_string={"message": messages[index % len(messages)]})
+        assert response.status_code == 200, response.data
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        samples = list(pool.map(chat, range(args.requests)))
+    print()
+    report(f"/api/chat ({args.concurrency} clients)", samples, time.perf_counter() - start)
+    
+    # Same messages in batches of 20 items, for 5 users the service credential may act for
+    users = [f"benchmark-{index}" for index in range(5)]
+    for user in users:
+        session_manager.create_program(profile, program, user)
+    service_key = "benchmark-service-key"
+    app_module.BATCH_SERVICE_KEY = service_key
+    app_module.BATCH_SERVICE_USERS = frozenset(users)
+    
+    def chat_batch(index):
+        client = app_module.app.test_client()
+        items = [{"user": users[i % len(users)], "message": messages[i % len(messages)]} for i in range(20)]
+        start = time.perf_counter()
+        response = client.post("/api/chat/batch", json={"items": items}, headers={"X-API-Key": service_key})
+        assert response.status_code == 200, response.data
+        return time.perf_counter() - start
+    
+    batches = max(1, args.requests // 20)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency // 4)) as pool:
+        samples = list(pool.map(chat_batch, range(batches)))
+    elapsed = time.perf_counter() - start
+    report("/api/chat/batch (20 items)", samples, elapsed)
+    print(f"{'':<40} {batches * 20 / elapsed:>10.1f} messages/s")
+    print(f"\nLLM gateway: {llm_handler.llm_gateway.metrics.snapshot()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,58 @@
-from icalendar import Calendar, Event, vText
+from icalendar import Calendar
 from datetime import datetime, timedelta
-from uuid import uuid4
+from uuid import uuid5, UUID
+from threading import Lock
 import pytz
-from session_manager import get_sorted_sessions
+from session_manager import get_sorted_sessions, get_program_version, get_program_etag, get_profile_path
+import hashlib
 import os
 
+# Namespace of the event UIDs, which are derived from the user and the session slot
+EVENT_UID_NAMESPACE = UUID('6f1c2a4e-8d3b-5e7f-9a0c-1b2d3e4f5a6b')
+ICS_LINE_OCTETS = 75  # RFC 5545: content lines longer than this are folded
+ICS_LOCAL_FORMAT = "%Y%m%dT%H%M%S"
+ICS_UTC_FORMAT = "%Y%m%dT%H%M%SZ"
+
+
+def escape_text(value):
+    """Escapes a TEXT property value (RFC 5545 3.3.11)"""
+    return (str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+def fold_line(line):
+    """
+    Encodes a content line with its CRLF, folded into chunks of at most 75 octets
+    (continuation lines start with a space) without splitting a UTF-8 character
+    """
+    encoded = line.encode('utf-8')
+    if len(encoded) <= ICS_LINE_OCTETS:
+        return encoded + b'\r\n'
+    chunks = []
+    start, limit = 0, ICS_LINE_OCTETS
+    while len(encoded) - start > limit:
+        end = start + limit
+        # Continuation bytes of a UTF-8 character are 0b10xxxxxx
+        while encoded[end] & 0xC0 == 0x80:
+            end -= 1
+        chunks.append(encoded[start:end])
+        start, limit = end, ICS_LINE_OCTETS - 1
+    chunks.append(encoded[start:])
+    return b'\r\n '.join(chunks) + b'\r\n'
+
 
 class CalendarManager:
     def __init__(self):
         self.timezone = pytz.timezone('Europe/Paris')
         self.calendar_dir = 'calendar'
         os.makedirs(self.calendar_dir, exist_ok=True)
+        # Generated feeds by user: (program version, ics content, etag, last modified)
+        self._feeds = {}
+        self._feeds_lock = Lock()
+        # Serialized VEVENT blocks by user: {uid: (session content, block)}
+        self._event_blocks = {}
+        header, footer = self._create_calendar().to_ical().split(b'END:VCALENDAR')
+        self._calendar_header = header
+        self._calendar_footer = b'END:VCALENDAR' + footer
 
     def get_calendar_path(self, user_token):
         """Get the calendar file path for a specific user"""
@@ -27,12 +69,18 @@ class CalendarManager:
         cal.add('x-wr-timezone', 'Europe/Paris')
         return cal
 
-    def _create_event(self, session):
-        """Create an iCalendar event from a training session"""
-        event = Event()
-        
-        start_time = datetime.strptime(session['date'], "%Y-%m-%d %H:%M")
-        start_time = self.timezone.localize(start_time)
+    @staticmethod
+    def event_uid(user_token, session):
+        """
+        Stable UID of a session's event: the same user and slot always give the same UID,
+        so calendar clients update their copy instead of seeing a new event
+        """
+        slot = f"{user_token}/{session['date']}"
+        return f"{uuid5(EVENT_UID_NAMESPACE, slot)}@pace-up"
+
+    def _event_times(self, session):
+        """Start and end of a session, its duration estimated from the distance and session type"""
+        start_time = self.timezone.localize(datetime.strptime(session['date'], "%Y-%m-%d %H:%M"))
         
         pace_multiplier = 6
         if 'tempo' in session['type_de_seance'].lower():
@@ -41,41 +89,118 @@ class CalendarManager:
             pace_multiplier = 5.5
             
         duration_minutes = int(session['distance'] * pace_multiplier)
-        end_time = start_time + timedelta(minutes=duration_minutes)
-        
-        event.add('summary', f"{session['type_de_seance']} - {session['distance']}km")
-        event.add('dtstart', start_time)
-        event.add('dtend', end_time)
-        event.add('dtstamp', datetime.now(self.timezone))
-        event.add('uid', str(uuid4()))
-        
+        return start_time, start_time + timedelta(minutes=duration_minutes)
+
+    def _event_lines(self, session, uid, dtstamp, summary_prefix=''):
+        """
+        Yields the folded lines of a session's VEVENT, written directly instead of through
+        an icalendar Event, so a feed never holds more than the event being written
+        """
+        start_time, end_time = self._event_times(session)
         description = (
             f"Type: {session['type_de_seance']}\n"
             f"Distance: {session['distance']}km\n"
             f"Description: {session['description']}"
         )
-        event.add('description', description)
-        event.add('location', vText('Extérieur'))
-        event.add('categories', 'Running,Training')
-        event.add('status', 'CONFIRMED')
-        
-        return event
+        yield b'BEGIN:VEVENT\r\n'
+        yield fold_line(f"SUMMARY:{escape_text(summary_prefix + session['type_de_seance'])} - {session['distance']}km")
+        yield fold_line(f"DTSTART;TZID={self.timezone.zone}:{start_time.strftime(ICS_LOCAL_FORMAT)}")
+        yield fold_line(f"DTEND;TZID={self.timezone.zone}:{end_time.strftime(ICS_LOCAL_FORMAT)}")
+        yield fold_line(f"DTSTAMP:{dtstamp.astimezone(pytz.utc).strftime(ICS_UTC_FORMAT)}")
+        yield fold_line(f"UID:{uid}")
+        yield b'CATEGORIES:Running\\,Training\r\n'
+        yield fold_line(f"DESCRIPTION:{escape_text(description)}")
+        yield fold_line(f"LOCATION:{escape_text('Extérieur')}")
+        yield b'STATUS:CONFIRMED\r\n'
+        yield b'END:VEVENT\r\n'
+
+    def _program_modified(self, user_token):
+        """Last modification time of the user's program (its profile file)"""
+        profile_path = get_profile_path(user_token)
+        if os.path.exists(profile_path):
+            return datetime.fromtimestamp(os.path.getmtime(profile_path), pytz.utc)
+        return datetime.now(pytz.utc)
 
     def generate_ics(self, user_token):
-        """Generate an ICS file content for a specific user"""
-        cal = self._create_calendar()
-        sessions = get_sorted_sessions(user_token)
+        """
+        Generate an ICS file content for a specific user.
+        Each session's VEVENT block is cached and only serialized again when the session changes;
+        its DTSTAMP is the program modification time at which that version of the session appeared.
+        """
+        modified = self._program_modified(user_token)
+        with self._feeds_lock:
+            cached_blocks = self._event_blocks.get(user_token, {})
+        
+        blocks = {}
+        for session in get_sorted_sessions(user_token):
+            uid = self.event_uid(user_token, session)
+            content = (session['date'], session['type_de_seance'], session['distance'], session['description'])
+            cached = cached_blocks.get(uid)
+            if cached and cached[0] == content:
+                blocks[uid] = cached
+            else:
+                blocks[uid] = (content, b''.join(self._event_lines(session, uid, modified)))
+        
+        # Blocks of removed sessions are dropped with the previous dict
+        with self._feeds_lock:
+            self._event_blocks[user_token] = blocks
+        ics_content = self._calendar_header + b''.join(block for _, block in blocks.values()) + self._calendar_footer
         
-        for session in sessions:
-            event = self._create_event(session)
-            cal.add_component(event)
-            
         # Save to user-specific file
         calendar_path = self.get_calendar_path(user_token)
         with open(calendar_path, 'wb') as f:
-            f.write(cal.to_ical())
+            f.write(ics_content)
             
-        return cal.to_ical()
+        return ics_content
+
+    def get_feed(self, user_token):
+        """
+        Returns (ics content, etag, last modified) of the user's calendar.
+        The feed is generated once per program version: any program change bumps the version,
+        which invalidates the cached feed.
+        """
+        version = get_program_version(user_token)
+        with self._feeds_lock:
+            feed = self._feeds.get(user_token)
+        if feed and feed[0] == version:
+            return feed[1:]
+        
+        ics_content = self.generate_ics(user_token)
+        feed = (version, ics_content, f"ics-{get_program_etag(user_token, version)}", self._program_modified(user_token))
+        with self._feeds_lock:
+            self._feeds[user_token] = feed
+        return feed[1:]
+
+    def stream_ics(self, user_tokens, labels=None):
+        """
+        Yields an ICS feed aggregating the sessions of several users, event by event.
+        Only one user's sessions are loaded at a time and nothing is cached, so memory stays
+        constant whatever the number of users or the length of their programs.
+        labels optionally maps a user to the name prefixed to the summary of their sessions.
+        """
+        labels = labels or {}
+        yield self._calendar_header
+        for user_token in user_tokens:
+            modified = self._program_modified(user_token)
+            label = labels.get(user_token)
+            summary_prefix = f"{label}: " if label else ''
+            for session in get_sorted_sessions(user_token):
+                yield b''.join(self._event_lines(session, self.event_uid(user_token, session), modified, summary_prefix))
+        yield self._calendar_footer
+
+    def get_aggregate_etag(self, user_tokens):
+        """
+        Returns (etag, last modified) of a feed aggregating several users,
+        derived from their program versions so that it can be checked without writing the feed
+        """
+        digest = hashlib.sha1()
+        last_modified = None
+        for user_token in user_tokens:
+            digest.update(f"{user_token}:{get_program_etag(user_token)};".encode())
+            modified = self._program_modified(user_token)
+            if last_modified is None or modified > last_modified:
+                last_modified = modified
+        return f"ics-multi-{digest.hexdigest()[:16]}", last_modified
 
     def get_calendar_content(self, user_token):
         """Get the calendar content for a specific user"""
@@ -0,0 +1,248 @@
+import re
+import unicodedata
+from datetime import datetime, timedelta
+
+from plan_repair import EARLIEST_HOUR, LATEST_HOUR
+
+# Constants
+MIN_CONFIDENCE = 0.8  # Below this score the message is left to the LLM
+HEDGED_CONFIDENCE = 0.5  # Questions and conditional phrasing ("can I skip...?", "et si j'annule...")
+MAX_COMMAND_WORDS = 14  # Longer messages are rarely simple commands
+
+WEEKDAYS = {
+    "lundi": 0, "mardi": 1, "mercredi": 2, "jeudi": 3, "vendredi": 4, "samedi": 5, "dimanche": 6,
+    "monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3, "friday": 4, "saturday": 5, "sunday": 6
+}
+WEEKDAY_NAMES_FR = ["lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche"]
+MONTH_NAMES_FR = ["janvier", "février", "mars", "avril", "mai", "juin", "juillet", "août",
+                  "septembre", "octobre", "novembre", "décembre"]
+
+# Edits are only recognized as imperatives opening the message ("supprime...", "move..."), after an optional greeting
+COMMAND_START = r"^(?:(?:please|stp|svp|coach|hey|bon|alors)\W+)*"
+MOVE_WORDS = r"(deplacez?|decalez?|bougez?|repoussez?|avancez?|mets|mettez|passez?|move|reschedule|shift|push)\b"
+DELETE_WORDS = r"(supprimez?|annulez?|enlevez?|retirez?|effacez?|delete|remove|cancel|skip|drop)\b"
+SHOW_WORDS = r"\b(montre[rz]?|affiche[rz]?|voir|liste[rz]?|show|list|display)\b"
+# "quelles séances..." lists sessions only about a week ("quelle allure pour demain" is for the coach)
+SHOW_QUESTION_WORDS = r"\b(quelles?|quels?|what)\b"
+QUESTION_WORDS = r"\b(pourquoi|comment|faut-il|dois-je|devrais|est-ce que je|why|how|should)\b"
+HEDGE_WORDS = r"\b(can|could|would|may|might|if|unless|except|ok|okay|si|s'ils?|sauf|est-ce|peux|puis|pourrais|pourrait|pourriez|faudrait|vaudrait|serait|possible)\b"
+# Other edits ("remplace-la par...", "raccourcis-la"): a command combining several edits is left to the LLM
+OTHER_EDIT_WORDS = r"(remplacez?|raccourcis(?:sez)?|rallongez?|allongez?|allegez?|ajoutez?|changez?|modifiez?|replace|shorten|lengthen|extend|add|change)\b"
+COMPOUND_WORDS = r"\b(et|puis|ensuite|and|then)\b"
+# Shifts by a duration ("de 2h", "by 2 hours", "1h plus tard"), which TIME_PATTERN would read as a time of day
+DURATION = r"(?:\d+|une?|an?|one|deux|two|trois|three)\s*(?:h(?:\d{2})?|heures?|hours?|min|minutes?)\b"
+RELATIVE_SHIFT_PATTERN = (r"\b(?:de|d'|by)\s*" + DURATION +
+                          r"|\b" + DURATION + r"\s+(?:plus tard|plus tot|later|earlier|avant|apres)\b|\+\s*\d")
+ENGLISH_WORDS = r"\b(the|my|session|run|to|at|move|delete|remove|cancel|show|next|week|tomorrow|today)\b"
+
+# Day references, in the order they are searched
+DAY_PATTERNS = [
+    (r"\b(apres[- ]demain|day after tomorrow)\b", "day_after_tomorrow"),
+    (r"\b(aujourd'?hui|today|tonight|ce soir|ce matin)\b", "today"),
+    (r"\b(demain|tomorrow)\b", "tomorrow"),
+    (r"\b(prochaine seance|next (?:session|run|workout))\b", "next_session"),
+    (r"\b(\d{1,2})/(\d{1,2})\b", "date"),
+    (r"\b(lundi|mardi|mercredi|jeudi|vendredi|samedi|dimanche|monday|tuesday|wednesday|thursday|friday|saturday|sunday)s?\b", "weekday")
+]
+WEEK_PATTERNS = [
+    (r"\b(semaine prochaine|prochaine semaine|next week)\b", 1),
+    (r"\b(cette semaine|this week)\b", 0)
+]
+TIME_PATTERN = r"\b(\d{1,2})\s*(?:h|:)\s*(\d{2})?\b|\b(\d{1,2})\s*(am|pm)\b"
+
+
+def normalize(message):
+    """Lowercase, accent-free, whitespace-collapsed message"""
+    text = unicodedata.normalize("NFKD", message.replace("’", "'")).encode("ascii", "ignore").decode("ascii")
+    return " ".join(text.lower().split())
+
+def _format_date_fr(date):
+    return f"{WEEKDAY_NAMES_FR[date.weekday()]} {date.day} {MONTH_NAMES_FR[date.month - 1]} à {date:%H:%M}"
+
+def _format_date_en(date):
+    return date.strftime("%A %d %B at %H:%M")
+
+def _find_day_references(text, now, sessions):
+    """Returns the day references of the message, in order, as (position, date or session date)"""
+    references = []
+    for pattern, kind in DAY_PATTERNS:
+        for match in re.finditer(pattern, text):
+            day = None
+            if kind == "today":
+                day = now.date()
+            elif kind == "tomorrow":
+                day = now.date() + timedelta(days=1)
+            elif kind == "day_after_tomorrow":
+                day = now.date() + timedelta(days=2)
+            elif kind == "next_session":
+                upcoming = [s for s in sessions if _session_date(s) >= now]
+                if upcoming:
+                    day = _session_date(upcoming[0]).date()
+            elif kind == "date":
+                try:
+                    day = datetime(now.year, int(match.group(2)), int(match.group(1))).date()
+                    if day < now.date():
+                        day = day.replace(year=now.year + 1)
+                except ValueError:
+                    continue
+            elif kind == "weekday":
+                offset = (WEEKDAYS[match.group(1)] - now.weekday()) % 7
+                day = now.date() + timedelta(days=offset)
+            if day is not None and not any(start <= match.start() < end for start, end, _ in references):
+                references.append((match.start(), match.end(), day))
+    return [(start, day) for start, _, day in sorted(references)]
+
+def _find_time(text):
+    """Returns the (hour, minute) of the first time of the message, or None"""
+    match = re.search(TIME_PATTERN, text)
+    if not match:
+        return None
+    if match.group(3):
+        hour = int(match.group(3)) % 12 + (12 if match.group(4) == "pm" else 0)
+        minute = 0
+    else:
+        hour, minute = int(match.group(1)), int(match.group(2) or 0)
+    if hour > 23 or minute > 59:
+        return None
+    return hour, minute
+
+def _session_date(session):
+    return datetime.strptime(session["date"], "%Y-%m-%d %H:%M")
+
+def _sessions_on(sessions, day):
+    return [session for session in sessions if _session_date(session).date() == day]
+
+def _result(actions, response, confidence):
+    return {"actions": actions, "response": response, "confidence": confidence}
+
+def parse_command(message, sessions, now=None):
+    """
+    Recognizes simple program commands in French or English without calling the LLM:
+    moving a session ("déplace la séance de demain à 18h", "move Thursday's run to Friday"),
+    deleting one ("supprime la séance de jeudi") and listing sessions ("show next week").
+
+    Parameters:
+    - message (str): The user's message
+    - sessions (list): The current sessions, sorted by date
+
+    Returns:
+    - dict: {'actions': list of type_action objects for apply_changes, 'response': str, 'confidence': float},
+      or None when the message is not a recognized command.
+      Questions and conditional phrasing get HEDGED_CONFIDENCE, so they are left to the LLM; messages combining
+      several edits or shifting a session by a duration are not recognized.
+    """
+    now = now or datetime.now()
+    text = normalize(message)
+    if re.search(RELATIVE_SHIFT_PATTERN, text):
+        return None
+    # Advice questions ("should I move...?", "pourquoi...") need the coach, not a command
+    if len(text.split()) > MAX_COMMAND_WORDS or re.search(QUESTION_WORDS, text):
+        return None
+    english = len(re.findall(ENGLISH_WORDS, text)) >= 2
+    # One edit at a time ("supprime ... et remplace-la par ..." would lose the replacement)
+    edits = len(re.findall(r"\b(?:" + MOVE_WORDS + "|" + DELETE_WORDS + "|" + OTHER_EDIT_WORDS + ")", text))
+    if edits > 1 or (edits and re.search(COMPOUND_WORDS, text)):
+        return None
+
+    if re.match(COMMAND_START + MOVE_WORDS, text):
+        result = _parse_move(text, sessions, now, english)
+    elif re.match(COMMAND_START + DELETE_WORDS, text):
+        result = _parse_delete(text, sessions, now, english)
+    elif re.search(SHOW_WORDS, text) or (
+        re.search(SHOW_QUESTION_WORDS, text) and any(re.search(pattern, text) for pattern, _ in WEEK_PATTERNS)
+    ):
+        result = _parse_show(text, sessions, now, english)
+    else:
+        return None
+
+    if result and (text.endswith("?") or re.search(HEDGE_WORDS, text)):
+        result["confidence"] = min(result["confidence"], HEDGED_CONFIDENCE)
+    return result
+
+def _single_session(sessions, now, references):
+    """The session designated by the first day reference, with the confidence it's the right one"""
+    if not references:
+        return None, 0.0
+    candidates = [s for s in _sessions_on(sessions, references[0][1]) if _session_date(s) >= now - timedelta(hours=2)]
+    if len(candidates) != 1:
+        return None, 0.0
+    return candidates[0], 1.0
+
+def _parse_move(text, sessions, now, english):
+    # Imported here: session_manager imports llm_handler, which imports this module
+    from session_manager import verify_json_overlap
+
+    references = _find_day_references(text, now, sessions)
+    session, confidence = _single_session(sessions, now, references)
+    if session is None:
+        return None
+
+    source_date = _session_date(session)
+    target_day = references[1][1] if len(references) > 1 else source_date.date()
+    # The new time follows the last day reference: in "mardi 18h à jeudi", 18h is the old slot
+    target_time = _find_time(text[references[-1][0]:])
+    if len(references) < 2 and target_time is None:
+        return None
+    hour, minute = target_time or (source_date.hour, source_date.minute)
+    # Same daytime range as plan_repair: "à 2h" is more likely a misread than a night run
+    if not (EARLIEST_HOUR <= hour and (hour, minute) <= (LATEST_HOUR, 0)):
+        return None
+    if minute % 5:
+        minute -= minute % 5
+        confidence -= 0.1
+    target_date = datetime(target_day.year, target_day.month, target_day.day, hour, minute)
+    if target_date == source_date or target_date < now:
+        return None
+
+    others = [s for s in sessions if s is not session]
+    moved = {**session, "date": target_date.strftime("%Y-%m-%d %H:%M")}
+    if verify_json_overlap(others + [moved]):
+        return None
+
+    actions = [
+        {"type_action": "remove", "date": session["date"], "type_de_seance": "", "distance": 0, "description": ""},
+        {"type_action": "create", **moved}
+    ]
+    if english:
+        response = f"I moved your {session['type_de_seance']} session from {_format_date_en(source_date)} to {_format_date_en(target_date)}."
+    else:
+        response = f"J'ai déplacé votre séance {session['type_de_seance']} du {_format_date_fr(source_date)} au {_format_date_fr(target_date)}."
+    return _result(actions, response, confidence)
+
+def _parse_delete(text, sessions, now, english):
+    references = _find_day_references(text, now, sessions)
+    if len(references) != 1:
+        return None
+    session, confidence = _single_session(sessions, now, references)
+    if session is None:
+        return None
+
+    actions = [{"type_action": "remove", "date": session["date"], "type_de_seance": "", "distance": 0, "description": ""}]
+    if english:
+        response = f"I deleted your {session['type_de_seance']} session of {_format_date_en(_session_date(session))}."
+    else:
+        response = f"J'ai supprimé votre séance {session['type_de_seance']} du {_format_date_fr(_session_date(session))}."
+    return _result(actions, response, confidence)
+
+def _parse_show(text, sessions, now, english):
+    start = end = None
+    for pattern, week_offset in WEEK_PATTERNS:
+        if re.search(pattern, text):
+            monday = now.date() - timedelta(days=now.weekday()) + timedelta(weeks=week_offset)
+            start, end = monday, monday + timedelta(days=6)
+            break
+    if start is None:
+        references = _find_day_references(text, now, sessions)
+        if len(references) != 1:
+            return None
+        start = end = references[0][1]
+
+    selected = [s for s in sessions if start <= _session_date(s).date() <= end]
+    if not selected:
+        response = "No session planned for that period." if english else "Aucune séance prévue sur cette période."
+    else:
+        format_date = _format_date_en if english else _format_date_fr
+        response = "\n".join(
+            f"- {format_date(_session_date(s))} : {s['type_de_seance']}, {s['distance']} km" for s in selected
+        )
+    return _result([], response, 1.0)
@@ -0,0 +1,210 @@
+import os
+import sqlite3
+import uuid
+import re
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+# Constants
+CONVERSATIONS_DB = os.environ.get("CONVERSATIONS_DB", "conversations.db")
+RECENT_MESSAGES = 10  # Messages kept verbatim in the prompt
+COMPACT_BATCH = 6  # Older messages are rolled into the summary by batches of this size
+SUMMARY_MAX_CHARS = 1500  # The summary keeps its most recent part within this size
+SUMMARY_LINE_CHARS = 160
+MAX_CACHED_CONVERSATIONS = 1000
+MAX_CONVERSATIONS_PER_USER = int(os.environ.get("MAX_CONVERSATIONS_PER_USER", 20))  # Older ones are deleted
+
+
+def summarize_messages(summary: str, messages: List[Dict]) -> str:
+    """
+    Rolls messages into the running summary: one short line per message (its first sentence),
+    the oldest lines being dropped once the summary exceeds SUMMARY_MAX_CHARS.
+    """
+    lines = [line for line in summary.split("\n") if line] if summary else []
+    for message in messages:
+        content = " ".join(str(message["content"]).split())
+        first_sentence = re.split(r"(?<=[.!?])\s", content, maxsplit=1)[0]
+        if len(first_sentence) > SUMMARY_LINE_CHARS:
+            first_sentence = first_sentence[:SUMMARY_LINE_CHARS - 1] + "…"
+        lines.append(f"{message['role']}: {first_sentence}")
+    while lines and sum(len(line) + 1 for line in lines) > SUMMARY_MAX_CHARS:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class ConversationStore:
+    """
+    Server-side chat history, so clients only send a conversation id.
+    Each conversation keeps its last RECENT_MESSAGES messages verbatim and a bounded summary of
+    the older ones, so the prompt stays the same size however long the conversation runs.
+    Recent conversations are cached in memory; every message is persisted to SQLite.
+    Only the MAX_CONVERSATIONS_PER_USER most recent conversations of a user are kept.
+    """
+    def __init__(self, db_file=CONVERSATIONS_DB, summarizer=summarize_messages):
+        self.db_file = db_file
+        self.summarizer = summarizer
+        self._cache = OrderedDict()  # conversation id -> {'user_token', 'summary', 'messages'}
+        self._lock = Lock()
+        self._init_db()
+
+    def _get_db(self):
+        """Crée une nouvelle connexion à la base de données"""
+        conn = sqlite3.connect(self.db_file)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self) -> None:
+        conn = self._get_db()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS conversations (
+                    id TEXT PRIMARY KEY,
+                    user_token TEXT NOT NULL,
+                    summary TEXT NOT NULL DEFAULT '',
+                    summarized_upto INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS conversation_messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    conversation_id TEXT NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (conversation_id) REFERENCES conversations (id)
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_conversation ON conversation_messages (conversation_id, id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_conversations_user ON conversations (user_token)')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _remember(self, conversation_id, entry):
+        """Caches a conversation, evicting the least recently used ones"""
+        self._cache[conversation_id] = entry
+        self._cache.move_to_end(conversation_id)
+        while len(self._cache) > MAX_CACHED_CONVERSATIONS:
+            self._cache.popitem(last=False)
+
+    def _load(self, conversation_id) -> Optional[Dict]:
+        """Returns the cached conversation, loading its summary and unsummarized messages from SQLite"""
+        if conversation_id in self._cache:
+            self._cache.move_to_end(conversation_id)
+            return self._cache[conversation_id]
+
+        conn = self._get_db()
+        try:
+            row = conn.execute(
+                'SELECT user_token, summary, summarized_upto FROM conversations WHERE id = ?',
+                (conversation_id,)
+            ).fetchone()
+            if not row:
+                return None
+            messages = conn.execute(
+                'SELECT id, role, content FROM conversation_messages WHERE conversation_id = ? AND id > ? ORDER BY id',
+                (conversation_id, row['summarized_upto'])
+            ).fetchall()
+        finally:
+            conn.close()
+
+        entry = {
+            'user_token': row['user_token'],
+            'summary': row['summary'],
+            'messages': [{'id': m['id'], 'role': m['role'], 'content': m['content']} for m in messages]
+        }
+        self._remember(conversation_id, entry)
+        return entry
+
+    def create(self, user_token: str, history: Optional[List[Dict]] = None) -> str:
+        """Creates a conversation for a user, optionally seeded with a client-side history"""
+        conversation_id = str(uuid.uuid4())
+        with self._lock:
+            conn = self._get_db()
+            try:
+                conn.execute('INSERT INTO conversations (id, user_token) VALUES (?, ?)', (conversation_id, user_token))
+                # Retention: the user's oldest conversations beyond the limit are deleted
+                expired = [row['id'] for row in conn.execute(
+                    'SELECT id FROM conversations WHERE user_token = ? ORDER BY rowid DESC LIMIT -1 OFFSET ?',
+                    (user_token, MAX_CONVERSATIONS_PER_USER)
+                )]
+                conn.executemany('DELETE FROM conversation_messages WHERE conversation_id = ?', [(expired_id,) for expired_id in expired])
+                conn.executemany('DELETE FROM conversations WHERE id = ?', [(expired_id,) for expired_id in expired])
+                conn.commit()
+            finally:
+                conn.close()
+            for expired_id in expired:
+                self._cache.pop(expired_id, None)
+            self._remember(conversation_id, {'user_token': user_token, 'summary': '', 'messages': []})
+        for message in history or []:
+            if isinstance(message, dict) and 'role' in message and 'content' in message:
+                self.append(conversation_id, message['role'], message['content'])
+        return conversation_id
+
+    def latest(self, user_token: str) -> Optional[str]:
+        """Id of the user's most recently created conversation, or None"""
+        conn = self._get_db()
+        try:
+            row = conn.execute(
+                'SELECT id FROM conversations WHERE user_token = ? ORDER BY rowid DESC LIMIT 1',
+                (user_token,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return row['id'] if row else None
+
+    def belongs_to(self, conversation_id: str, user_token: str) -> bool:
+        """Whether the conversation exists and belongs to the user"""
+        with self._lock:
+            entry = self._load(conversation_id)
+        return entry is not None and entry['user_token'] == user_token
+
+    def append(self, conversation_id: str, role: str, content: str) -> None:
+        """Adds a message, compacting the oldest ones into the summary when needed"""
+        # The database and the cache are updated under the same lock, so they see messages in the same order
+        with self._lock:
+            entry = self._load(conversation_id)
+            if entry is None:
+                raise ValueError("Unknown conversation")
+            conn = self._get_db()
+            try:
+                cursor = conn.execute(
+                    'INSERT INTO conversation_messages (conversation_id, role, content) VALUES (?, ?, ?)',
+                    (conversation_id, role, content)
+                )
+                message_id = cursor.lastrowid
+                conn.commit()
+            finally:
+                conn.close()
+            entry['messages'].append({'id': message_id, 'role': role, 'content': content})
+            if len(entry['messages']) >= RECENT_MESSAGES + COMPACT_BATCH:
+                self._compact(conversation_id, entry)
+
+    def _compact(self, conversation_id, entry) -> None:
+        """Rolls the messages older than the recent window into the summary"""
+        older = entry['messages'][:-RECENT_MESSAGES]
+        entry['summary'] = self.summarizer(entry['summary'], older)
+        entry['messages'] = entry['messages'][-RECENT_MESSAGES:]
+        conn = self._get_db()
+        try:
+            conn.execute(
+                'UPDATE conversations SET summary = ?, summarized_upto = ? WHERE id = ?',
+                (entry['summary'], older[-1]['id'], conversation_id)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_context(self, conversation_id: str, recent: int = RECENT_MESSAGES) -> Tuple[str, List[Dict]]:
+        """Returns (summary of older turns, last messages as {'role', 'content'})"""
+        with self._lock:
+            entry = self._load(conversation_id)
+            if entry is None:
+                raise ValueError("Unknown conversation")
+            messages = [{'role': m['role'], 'content': m['content']} for m in entry['messages'][-recent:]]
+            return entry['summary'], messages
+
+
+conversation_store = ConversationStore()
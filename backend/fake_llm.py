@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+import random
+import re
+import time
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+# Latency profiles: (seconds before the first token, output tokens per second)
+LATENCY_PROFILES = {
+    "instant": (0.0, None),
+    "fast": (0.2, 300.0),
+    "gpt-4o-mini": (0.6, 80.0),
+    "slow": (2.0, 25.0)
+}
+
+# Sessions synthesized per weekday (0 = Monday): (time, type code, share of the weekly volume)
+WEEK_TEMPLATE = {
+    1: ("18:30", "E", 0.25),
+    3: ("18:30", "I", 0.2),
+    5: ("09:00", "T", 0.2),
+    6: ("08:30", "SL", 0.35)
+}
+SESSION_TYPES = {
+    "E": "Endurance",
+    "SL": "Sortie Longue",
+    "I": "Intervalles",
+    "T": "Tempo",
+    "R": "Récupération"
+}
+
+
+def prompt_key(prompt):
+    """Key of a recorded response: hash of the full prompt text"""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+def load_recordings(path):
+    """Loads recorded responses from a JSONL file of {"prompt_sha256", "response"} lines"""
+    recordings = {}
+    if path and os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    entry = json.loads(line)
+                    recordings[entry["prompt_sha256"]] = entry["response"]
+    return recordings
+
+def recording(llm, path):
+    """Wraps a model so that every prompt/response pair is appended to a recordings file"""
+    def invoke_and_record(prompt_value):
+        message = llm.invoke(prompt_value)
+        with open(path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps({
+                "prompt_sha256": prompt_key(prompt_value.to_string()),
+                "response": message.content
+            }, ensure_ascii=False) + "\n")
+        return message
+    return RunnableLambda(invoke_and_record)
+
+
+class FakeCoachLLM(BaseChatModel):
+    """
+    Deterministic local stand-in for the coach model.
+    Replays recorded responses when the prompt is known, otherwise synthesizes a valid answer
+    for the prompt kind (program generation in JSON or compact lines, coach reply, suggestions).
+    Latency follows a profile: a fixed delay before the first token, then a constant token rate.
+    """
+    profile: str = "instant"
+    recordings_path: Optional[str] = None
+    seed: int = 0
+    recordings: Dict[str, str] = {}
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.recordings = load_recordings(self.recordings_path)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-coach"
+
+    def get_num_tokens(self, text: str) -> int:
+        return max(1, len(text) // 4)
+
+    def _delay(self, text):
+        latency, tokens_per_second = LATENCY_PROFILES.get(self.profile, LATENCY_PROFILES["instant"])
+        if tokens_per_second:
+            latency += self.get_num_tokens(text) / tokens_per_second
+        return latency
+
+    def _respond(self, messages: List[BaseMessage]) -> str:
+        prompt = "\n".join(str(message.content) for message in messages)
+        if prompt_key(prompt) in self.recordings:
+            return self.recordings[prompt_key(prompt)]
+        rng = random.Random(f"{self.seed}:{prompt_key(prompt)}")
+
+        if "SUGGESTION_1" in prompt:
+            return synthesize_suggestions(prompt)
+        if "S|AAAA-MM-JJ HH:mm|CODE" in prompt:
+            return synthesize_compact_program(prompt, rng)
+        if "liste d'objets JSON" in prompt:
+            return synthesize_json_program(prompt, rng)
+        return synthesize_coach_reply(prompt)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        text = self._respond(messages)
+        time.sleep(self._delay(text))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        text = self._respond(messages)
+        await asyncio.sleep(self._delay(text))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+
+# === Synthesis of valid answers ===
+
+def _find_date(pattern, prompt, date_format):
+    match = re.search(pattern, prompt)
+    if not match:
+        return None
+    try:
+        return datetime.strptime(match.group(1), date_format)
+    except ValueError:
+        return None
+
+def _synthesize_sessions(start, end, rng):
+    """Sessions following WEEK_TEMPLATE between start (exclusive) and end (inclusive day)"""
+    sessions = []
+    day = datetime(start.year, start.month, start.day)
+    week_volume = 20 + rng.randint(0, 10)
+    while day.date() <= end.date():
+        if day.weekday() == 0:
+            week_volume = min(week_volume + rng.randint(1, 4), 60)
+        if day.weekday() in WEEK_TEMPLATE:
+            hour, code, share = WEEK_TEMPLATE[day.weekday()]
+            session_date = datetime.strptime(f"{day:%Y-%m-%d} {hour}", "%Y-%m-%d %H:%M")
+            if session_date > start:
+                sessions.append({
+                    "date": session_date.strftime("%Y-%m-%d %H:%M"),
+                    "code": code,
+                    "distance": max(3, round(week_volume * share)),
+                    "description": f"Séance {SESSION_TYPES[code].lower()} de la semaine"
+                })
+        day += timedelta(days=1)
+    return sessions
+
+def _program_range(prompt):
+    today = _find_date(r"La date d'aujourd'hui est : (\d{4}-\d{2}-\d{2} \d{2}:\d{2})", prompt, "%Y-%m-%d %H:%M") or datetime.now()
+    block_start = _find_date(r"entre le (\d{4}-\d{2}-\d{2})", prompt, "%Y-%m-%d")
+    block_end = _find_date(r"et le (\d{4}-\d{2}-\d{2}) inclus", prompt, "%Y-%m-%d")
+    if block_start and block_end:
+        return max(today, block_start - timedelta(minutes=1)), block_end
+    return today, today + timedelta(weeks=12)
+
+def synthesize_compact_program(prompt, rng):
+    start, end = _program_range(prompt)
+    lines = [
+        f"S|{session['date']}|{session['code']}|{session['distance']}|{session['description']}"
+        for session in _synthesize_sessions(start, end, rng)
+    ]
+    return "\n".join(lines) + "\nExplanation: Programme progressif généré localement."
+
+def synthesize_json_program(prompt, rng):
+    start, end = _program_range(prompt)
+    sessions = [{
+        "date": session["date"],
+        "type_de_seance": SESSION_TYPES[session["code"]],
+        "distance": session["distance"],
+        "description": session["description"]
+    } for session in _synthesize_sessions(start, end, rng)]
+    return f"```json\n{json.dumps(sessions, indent=4, ensure_ascii=False)}\n```\nExplanation: Programme progressif généré localement."
+
+def _coach_edit(prompt):
+    """An always-valid edit: lighten the first upcoming session of the context program, keeping its slot"""
+    now = _find_date(r"La date et l'heure actuelles sont (\d{4}-\d{2}-\d{2} \d{2}:\d{2})", prompt, "%Y-%m-%d %H:%M") or datetime.now()
+    sessions = re.findall(r'"date": "(\d{4}-\d{2}-\d{2} \d{2}:\d{2})",\s*"type_de_seance": "([^"]*)",\s*"distance": ([\d.]+)', prompt)
+    for date, session_type, distance in sessions:
+        if datetime.strptime(date, "%Y-%m-%d %H:%M") > now:
+            actions = [
+                {"type_action": "remove", "date": date, "type_de_seance": "", "distance": 0, "description": ""},
+                {"type_action": "create", "date": date, "type_de_seance": session_type,
+                 "distance": max(1, round(float(distance) * 0.8, 1)), "description": "Séance allégée"}
+            ]
+            return f"```json\n{json.dumps(actions, indent=4, ensure_ascii=False)}\n```\nExplanation: J'ai allégé votre prochaine séance, confirmez-vous ?"
+    return None
+
+def synthesize_coach_reply(prompt):
+    request = prompt.rsplit("Current request:", 1)[-1].lower()
+    if any(word in request for word in ("allège", "allege", "fatigué", "fatigue", "déplace", "modifie", "lighter", "move")):
+        edit = _coach_edit(prompt)
+        if edit:
+            return edit
+    return "Continuez à suivre votre programme en restant à l'écoute de vos sensations."
+
+def synthesize_suggestions(prompt):
+    return (
+        "SUGGESTION_1:\nPeux-tu alléger ma prochaine séance ?\n"
+        "SUGGESTION_2:\nQuelle allure viser pour ma sortie longue ?\n"
+        "SUGGESTION_3:\nPeux-tu déplacer ma séance de demain à 18h ?"
+    )
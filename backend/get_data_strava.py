@@ -3,15 +3,27 @@ import json
 import os
 import dotenv
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from datetime import datetime, timezone
 from typing import List, Dict, Optional
+from requests.adapters import HTTPAdapter
+from strava_rate_limiter import strava_rate_limiter
 
 # Load environment variables
 dotenv.load_dotenv()
 
+# Constants
+STRAVA_API_URL = os.environ.get("STRAVA_API_URL", "https://www.strava.com/api/v3")
+STRAVA_OAUTH_URL = os.environ.get("STRAVA_OAUTH_URL", "https://www.strava.com/oauth/token")
+SYNC_STATE_FILE = "sync_state.json"
+SYNC_OVERLAP = 3600  # Seconds refetched before the high-water mark, duplicates are skipped by id
+TOKEN_EXPIRY_MARGIN = 60  # Tokens are refreshed this many seconds before they expire
+HTTP_POOL_SIZE = 8
+
 def get_initial_tokens(client_id: str, client_secret: str, code: str) -> Dict:
     """Get initial access and refresh tokens using the authorization code."""
-    auth_url = "https://www.strava.com/oauth/token"
+    auth_url = STRAVA_OAUTH_URL
     payload = {
         'client_id': str(client_id),  # Conversion en string
         'client_secret': client_secret,
@@ -38,16 +50,53 @@ def load_tokens(filename: str = "strava_tokens.json") -> Dict:
     with open(filename, 'r') as f:
         return json.load(f)
 
+def activity_timestamp(activity: Dict) -> int:
+    """Start of an activity as a UTC epoch, the unit of Strava's after/before parameters"""
+    start = datetime.strptime(activity['start_date'], "%Y-%m-%dT%H:%M:%SZ")
+    return int(start.replace(tzinfo=timezone.utc).timestamp())
+
+def load_saved_activities(folder_path: str = "strava_run") -> List[Dict]:
+    """Activities saved by previous syncs (newest first), or an empty list"""
+    try:
+        with open(os.path.join(folder_path, "all_activities.json"), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+def load_sync_state(folder_path: str = "strava_run") -> Dict:
+    """Sync state of a folder: {'after': start epoch of the latest synced activity, 'last_sync': ...}"""
+    try:
+        with open(os.path.join(folder_path, SYNC_STATE_FILE), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_sync_state(state: Dict, folder_path: str = "strava_run") -> None:
+    with open(os.path.join(folder_path, SYNC_STATE_FILE), 'w') as f:
+        json.dump(state, f, indent=2)
+
 class StravaActivityFetcher:
-    def __init__(self, client_id: str, client_secret: str):
+    def __init__(self, client_id: str, client_secret: str, base_url: str = STRAVA_API_URL,
+                 tokens_file: str = "strava_tokens.json", rate_limiter=strava_rate_limiter):
         self.client_id = client_id
         self.client_secret = client_secret
         self.tokens = None
-        self.base_url = "https://www.strava.com/api/v3"
+        self.base_url = base_url
+        # One tokens file per athlete when several athletes are synced
+        self.tokens_file = tokens_file
+        # Requests of the same athlete may run concurrently (streams downloads)
+        self._tokens_lock = Lock()
+        # Shared by default with the other fetchers, as the limits apply to the whole application
+        self.rate_limiter = rate_limiter
+        # Connections are kept alive between pages and syncs
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
     def refresh_access_token(self) -> None:
         """Refreshes the access token using the refresh token."""
-        auth_url = "https://www.strava.com/oauth/token"
+        auth_url = STRAVA_OAUTH_URL
         payload = {
             'client_id': self.client_id,
             'client_secret': self.client_secret,
@@ -56,21 +105,58 @@ class StravaActivityFetcher:
         }
         
         try:
-            response = requests.post(auth_url, data=payload)
+            response = self.session.post(auth_url, data=payload)
             response.raise_for_status()
             self.tokens = response.json()
-            save_tokens(self.tokens)
+            save_tokens(self.tokens, self.tokens_file)
         except requests.exceptions.RequestException as e:
             raise Exception(f"Failed to refresh token: {str(e)}")
 
-    def fetch_activities(self, per_page: int = 100) -> List[Dict]:
-        """Fetches all activities from Strava."""
-        if not self.tokens:
-            try:
-                self.tokens = load_tokens()
-            except FileNotFoundError:
-                raise Exception("No tokens found. Please run authentication first.")
+    def _ensure_tokens(self, rejected_token: Optional[str] = None) -> None:
+        """
+        Loads the tokens, refreshing them ahead of their expiry instead of waiting for a 401,
+        or when rejected_token (refused by the API) is still the current access token
+        """
+        with self._tokens_lock:
+            if not self.tokens:
+                try:
+                    self.tokens = load_tokens(self.tokens_file)
+                except FileNotFoundError:
+                    raise Exception("No tokens found. Please run authentication first.")
+            expired = self.tokens.get('expires_at', float('inf')) - TOKEN_EXPIRY_MARGIN < time.time()
+            if expired or (rejected_token and rejected_token == self.tokens['access_token']):
+                self.refresh_access_token()
+
+    def get(self, path: str, params: Optional[Dict] = None):
+        """
+        GET request to the API, sent when the rate limiter allows it.
+        Expired tokens are refreshed and the request retried; after a 429 the request
+        waits for the reset of the exhausted window.
+        """
+        self._ensure_tokens()
+        while True:
+            self.rate_limiter.acquire()
+            sent_at = self.rate_limiter.clock()
+            access_token = self.tokens["access_token"]
+            headers = {'Authorization': f'Bearer {access_token}'}
+            response = self.session.get(f"{self.base_url}{path}", headers=headers, params=params)
+            if response.status_code == 429:  # Rate limit exceeded by another client of the application
+                self.rate_limiter.on_rate_limited(response.headers, sent_at)
+                continue
+            self.rate_limiter.update(response.headers, sent_at)
+            if response.status_code == 401:
+                # Token expired, refresh (unless another request already did) and retry
+                self._ensure_tokens(rejected_token=access_token)
+                continue
+            response.raise_for_status()
+            return response.json()
 
+    def fetch_activities(self, per_page: int = 100, after: Optional[int] = None) -> List[Dict]:
+        """
+        Fetches the activities from Strava, all of them or only those started after
+        the given epoch. A page shorter than per_page is the last one, so a sync with
+        few new activities takes a single request.
+        """
         activities = []
         page = 1
         
@@ -79,35 +165,52 @@ class StravaActivityFetcher:
                 'per_page': per_page,
                 'page': page
             }
-            headers = {'Authorization': f'Bearer {self.tokens["access_token"]}'}
+            if after is not None:
+                params['after'] = after
             
             try:
-                response = requests.get(f"{self.base_url}/athlete/activities", 
-                                     headers=headers, params=params)
-                response.raise_for_status()
-                page_activities = response.json()
-                
-                if not page_activities:
-                    break
-                    
-                activities.extend(page_activities)
-                page += 1
-                time.sleep(1)  # Respect rate limits
-                
+                page_activities = self.get("/athlete/activities", params)
             except requests.exceptions.HTTPError as e:
-                if response.status_code == 401:
-                    # Token expired, refresh and retry
-                    self.refresh_access_token()
-                    continue
-                if response.status_code == 429:  # Rate limit exceeded
-                    time.sleep(15 * 60)  # Wait 15 minutes
-                    continue
                 raise Exception(f"Failed to fetch activities: {str(e)}")
+                    
+            activities.extend(page_activities)
+            if len(page_activities) < per_page:
+                break
+            page += 1
                 
         return activities
 
-    def save_activities(self, activities: List[Dict], folder_path: str = "strava_run") -> None:
-        """Saves activities to JSON files in the specified folder."""
+    def sync_activities(self, folder_path: str = "strava_run", per_page: int = 100) -> List[Dict]:
+        """
+        Fetches the activities started since the last sync (from the high-water mark stored
+        in the folder), adds the new ones to the saved activities and returns them.
+        """
+        saved = load_saved_activities(folder_path)
+        known_ids = {activity['id'] for activity in saved}
+        after = load_sync_state(folder_path).get('after')
+        if after is None and saved:
+            after = max(activity_timestamp(activity) for activity in saved)
+
+        new_activities = []
+        for activity in self.fetch_activities(per_page, after=after - SYNC_OVERLAP if after else None):
+            if activity['id'] not in known_ids:
+                known_ids.add(activity['id'])
+                new_activities.append(activity)
+
+        activities = sorted(saved + new_activities, key=activity_timestamp, reverse=True)
+        self.save_activities(activities, folder_path, new_activities)
+        if activities:
+            save_sync_state({
+                'after': activity_timestamp(activities[0]),
+                'last_sync': datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+            }, folder_path)
+        return new_activities
+
+    def save_activities(self, activities: List[Dict], folder_path: str = "strava_run", new_activities: Optional[List[Dict]] = None) -> None:
+        """
+        Saves activities to JSON files in the specified folder.
+        Only new_activities, when given, get their own file written.
+        """
         if not os.path.exists(folder_path):
             os.makedirs(folder_path)
             
@@ -117,7 +220,7 @@ class StravaActivityFetcher:
             json.dump(activities, f, indent=2)
             
         # Save each activity in a separate file
-        for activity in activities:
+        for activity in (activities if new_activities is None else new_activities):
             activity_date = datetime.strptime(activity['start_date'], "%Y-%m-%dT%H:%M:%SZ")
             filename = f"{activity_date.strftime('%Y%m%d')}_{activity['id']}.json"
             filepath = os.path.join(folder_path, filename)
@@ -125,6 +228,19 @@ class StravaActivityFetcher:
             with open(filepath, 'w') as f:
                 json.dump(activity, f, indent=2)
 
+def sync_athletes(client_id: str, client_secret: str, athletes: Dict[str, str], max_workers: int = 4) -> Dict[str, int]:
+    """
+    Syncs several athletes concurrently, athletes mapping each tokens file to its activities folder.
+    All the fetchers share the rate limiter, so together they stay within the application's limits.
+    Returns the number of new activities by folder.
+    """
+    def sync(tokens_file, folder_path):
+        fetcher = StravaActivityFetcher(client_id, client_secret, tokens_file=tokens_file)
+        return folder_path, len(fetcher.sync_activities(folder_path))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(executor.map(lambda athlete: sync(*athlete), athletes.items()))
+
 def main():
     client_id = os.environ.get("STRAVA_CLIENT_ID")
     client_secret = os.environ.get("STRAVA_CLIENT_SECRET")
@@ -135,8 +251,8 @@ def main():
     # save_tokens(tokens)
     
     fetcher = StravaActivityFetcher(client_id, client_secret)
-    activities = fetcher.fetch_activities()
-    fetcher.save_activities(activities)
+    new_activities = fetcher.sync_activities()
+    print(f"{len(new_activities)} new activities")
 
 
 if __name__ == "__main__":
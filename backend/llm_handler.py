@@ -1,16 +1,385 @@
-import os, re, json
+import os, re, json, time, hashlib
+import asyncio
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from threading import Lock, BoundedSemaphore
 from datetime import datetime
 from datetime import datetime, timedelta
 from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import StrOutputParser
-from llm_template_french import coach_prompt, program_generation_prompt, suggestions_prompt
+from llm_template_french import coach_prompt, program_generation_prompt, program_generation_compact_prompt, program_block_generation_prompt, suggestions_prompt
+from program_cache import parse_distance_km, week_start
+from command_parser import parse_command, MIN_CONFIDENCE
+from semantic_cache import semantic_cache
+from plan_repair import repair_sessions, parse_session_date
+
+# Output format of program generation: "compact" (one delimited line per session) or "json"
+PROGRAM_OUTPUT_FORMAT = os.environ.get("PROGRAM_OUTPUT_FORMAT", "compact")
+
+# Program generation mode: "single" (one completion for the whole plan) or "parallel" (one completion per block of weeks)
+PROGRAM_GENERATION_MODE = os.environ.get("PROGRAM_GENERATION_MODE", "single")
+PLAN_WEEKS = 12  # Maximum length of a generated plan
+GENERATION_BLOCK_WEEKS = 1  # Weeks generated per completion in parallel mode
+GENERATION_MAX_WORKERS = 6  # Concurrent completions in parallel mode
+
+# Outbound LLM calls: rate, concurrency and latency limits of the gateway
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 8))
+LLM_RATE_PER_SECOND = float(os.environ.get("LLM_RATE_PER_SECOND", 5))
+LLM_BURST = int(os.environ.get("LLM_BURST", 10))
+LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", 60))
+LLM_HEDGE_AFTER_SECONDS = float(os.environ.get("LLM_HEDGE_AFTER_SECONDS", 15))
+GENERATION_TIMEOUT_SECONDS = float(os.environ.get("GENERATION_TIMEOUT_SECONDS", 240))
+SLOT_POLL_SECONDS = 0.01  # How often async calls check for a free concurrency slot
+
+# Session type codes of the compact format
+SESSION_TYPE_CODES = {
+    "E": "Endurance",
+    "SL": "Sortie Longue",
+    "I": "Intervalles",
+    "T": "Tempo",
+    "R": "Récupération",
+    "C": "Course"
+}
+
+# Model backend: "openai", or "fake" for the deterministic local stand-in (offline benchmarks and load tests)
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "openai")
+FAKE_LLM_PROFILE = os.environ.get("FAKE_LLM_PROFILE", "instant")
+LLM_RECORDINGS_PATH = os.environ.get("LLM_RECORDINGS_PATH")  # Replayed by the fake backend, appended to by "record"
+
+def create_llm(backend=LLM_BACKEND):
+    """Creates the chat model used by all chains"""
+    if backend == "fake":
+        from fake_llm import FakeCoachLLM
+        return FakeCoachLLM(profile=FAKE_LLM_PROFILE, recordings_path=LLM_RECORDINGS_PATH)
+    
+    model = ChatOpenAI(
+        model="gpt-4o-mini",
+        api_key=os.environ.get("OPENAI_API_KEY"),
+        timeout=GENERATION_TIMEOUT_SECONDS
+    )
+    if backend == "record":
+        from fake_llm import recording
+        return recording(model, LLM_RECORDINGS_PATH or "llm_recordings.jsonl")
+    return model
 
 # LangChain Initialization
-llm = ChatOpenAI(
-    model="gpt-4o-mini",
-    api_key=os.environ.get("OPENAI_API_KEY")
+llm = create_llm()
+
+# === LLM gateway ===
+
+class TokenBucket:
+    """Token bucket rate limiter: `rate` tokens per second, up to `capacity` tokens of burst"""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _take(self):
+        """Takes a token and returns 0, or returns the seconds until one is available"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def try_acquire(self):
+        """Takes a token if one is available, without waiting"""
+        return self._take() == 0
+
+    def acquire(self, timeout=None):
+        """Waits for a token, at most `timeout` seconds. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._take()
+            if not wait:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    async def aacquire(self, timeout=None):
+        """Async version of acquire: waits without blocking the event loop"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._take()
+            if not wait:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            await asyncio.sleep(wait)
+
+
+class GatewayMetrics:
+    """Counters and recent queue-wait / call-latency samples of the LLM gateway"""
+    def __init__(self, window=500):
+        self._lock = Lock()
+        self.counters = {"calls": 0, "coalesced": 0, "hedged": 0, "hedge_wins": 0, "timeouts": 0, "errors": 0}
+        self._queue_waits = deque(maxlen=window)
+        self._latencies = deque(maxlen=window)
+
+    def increment(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def record_queue_wait(self, seconds):
+        with self._lock:
+            self._queue_waits.append(seconds)
+
+    def record_latency(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    @staticmethod
+    def _percentiles(samples):
+        if not samples:
+            return {"p50": None, "p95": None, "p99": None, "max": None}
+        ordered = sorted(samples)
+        pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 4)
+        return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": round(ordered[-1], 4)}
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                **self.counters,
+                "queue_wait_seconds": self._percentiles(self._queue_waits),
+                "call_latency_seconds": self._percentiles(self._latencies)
+            }
+
+
+class LLMGateway:
+    """
+    Single entry point for outbound LLM calls:
+    - identical in-flight requests are coalesced and share one call (singleflight)
+    - a token bucket limits the call rate and a semaphore caps the calls in flight
+    - each call has a timeout, and a call slower than `hedge_after` seconds is duplicated,
+      the first answer winning
+    invoke() and ainvoke() both run calls on the gateway's threads, ainvoke() awaiting them without
+    blocking the caller's event loop. Calls never run on that loop: Flask starts a new one for each
+    async view, and the model's async HTTP client can't reuse connections opened on a closed loop.
+    Both share the same limits and in-flight calls.
+    """
+    def __init__(self, max_concurrency=8, rate_per_second=5.0, burst=10, timeout=60.0, hedge_after=None):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+        self.metrics = GatewayMetrics()
+        self._bucket = TokenBucket(rate_per_second, burst)
+        self._slots = BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm-gateway")
+        self._inflight = {}
+        self._inflight_lock = Lock()
+
+    @staticmethod
+    def make_key(runnable, inputs):
+        """Coalescing key: the runnable and its inputs"""
+        payload = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(f"{id(runnable)}:{payload}".encode()).hexdigest()
+
+    def _acquire_slot(self, deadline):
+        """Waits for a rate token and a concurrency slot until deadline. Returns False on timeout."""
+        if not self._bucket.acquire(timeout=max(0, deadline - time.monotonic())):
+            return False
+        return self._slots.acquire(timeout=max(0, deadline - time.monotonic()))
+
+    def _start_call(self, runnable, inputs):
+        """Runs one call on the gateway pool; the concurrency slot is released when it ends"""
+        started = time.monotonic()
+        self.metrics.increment("calls")
+
+        def release(future):
+            self._slots.release()
+            if not future.cancelled():
+                self.metrics.record_latency(time.monotonic() - started)
+
+        future = self._executor.submit(runnable.invoke, inputs)
+        future.add_done_callback(release)
+        return future
+
+    def _call(self, runnable, inputs, timeout, hedge_after):
+        deadline = time.monotonic() + timeout
+        queued = time.monotonic()
+        if not self._acquire_slot(deadline):
+            self.metrics.increment("timeouts")
+            raise TimeoutError("LLM gateway queue timeout")
+        self.metrics.record_queue_wait(time.monotonic() - queued)
+
+        futures = [self._start_call(runnable, inputs)]
+        if hedge_after and hedge_after < timeout:
+            done, _ = wait(futures, timeout=hedge_after)
+            # Hedge only with spare capacity, never by queueing behind other requests
+            if not done and self._bucket.try_acquire() and self._slots.acquire(blocking=False):
+                self.metrics.increment("hedged")
+                futures.append(self._start_call(runnable, inputs))
+
+        pending = futures
+        while pending:
+            done, pending = wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                self.metrics.increment("timeouts")
+                raise TimeoutError(f"LLM call timed out after {timeout}s")
+            for future in done:
+                if future.exception() is None:
+                    if future is not futures[0]:
+                        self.metrics.increment("hedge_wins")
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+        # Every attempt failed: raise the first attempt's error
+        self.metrics.increment("errors")
+        raise futures[0].exception()
+
+    def invoke(self, runnable, inputs, key=None, timeout=None, hedge_after=None):
+        """
+        Invokes a runnable through the gateway.
+        Concurrent calls with the same key (by default the runnable and its inputs) share one call.
+        timeout and hedge_after default to the gateway's; hedge_after=False disables hedging.
+        """
+        timeout = timeout or self.timeout
+        hedge_after = self.hedge_after if hedge_after is None else hedge_after
+        key = key or self.make_key(runnable, inputs)
+
+        with self._inflight_lock:
+            shared = self._inflight.get(key)
+            if shared is None:
+                shared = self._inflight[key] = Future()
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            self.metrics.increment("coalesced")
+            return shared.result(timeout=timeout)
+
+        try:
+            result = self._call(runnable, inputs, timeout, hedge_after)
+            shared.set_result(result)
+            return result
+        except BaseException as e:
+            shared.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    def invoke_many(self, runnable, inputs_list, max_concurrency=None, **kwargs):
+        """Invokes a runnable on several inputs concurrently, returning the results in order"""
+        workers = min(max_concurrency or self.max_concurrency, len(inputs_list)) or 1
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(lambda inputs: self.invoke(runnable, inputs, **kwargs), inputs_list))
+
+    # --- Async calls ---
+
+    async def _aacquire_slot(self, deadline):
+        """Async version of _acquire_slot: the concurrency slot is polled, never waited on"""
+        if not await self._bucket.aacquire(timeout=max(0, deadline - time.monotonic())):
+            return False
+        while not self._slots.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(SLOT_POLL_SECONDS)
+        return True
+
+    def _astart_call(self, runnable, inputs):
+        """Starts one call on the gateway pool, awaitable from the running event loop"""
+        return asyncio.wrap_future(self._start_call(runnable, inputs))
+
+    async def _acall(self, runnable, inputs, timeout, hedge_after):
+        deadline = time.monotonic() + timeout
+        queued = time.monotonic()
+        if not await self._aacquire_slot(deadline):
+            self.metrics.increment("timeouts")
+            raise TimeoutError("LLM gateway queue timeout")
+        self.metrics.record_queue_wait(time.monotonic() - queued)
+
+        tasks = [self._astart_call(runnable, inputs)]
+        if hedge_after and hedge_after < timeout:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done and self._bucket.try_acquire() and self._slots.acquire(blocking=False):
+                self.metrics.increment("hedged")
+                tasks.append(self._astart_call(runnable, inputs))
+
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.metrics.increment("timeouts")
+                    raise TimeoutError(f"LLM call timed out after {timeout}s")
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self.metrics.increment("hedge_wins")
+                        return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+        self.metrics.increment("errors")
+        raise tasks[0].exception()
+
+    async def ainvoke(self, runnable, inputs, key=None, timeout=None, hedge_after=None):
+        """Async version of invoke, coalesced with the sync calls in flight"""
+        timeout = timeout or self.timeout
+        hedge_after = self.hedge_after if hedge_after is None else hedge_after
+        key = key or self.make_key(runnable, inputs)
+
+        with self._inflight_lock:
+            shared = self._inflight.get(key)
+            if shared is None:
+                shared = self._inflight[key] = Future()
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            self.metrics.increment("coalesced")
+            # Shielded: giving up waiting must not cancel the leader's call
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(shared)), timeout)
+
+        try:
+            result = await self._acall(runnable, inputs, timeout, hedge_after)
+            shared.set_result(result)
+            return result
+        except BaseException as e:
+            shared.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    async def ainvoke_many(self, runnable, inputs_list, max_concurrency=None, **kwargs):
+        """Async version of invoke_many"""
+        semaphore = asyncio.Semaphore(max_concurrency or self.max_concurrency)
+
+        async def run(inputs):
+            async with semaphore:
+                return await self.ainvoke(runnable, inputs, **kwargs)
+
+        return list(await asyncio.gather(*(run(inputs) for inputs in inputs_list)))
+
+
+llm_gateway = LLMGateway(
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    rate_per_second=LLM_RATE_PER_SECOND,
+    burst=LLM_BURST,
+    timeout=LLM_TIMEOUT_SECONDS,
+    hedge_after=LLM_HEDGE_AFTER_SECONDS
 )
 
+
 # Create runnable chain with the coach prompt and LLM model
 chain = (
     {
@@ -23,9 +392,8 @@ chain = (
     | StrOutputParser()
 )
 
-# Add this new chain after the existing chain
-program_generation_chain = (
-    {
+# Profile fields shared by the program generation prompts
+program_generation_inputs = {
         "age": lambda x: x["profile_data"]["age"],
         "poids": lambda x: x["profile_data"]["poids"],
         "taille": lambda x: x["profile_data"]["taille"],
@@ -40,65 +408,370 @@ program_generation_chain = (
         "jour_sortie_longue": lambda x: x["profile_data"]["jour_sortie_longue"],
         "current_date": lambda x: x["current_date"],
         "goal_date": lambda x: x["profile_data"]["goal_date"]
+}
 
-    }
+# Add this new chain after the existing chain
+program_generation_chain = (
+    program_generation_inputs
     | program_generation_prompt 
     | llm 
     | StrOutputParser()
 )
 
+# Same generation, answered in the compact line format
+program_generation_compact_chain = (
+    {
+        **program_generation_inputs,
+        "type_codes": lambda x: "\n".join(f"- {code} : {label}" for code, label in SESSION_TYPE_CODES.items())
+    }
+    | program_generation_compact_prompt 
+    | llm 
+    | StrOutputParser()
+)
+
+# Generation of one block of weeks of a planned program, in the compact line format
+program_block_generation_chain = (
+    {
+        **{key: program_generation_inputs[key] for key in program_block_generation_prompt.input_variables if key in program_generation_inputs},
+        "type_codes": lambda x: "\n".join(f"- {code} : {label}" for code, label in SESSION_TYPE_CODES.items()),
+        "plan_overview": lambda x: x["plan_overview"],
+        "block_start": lambda x: x["block_start"],
+        "block_end": lambda x: x["block_end"],
+        "block_details": lambda x: x["block_details"]
+    }
+    | program_block_generation_prompt 
+    | llm 
+    | StrOutputParser()
+)
+
 
-def generate_training_program(profile_data):
+def generate_training_program(profile_data, output_format=None):
     """
     Generates a complete training program based on athlete profile data.
     
     Parameters:
     - profile_data (dict): Dictionary containing athlete profile information
+    - output_format (str): "compact" or "json", defaults to PROGRAM_OUTPUT_FORMAT.
+      The JSON generation is used as a fallback when the compact output is rejected.
     
     Returns:
     - tuple: (list of training sessions as JSON objects, explanation string, full response text)
     """
     current_date = datetime.now().strftime("%Y-%m-%d %H:%M")
+    output_format = output_format or PROGRAM_OUTPUT_FORMAT
+    
+    if PROGRAM_GENERATION_MODE == "parallel":
+        try:
+            return generate_training_program_parallel(profile_data)
+        except ValueError as e:
+            print(f"Warning: parallel program generation failed ({str(e)}), falling back to a single completion")
+    
+    if output_format == "compact":
+        try:
+            print("Generating training program (compact format)...")
+            start_time = time.perf_counter()
+            response = llm_gateway.invoke(program_generation_compact_chain, {
+                "profile_data": profile_data,
+                "current_date": current_date
+            }, timeout=GENERATION_TIMEOUT_SECONDS, hedge_after=False)
+            return compact_program_result(response, time.perf_counter() - start_time)
+        except ValueError as e:
+            print(f"Warning: compact program output rejected ({str(e)}), falling back to JSON generation")
+        except Exception as e:
+            raise Exception(f"Failed to generate training program: {str(e)}")
     
     try:
         print("Generating training program...")
-        response = program_generation_chain.invoke({
+        response = llm_gateway.invoke(program_generation_chain, {
             "profile_data": profile_data,
             "current_date": current_date
-        })
+        }, timeout=GENERATION_TIMEOUT_SECONDS, hedge_after=False)
+        return json_program_result(response)
+    except Exception as e:
+        raise Exception(f"Failed to generate training program: {str(e)}")
 
-        print(response)
-        
+async def agenerate_training_program(profile_data, output_format=None):
+    """Async version of generate_training_program: completions are awaited without blocking the event loop"""
+    current_date = datetime.now().strftime("%Y-%m-%d %H:%M")
+    output_format = output_format or PROGRAM_OUTPUT_FORMAT
+    
+    if PROGRAM_GENERATION_MODE == "parallel":
         try:
-            json_objects = extract_training_sessions(response)
-            explanation = extract_brief_explanation(response)
-
-            print(f"{len(json_objects)} training sessions generated.")
-            
-            # Validate all sessions
-            for session in json_objects:
-                if not validate_date_format(session["date"]):
-                    raise ValueError(f"Invalid date format in program: {session['date']}")
-                
-                # Add additional validation if needed
-                if not isinstance(session["distance"], (int, float)):
-                    raise ValueError("Distance must be a number")
-                
-                if not session["type_de_seance"] or not session["description"]:
-                    raise ValueError("Session type and description are required")
-            
-            return json_objects, explanation, response
-            
+            return await agenerate_training_program_parallel(profile_data)
         except ValueError as e:
-            print(f"Warning: Error in program generation: {str(e)}")
-            return None, None, response
-            
+            print(f"Warning: parallel program generation failed ({str(e)}), falling back to a single completion")
+    
+    if output_format == "compact":
+        try:
+            print("Generating training program (compact format)...")
+            start_time = time.perf_counter()
+            response = await llm_gateway.ainvoke(program_generation_compact_chain, {
+                "profile_data": profile_data,
+                "current_date": current_date
+            }, timeout=GENERATION_TIMEOUT_SECONDS, hedge_after=False)
+            return compact_program_result(response, time.perf_counter() - start_time)
+        except ValueError as e:
+            print(f"Warning: compact program output rejected ({str(e)}), falling back to JSON generation")
+        except Exception as e:
+            raise Exception(f"Failed to generate training program: {str(e)}")
+    
+    try:
+        print("Generating training program...")
+        response = await llm_gateway.ainvoke(program_generation_chain, {
+            "profile_data": profile_data,
+            "current_date": current_date
+        }, timeout=GENERATION_TIMEOUT_SECONDS, hedge_after=False)
+        return json_program_result(response)
     except Exception as e:
         raise Exception(f"Failed to generate training program: {str(e)}")
 
+def compact_program_result(response, elapsed):
+    """Program generated in the compact format. Raises ValueError if the output is rejected."""
+    json_objects = repair_generated_sessions(parse_compact_sessions(response))
+    explanation = extract_brief_explanation(response)
+    print(f"{len(json_objects)} training sessions generated.")
+    report_compact_generation(json_objects, response, elapsed)
+    return json_objects, explanation, response
+
+def json_program_result(response):
+    """Program generated in JSON, or (None, None, response) if no valid session is found"""
+    print(response)
+    
+    try:
+        json_objects = extract_training_sessions(response)
+        explanation = extract_brief_explanation(response)
+
+        print(f"{len(json_objects)} training sessions generated.")
+        
+        # Fix dates, overlaps and volume jumps locally rather than generating again
+        json_objects = repair_generated_sessions(json_objects)
+        
+        return json_objects, explanation, response
+        
+    except ValueError as e:
+        print(f"Warning: Error in program generation: {str(e)}")
+        return None, None, response
 
-import json
-import re
+
+def build_periodization_skeleton(profile_data, current_date=None):
+    """
+    Computes the plan structure locally: one entry per week with its dates, phase,
+    target weekly volume and long run distance. The plan runs from the current week to the
+    goal week (at most PLAN_WEEKS), the last two weeks are the taper and every fourth week
+    is a lighter recovery week.
+    """
+    current_date = current_date or datetime.now()
+    first_week = week_start(current_date)
+    try:
+        goal_week = week_start(datetime.strptime(profile_data["goal_date"], "%Y-%m-%d"))
+        weeks_to_goal = (goal_week - first_week).days // 7 + 1
+    except (KeyError, ValueError):
+        weeks_to_goal = 0
+    # Goal passed or unknown: plan PLAN_WEEKS from now, without taper
+    reaches_goal = 1 <= weeks_to_goal <= PLAN_WEEKS
+    weeks = weeks_to_goal if reaches_goal else PLAN_WEEKS
+    
+    target_distance = parse_distance_km(profile_data.get("distance_cible", ""))
+    if not isinstance(target_distance, float):
+        target_distance = 10.0
+    start_volume = max(target_distance * 1.2, 15.0)
+    peak_volume = max(target_distance * 2.0, start_volume * 1.3)
+    long_run_cap = min(target_distance * 0.9, 32.0)
+    
+    taper_weeks = 0
+    if reaches_goal:
+        taper_weeks = 2 if weeks >= 6 else (1 if weeks >= 3 else 0)
+    build_weeks = weeks - taper_weeks
+    skeleton = []
+    for index in range(weeks):
+        week_first_day = first_week + timedelta(weeks=index)
+        if index >= build_weeks:
+            phase = "Affûtage"
+            volume = peak_volume * (0.7 if index == build_weeks else 0.5)
+        else:
+            progress = index / max(build_weeks - 1, 1)
+            volume = start_volume + (peak_volume - start_volume) * progress
+            if index < build_weeks * 0.4:
+                phase = "Foncier"
+            elif index < build_weeks * 0.8:
+                phase = "Développement"
+            else:
+                phase = "Spécifique"
+            if index % 4 == 3:
+                phase = "Récupération"
+                volume *= 0.8
+        skeleton.append({
+            "week": index + 1,
+            "start": week_first_day.strftime("%Y-%m-%d"),
+            "end": (week_first_day + timedelta(days=6)).strftime("%Y-%m-%d"),
+            "phase": phase,
+            "volume_km": round(volume),
+            "long_run_km": round(min(volume * 0.35, long_run_cap))
+        })
+    return skeleton
+
+def format_skeleton_weeks(weeks):
+    """Formats skeleton weeks as prompt lines"""
+    return "\n".join(
+        f"- Semaine {week['week']} ({week['start']} au {week['end']}) : phase {week['phase']}, "
+        f"volume {week['volume_km']} km, sortie longue {week['long_run_km']} km"
+        for week in weeks
+    )
+
+def generate_training_program_parallel(profile_data):
+    """
+    Generates a training program from a locally computed periodization skeleton,
+    with one completion per block of weeks run concurrently, then merges and repairs the blocks.
+    
+    Returns:
+    - tuple: (list of training sessions as JSON objects, explanation string, concatenated responses)
+    Raises ValueError if a block can't be parsed or has no session.
+    """
+    now = datetime.now()
+    skeleton, blocks, inputs_list = plan_blocks(profile_data, now)
+    
+    print(f"Generating training program in {len(blocks)} parallel blocks...")
+    start_time = time.perf_counter()
+    try:
+        responses = llm_gateway.invoke_many(program_block_generation_chain, inputs_list, max_concurrency=GENERATION_MAX_WORKERS)
+    except Exception as e:
+        raise Exception(f"Failed to generate training program: {str(e)}")
+    return merge_plan_blocks(skeleton, blocks, responses, now, time.perf_counter() - start_time)
+
+async def agenerate_training_program_parallel(profile_data):
+    """Async version of generate_training_program_parallel"""
+    now = datetime.now()
+    skeleton, blocks, inputs_list = plan_blocks(profile_data, now)
+    
+    print(f"Generating training program in {len(blocks)} parallel blocks...")
+    start_time = time.perf_counter()
+    try:
+        responses = await llm_gateway.ainvoke_many(program_block_generation_chain, inputs_list, max_concurrency=GENERATION_MAX_WORKERS)
+    except Exception as e:
+        raise Exception(f"Failed to generate training program: {str(e)}")
+    return merge_plan_blocks(skeleton, blocks, responses, now, time.perf_counter() - start_time)
+
+def plan_blocks(profile_data, now):
+    """Skeleton of the plan, its blocks of weeks and the prompt inputs of each block"""
+    current_date = now.strftime("%Y-%m-%d %H:%M")
+    skeleton = build_periodization_skeleton(profile_data, now)
+    plan_overview = format_skeleton_weeks(skeleton)
+    blocks = [skeleton[i:i + GENERATION_BLOCK_WEEKS] for i in range(0, len(skeleton), GENERATION_BLOCK_WEEKS)]
+    inputs_list = [{
+        "profile_data": profile_data,
+        "current_date": current_date,
+        "plan_overview": plan_overview,
+        "block_start": block[0]["start"],
+        "block_end": block[-1]["end"],
+        "block_details": format_skeleton_weeks(block)
+    } for block in blocks]
+    return skeleton, blocks, inputs_list
+
+def merge_plan_blocks(skeleton, blocks, responses, now, elapsed):
+    """Merges and repairs the sessions generated for each block"""
+    current_date = now.strftime("%Y-%m-%d %H:%M")
+    json_objects = []
+    for block, response in zip(blocks, responses):
+        block_sessions = [
+            session for session in parse_compact_sessions(response)
+            if block[0]["start"] <= session["date"][:10] <= block[-1]["end"] and session["date"] > current_date
+        ]
+        if not block_sessions:
+            raise ValueError(f"No session generated between {block[0]['start']} and {block[-1]['end']}")
+        json_objects.extend(block_sessions)
+    
+    # Blocks are generated independently: their boundaries may overlap or jump in volume
+    json_objects = repair_generated_sessions(json_objects)
+    
+    print(f"{len(json_objects)} training sessions generated in {elapsed:.1f}s.")
+    phases = " → ".join(dict.fromkeys(week["phase"] for week in skeleton))
+    explanation = f"Programme de {len(skeleton)} semaines ({phases}), avec une progression du volume jusqu'à {max(week['volume_km'] for week in skeleton)} km par semaine."
+    return json_objects, explanation, "\n".join(responses)
+
+def parse_compact_sessions(response_text):
+    """
+    Parses the compact program format in a single pass, validating each line as it is read:
+    S|AAAA-MM-JJ HH:mm|CODE|distance|description
+    Lines that don't start with "S|" (explanation, blank lines) are skipped.
+    Raises ValueError on the first invalid session line or if no session is found.
+    """
+    sessions = []
+    for line_number, line in enumerate(response_text.splitlines(), start=1):
+        line = line.strip().strip('`')
+        if not line.startswith("S|"):
+            continue
+        
+        fields = line.split("|", 4)
+        if len(fields) != 5:
+            raise ValueError(f"Line {line_number}: expected 5 fields, got {len(fields)}")
+        _, date, code, distance, description = (field.strip() for field in fields)
+        
+        # Dates are normalized here and snapped to 5-minute slots by the repair stage
+        parsed_date = parse_session_date(date)
+        if parsed_date is None:
+            raise ValueError(f"Line {line_number}: invalid date {date}")
+        date = parsed_date.strftime("%Y-%m-%d %H:%M")
+        if code not in SESSION_TYPE_CODES:
+            raise ValueError(f"Line {line_number}: unknown session type code {code}")
+        try:
+            distance = float(distance.lower().replace("km", "").replace(",", "."))
+        except ValueError:
+            raise ValueError(f"Line {line_number}: invalid distance {distance}")
+        if distance <= 0:
+            raise ValueError(f"Line {line_number}: distance must be positive")
+        if not description:
+            raise ValueError(f"Line {line_number}: description is required")
+        
+        sessions.append({
+            "date": date,
+            "type_de_seance": SESSION_TYPE_CODES[code],
+            "distance": int(distance) if distance.is_integer() else distance,
+            "description": description
+        })
+    
+    if not sessions:
+        raise ValueError("No session line found in the response")
+    return sessions
+
+def repair_generated_sessions(sessions):
+    """
+    Repairs generated sessions locally (see plan_repair.repair_sessions).
+    Raises ValueError if no session is left.
+    """
+    sessions, repairs = repair_sessions(sessions)
+    if repairs:
+        print(f"{len(repairs)} repairs made to the generated program:\n" + "\n".join(f"- {repair}" for repair in repairs))
+    if not sessions:
+        raise ValueError("No valid session in the generated program")
+    return sessions
+
+def count_tokens(text):
+    """Counts tokens with the model tokenizer, or estimates them (~4 characters per token)"""
+    try:
+        return llm.get_num_tokens(text)
+    except Exception:
+        return max(1, len(text) // 4)
+
+def report_compact_generation(sessions, response, elapsed):
+    """
+    Reports the output tokens saved by the compact format against the equivalent JSON output,
+    and the wall time saved assuming generation time is proportional to output tokens.
+    """
+    compact_tokens = count_tokens(response)
+    json_tokens = count_tokens(json.dumps(sessions, indent=4, ensure_ascii=False))
+    reduction = 1 - compact_tokens / json_tokens if json_tokens else 0
+    saved_seconds = elapsed * (json_tokens / compact_tokens - 1) if compact_tokens else 0
+    print(
+        f"Compact format: {compact_tokens} output tokens vs ~{json_tokens} in JSON "
+        f"({reduction:.0%} fewer), generated in {elapsed:.1f}s (~{saved_seconds:.1f}s saved)"
+    )
+    return {
+        "compact_tokens": compact_tokens,
+        "json_tokens": json_tokens,
+        "token_reduction": reduction,
+        "elapsed_seconds": elapsed,
+        "estimated_seconds_saved": saved_seconds
+    }
 
 def extract_json_objects(response_text):
     """
@@ -332,16 +1005,60 @@ def format_context_program(context_program):
     else:
         return str(context_program)
 
-def process_llm_request(user_input, context_program=None, message_history=None):
+def process_llm_request(user_input, context_program=None, message_history=None, use_fast_path=True, history_summary=None, cache_scope=None):
     """
     Process the user input through the LLM chain and extract JSON objects.
+    Simple commands (move, delete or list sessions) are handled locally by the command parser
+    when it is confident enough, without calling the LLM.
     
     Parameters:
     - user_input (str): The user's request
     - user_token (str): The user's unique identifier
     - context_program (dict/list/str): The current training program in JSON format
     - message_history (list): List of previous messages with roles and content
+    - use_fast_path (bool): Try the local command parser first
+    - history_summary (str): Summary of the older messages of the conversation
+    - cache_scope (tuple): ((user_token, conversation_id), program version) under which read-only
+      answers are reused for similar questions, None to disable the semantic cache
     """
+    local_answer = answer_locally(user_input, context_program, use_fast_path, cache_scope)
+    if local_answer:
+        return local_answer
+    
+    try:
+        response = llm_gateway.invoke(chain, coach_inputs(user_input, context_program, message_history, history_summary))
+        return coach_result(user_input, response, cache_scope)
+    except Exception as e:
+        raise Exception(f"Failed to process training request: {str(e)}")
+
+async def aprocess_llm_request(user_input, context_program=None, message_history=None, use_fast_path=True, history_summary=None, cache_scope=None):
+    """Async version of process_llm_request: the completion is awaited without blocking the event loop"""
+    local_answer = answer_locally(user_input, context_program, use_fast_path, cache_scope)
+    if local_answer:
+        return local_answer
+    
+    try:
+        response = await llm_gateway.ainvoke(chain, coach_inputs(user_input, context_program, message_history, history_summary))
+        return coach_result(user_input, response, cache_scope)
+    except Exception as e:
+        raise Exception(f"Failed to process training request: {str(e)}")
+
+def answer_locally(user_input, context_program, use_fast_path, cache_scope):
+    """Answer from the command parser or the semantic cache, or None when the LLM is needed"""
+    if use_fast_path and isinstance(context_program, list):
+        command = parse_command(user_input, context_program)
+        if command and command["confidence"] >= MIN_CONFIDENCE:
+            explanation = command["response"] if command["actions"] else None
+            return command["actions"], explanation, command["response"]
+    
+    if cache_scope:
+        cached_response = semantic_cache.get(*cache_scope, user_input)
+        if cached_response is not None:
+            return [], None, cached_response
+    return None
+
+def coach_inputs(user_input, context_program, message_history, history_summary):
+    """Prompt inputs of the coach chain"""
     current_datetime = datetime.now().strftime("%Y-%m-%d %H:%M")
     
     # Format the context program
@@ -349,29 +1066,32 @@ def process_llm_request(user_input, context_program=None, message_history=None):
     
     # Format message history
     history_context = ""
+    if history_summary:
+        history_context = f"\nSummary of the earlier conversation:\n{history_summary}\n"
     if message_history:
-        history_context = "\nPrevious messages:\n" + "\n".join(
+        history_context += "\nPrevious messages:\n" + "\n".join(
             f"{msg['role']}: {msg['content']}" 
             for msg in message_history[-10:]  # Last 10 messages
         )
     
+    return {
+        "current_datetime": current_datetime,
+        "input": f"{history_context}\n\nCurrent request: {user_input}",
+        "context_program": formatted_context
+    }
+
+def coach_result(user_input, response, cache_scope):
+    """(json_objects, explanation, response) of a coach reply"""
     try:
-        response = chain.invoke({
-            "current_datetime": current_datetime,
-            "input": f"{history_context}\n\nCurrent request: {user_input}",
-            "context_program": formatted_context
-        })
-        
-        try:
-            json_objects = extract_json_objects(response)
-            explanation = extract_brief_explanation(response)
-            return json_objects, explanation, response
-        except ValueError as e:
-            print(f"Warning: {str(e)}")
-            return None, None, response
-            
-    except Exception as e:
-        raise Exception(f"Failed to process training request: {str(e)}")
+        json_objects = extract_json_objects(response)
+        explanation = extract_brief_explanation(response)
+        # Only answers that don't edit the program can be reused
+        if cache_scope and not json_objects and "```" not in response:
+            semantic_cache.put(*cache_scope, user_input, response)
+        return json_objects, explanation, response
+    except ValueError as e:
+        print(f"Warning: {str(e)}")
+        return None, None, response
 
 
 # Créer une nouvelle chaîne pour les suggestions
@@ -418,10 +1138,30 @@ def extract_suggestions(response_text):
     
     return suggestions
 
-def process_suggestions_request(user_input, context_program=None, message_history=None):
+def process_suggestions_request(user_input, context_program=None, message_history=None, history_summary=None):
     """
     Génère trois suggestions de réponse pour une demande utilisateur.
     """
+    try:
+        response = llm_gateway.invoke(suggestions_chain, suggestions_inputs(user_input, context_program, message_history, history_summary))
+        return suggestions_result(response)
+    except Exception as e:
+        raise Exception(f"Failed to generate suggestions: {str(e)}")
+
+async def aprocess_suggestions_request(user_input, context_program=None, message_history=None, history_summary=None):
+    """
+    Version asynchrone de process_suggestions_request.
+    """
+    try:
+        response = await llm_gateway.ainvoke(suggestions_chain, suggestions_inputs(user_input, context_program, message_history, history_summary))
+        return suggestions_result(response)
+    except Exception as e:
+        raise Exception(f"Failed to generate suggestions: {str(e)}")
+
+def suggestions_inputs(user_input, context_program, message_history, history_summary):
+    """
+    Entrées du prompt de suggestions.
+    """
     current_datetime = datetime.now().strftime("%Y-%m-%d %H:%M")
     
     # Formater l'historique du chat
@@ -429,28 +1169,30 @@ def process_suggestions_request(user_input, context_program=None, message_histor
         f"{msg['role']}: {msg['content']}" 
         for msg in message_history[-5:]  # Derniers 5 messages
     )
+    if history_summary:
+        formatted_history = f"Résumé des échanges précédents :\n{history_summary}\n\n{formatted_history}"
     
     # Formater le contexte du programme
     formatted_context = format_context_program(context_program) if context_program else "Pas de sessions d'entraînement."
     
-    try:
-        response = suggestions_chain.invoke({
-            "current_datetime": current_datetime,
-            "chat_history": formatted_history,
-            "input": user_input,
-            "context_program": formatted_context
-        })
-        
-        suggestions = extract_suggestions(response)
-        
-        # Pour chaque suggestion, extraire les objets JSON si présents
-        for suggestion in suggestions:
-            content = suggestion['content']
-            json_objects = extract_json_objects(content)
-            if json_objects:
-                suggestion['json_objects'] = json_objects
-        
-        return suggestions
-        
-    except Exception as e:
-        raise Exception(f"Failed to generate suggestions: {str(e)}")
\ No newline at end of file
+    return {
+        "current_datetime": current_datetime,
+        "chat_history": formatted_history,
+        "input": user_input,
+        "context_program": formatted_context
+    }
+
+def suggestions_result(response):
+    """
+    Suggestions extraites d'une réponse, avec leurs objets JSON si présents.
+    """
+    suggestions = extract_suggestions(response)
+    
+    # Pour chaque suggestion, extraire les objets JSON si présents
+    for suggestion in suggestions:
+        content = suggestion['content']
+        json_objects = extract_json_objects(content)
+        if json_objects:
+            suggestion['json_objects'] = json_objects
+    
+    return suggestions
@@ -0,0 +1,80 @@
+"""
+Regression check of the async views against an OpenAI-compatible server.
+
+    python llm_loop_check.py --requests 6
+
+Flask runs each async view on a new event loop, while the chat model and its HTTP connection
+pool are created once per process. A stand-in OpenAI server (HTTP/1.1, keep-alive) is started on
+a local port and sequential /api/chat requests are sent to the app: they must all succeed,
+including those reusing a connection opened during an earlier request.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class ChatCompletionsHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so that the client keeps its connections alive between requests
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        body = json.dumps({
+            'id': 'chatcmpl-check',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': 'gpt-4o-mini',
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': "Garde une allure confortable, tu dois pouvoir parler."},
+                'finish_reason': 'stop'
+            }],
+            'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2}
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sequential async chat requests against a local OpenAI-compatible server")
+    parser.add_argument("--requests", type=int, default=6, help="Sequential /api/chat requests")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("localhost", 0), ChatCompletionsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # The model is created when llm_handler is imported
+    os.environ["LLM_BACKEND"] = "openai"
+    os.environ["OPENAI_BASE_URL"] = f"http://localhost:{server.server_port}/v1"
+    os.environ["OPENAI_API_KEY"] = "check"
+    workdir = tempfile.mkdtemp(prefix="pace_loop_check_")
+    os.environ["CONVERSATIONS_DB"] = os.path.join(workdir, "conversations.db")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as app_module
+
+    client = app_module.app.test_client()
+    failures = 0
+    for index in range(args.requests):
+        # Different questions, so that none is answered by the semantic cache
+        response = client.get("/api/chat", query_string={"message": f"question {index} : quelle allure pour la séance numéro {index} ?"})
+        error = None if response.status_code == 200 else (response.get_json(silent=True) or {}).get('error')
+        print(f"/api/chat {index + 1}: {response.status_code}" + (f" ({error})" if error else ""))
+        failures += response.status_code != 200
+    server.shutdown()
+
+    print(f"\n{args.requests - failures}/{args.requests} requests succeeded")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
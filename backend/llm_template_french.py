@@ -87,6 +87,113 @@ program_generation_prompt = PromptTemplate(
     ]
 )
 
+# === Template de Génération de Programme (format compact) ===
+program_generation_compact_template = """
+Vous êtes un coach de course à pied expérimenté chargé de créer un programme d'entraînement complet.
+Utilisez le profil d'athlète suivant pour créer un programme d'entraînement jusqu'au {goal_date}, date de l'objectif principal:
+
+Profil de l'Athlète :
+- Âge : {age} ans
+- Poids : {poids} kg
+- Taille : {taille} cm
+- Fréquence d'entraînement actuelle : {frequence_hebdomadaire}
+- Meilleure distance récente : {meilleure_distance_recente}
+- Objectif principal : {objectif_principal}
+- Date de l'objectif principal : {goal_date}
+- Distance cible : {distance_cible}
+- Temps cible : {chrono_cible}
+- Temps actuel sur 5km : {temps_actuel_5km}
+- Temps actuel sur 10km : {temps_actuel_10km}
+- Jours disponibles par semaine : {jours_disponibles_par_semaine}
+- Jour préféré pour la sortie longue : {jour_sortie_longue}
+
+Créez un programme d'entraînement progressif de 12 semaines suivant ces directives :
+1. Incluez {jours_disponibles_par_semaine} séances par semaine
+2. Programmez toujours la sortie longue le {jour_sortie_longue}
+3. Assurez au moins 24 heures entre les séances
+4. Incluez un mélange de : Endurance, Sortie Longue, Intervalles, et séances de Tempo
+5. Augmentez progressivement les distances et intensités
+6. Incluez une période d'affûtage dans les 2 dernières semaines
+
+Écrivez une ligne par séance, sans JSON ni mise en forme, exactement au format :
+S|AAAA-MM-JJ HH:mm|CODE|distance en km|description courte de l'entraînement
+
+Codes de type de séance :
+{type_codes}
+
+Exemple :
+S|2024-11-24 08:00|SL|12|Sortie longue en aisance respiratoire
+
+Les minutes dans l'heure doivent être par incréments de 5 (00, 05, 10, 15, 20, 25, 30, 35, 40, 45, 50, 55).
+Utilisez des heures d'entraînement réalistes basées sur la lumière du jour et les heures communes d'entraînement (par exemple, 06:00-09:00 ou 17:00-20:00).
+La date d'aujourd'hui est : {current_date}
+
+Après la dernière séance, ajoutez une brève explication au format :
+Explanation: votre explication ici
+"""
+
+program_generation_compact_prompt = PromptTemplate(
+    template=program_generation_compact_template,
+    input_variables=[
+        "age", "poids", "taille", "frequence_hebdomadaire", "meilleure_distance_recente",
+        "objectif_principal", "distance_cible", "chrono_cible", "temps_actuel_5km",
+        "temps_actuel_10km", "jours_disponibles_par_semaine", "jour_sortie_longue",
+        "current_date", "goal_date", "type_codes"
+    ]
+)
+
+# === Template de Génération d'un bloc de semaines (génération parallèle) ===
+program_block_generation_template = """
+Vous êtes un coach de course à pied expérimenté. Vous rédigez une partie d'un programme d'entraînement
+dont la planification (phases et volumes) a déjà été établie.
+
+Profil de l'Athlète :
+- Âge : {age} ans
+- Poids : {poids} kg
+- Taille : {taille} cm
+- Fréquence d'entraînement actuelle : {frequence_hebdomadaire}
+- Objectif principal : {objectif_principal}
+- Date de l'objectif principal : {goal_date}
+- Distance cible : {distance_cible}
+- Temps cible : {chrono_cible}
+- Temps actuel sur 5km : {temps_actuel_5km}
+- Temps actuel sur 10km : {temps_actuel_10km}
+- Jours disponibles par semaine : {jours_disponibles_par_semaine}
+- Jour préféré pour la sortie longue : {jour_sortie_longue}
+
+Planification complète du programme :
+{plan_overview}
+
+Rédigez UNIQUEMENT les séances des semaines suivantes, entre le {block_start} et le {block_end} inclus :
+{block_details}
+
+Directives :
+1. Incluez {jours_disponibles_par_semaine} séances par semaine
+2. Programmez toujours la sortie longue le {jour_sortie_longue}, avec la distance indiquée
+3. Assurez au moins 24 heures entre les séances
+4. Respectez le volume hebdomadaire indiqué (somme des distances) et la phase de chaque semaine
+
+Écrivez une ligne par séance, sans JSON ni mise en forme, exactement au format :
+S|AAAA-MM-JJ HH:mm|CODE|distance en km|description courte de l'entraînement
+
+Codes de type de séance :
+{type_codes}
+
+Les minutes dans l'heure doivent être par incréments de 5 (00, 05, 10, 15, 20, 25, 30, 35, 40, 45, 50, 55).
+Utilisez des heures d'entraînement réalistes (par exemple, 06:00-09:00 ou 17:00-20:00).
+La date d'aujourd'hui est : {current_date}. Ne programmez aucune séance avant cette date.
+"""
+
+program_block_generation_prompt = PromptTemplate(
+    template=program_block_generation_template,
+    input_variables=[
+        "age", "poids", "taille", "frequence_hebdomadaire", "objectif_principal",
+        "distance_cible", "chrono_cible", "temps_actuel_5km", "temps_actuel_10km",
+        "jours_disponibles_par_semaine", "jour_sortie_longue", "current_date", "goal_date",
+        "type_codes", "plan_overview", "block_start", "block_end", "block_details"
+    ]
+)
+
 suggestions_template = """
 En tant que coach de course à pied, formulez 3 réponses différentes possibles à la demande suivante.
 
@@ -0,0 +1,219 @@
+"""
+Local stand-in for the Strava API, to run the sync against without a Strava account.
+
+    python mock_strava.py --port 8090 --activities 500
+    STRAVA_API_URL=http://localhost:8090/api/v3 STRAVA_OAUTH_URL=http://localhost:8090/oauth/token \
+        python get_data_strava.py
+
+GET /mock/stats returns the requests served and the connections they came on,
+POST /mock/activities adds a new activity (as if the athlete had just run).
+Activity streams are generated at 1 Hz; every tenth activity has no heart rate.
+API requests are counted against 15-minute and daily limits (--short-window shortens the
+first one for quick runs), reported in the X-RateLimit headers and answered with a 429 beyond.
+"""
+import argparse
+import json
+import math
+import re
+import secrets
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock
+from urllib.parse import parse_qs, urlparse
+
+FIRST_START = datetime(2023, 1, 1, 7, 30, tzinfo=timezone.utc)
+
+state = {'activities': [], 'requests': 0, 'connections': 0, 'rate_limited': 0, 'usage': {}}
+limits = {'short': 100, 'daily': 1000, 'short_window': 15 * 60}
+state_lock = Lock()
+
+
+def make_activity(index, start):
+    distance = 5000 + (index * 1370) % 15000
+    moving_time = int(distance * (0.3 + (index % 7) * 0.01))
+    return {
+        'resource_state': 2,
+        'athlete': {'id': 1, 'resource_state': 1},
+        'name': f"Course {index}",
+        'distance': float(distance),
+        'moving_time': moving_time,
+        'elapsed_time': moving_time + 60,
+        'total_elevation_gain': float(index % 120),
+        'type': 'Run',
+        'sport_type': 'Run',
+        'id': 10_000_000_000 + index,
+        'start_date': start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        'start_date_local': (start + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        'timezone': '(GMT+01:00) Europe/Paris',
+        'utc_offset': 3600.0,
+        'average_speed': round(distance / moving_time, 3),
+        'average_heartrate': 140 + index % 30
+    }
+
+
+def add_activity(start=None):
+    index = len(state['activities'])
+    start = start or FIRST_START + timedelta(days=index)
+    activity = make_activity(index, start)
+    state['activities'].append(activity)
+    return activity
+
+
+def epoch(activity):
+    return int(datetime.strptime(activity['start_date'], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp())
+
+
+def make_streams(activity):
+    """Streams of an activity (key_by_type), one point per second"""
+    index = activity['id'] - 10_000_000_000
+    points = activity['elapsed_time']
+    speed = activity['distance'] / activity['moving_time']
+    streams = {
+        'time': list(range(points)),
+        'velocity_smooth': [round(speed * (1 + 0.08 * math.sin(second / 45)), 3) if second % 600 > 5 else 0.0 for second in range(points)],
+        'altitude': [round(40 + 15 * math.sin(second / 300 + index), 1) for second in range(points)],
+        'latlng': [[round(48.83 + 0.01 * math.sin(second / 600), 6), round(2.24 + 0.01 * math.cos(second / 600), 6)] for second in range(points)]
+    }
+    if index % 10 != 3:
+        streams['heartrate'] = [int(130 + 30 * second / points + 5 * math.sin(second / 30)) for second in range(points)]
+    return {key: {'data': data, 'series_type': 'time', 'original_size': points, 'resolution': 'high'} for key, data in streams.items()}
+
+
+def int_param(query, name, default=None):
+    values = query.get(name)
+    return int(values[0]) if values else default
+
+
+class MockStravaHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so that clients can keep their connections alive
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with state_lock:
+            state['connections'] += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def count_usage(self):
+        """Counts an API request in the current windows; returns (short usage, daily usage, allowed)"""
+        now = int(time.time())
+        windows = (now // limits['short_window'], now // (24 * 3600))
+        with state_lock:
+            usage = state['usage']
+            if usage.get('windows') != windows:
+                usage.update(windows=windows, short=0, daily=0)
+            allowed = usage['short'] < limits['short'] and usage['daily'] < limits['daily']
+            if allowed:
+                usage['short'] += 1
+                usage['daily'] += 1
+            else:
+                state['rate_limited'] += 1
+            return usage['short'], usage['daily'], allowed
+
+    def send_json(self, payload, status=200, usage=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if usage:
+            for prefix in ("X-RateLimit", "X-ReadRateLimit"):
+                self.send_header(f"{prefix}-Limit", f"{limits['short']},{limits['daily']}")
+                self.send_header(f"{prefix}-Usage", f"{usage[0]},{usage[1]}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        with state_lock:
+            state['requests'] += 1
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path.startswith('/api/v3/'):
+            if not self.headers.get('Authorization', '').startswith('Bearer '):
+                return self.send_json({'message': 'Authorization Error'}, 401)
+            usage = self.count_usage()
+            if not usage[2]:
+                return self.send_json({'message': 'Rate Limit Exceeded'}, 429, usage)
+            streams_path = re.fullmatch(r'/api/v3/activities/(\d+)/streams', url.path)
+            if url.path == '/api/v3/athlete/activities':
+                self.athlete_activities(query, usage)
+            elif streams_path:
+                self.activity_streams(int(streams_path.group(1)), usage)
+            else:
+                self.send_json({'message': 'Record Not Found'}, 404, usage)
+        elif url.path == '/mock/stats':
+            with state_lock:
+                self.send_json({
+                    'activities': len(state['activities']),
+                    'requests': state['requests'],
+                    'connections': state['connections'],
+                    'rate_limited': state['rate_limited']
+                })
+        else:
+            self.send_json({'message': 'Record Not Found'}, 404)
+
+    def do_POST(self):
+        with state_lock:
+            state['requests'] += 1
+        # The body (form parameters) is not used
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        url = urlparse(self.path)
+        if url.path == '/oauth/token':
+            self.send_json({
+                'token_type': 'Bearer',
+                'access_token': secrets.token_hex(20),
+                'refresh_token': secrets.token_hex(20),
+                'expires_at': int(time.time()) + 6 * 3600,
+                'expires_in': 6 * 3600
+            })
+        elif url.path == '/mock/activities':
+            with state_lock:
+                activity = add_activity(datetime.now(timezone.utc).replace(microsecond=0))
+            self.send_json(activity)
+        else:
+            self.send_json({'message': 'Record Not Found'}, 404)
+
+    def activity_streams(self, activity_id, usage):
+        with state_lock:
+            activity = next((activity for activity in state['activities'] if activity['id'] == activity_id), None)
+        if activity is None:
+            return self.send_json({'message': 'Record Not Found'}, 404, usage)
+        self.send_json(make_streams(activity), usage=usage)
+
+    def athlete_activities(self, query, usage):
+        per_page = min(int_param(query, 'per_page', 30), 200)
+        page = int_param(query, 'page', 1)
+        after = int_param(query, 'after')
+        before = int_param(query, 'before')
+
+        with state_lock:
+            activities = list(state['activities'])
+        if after is not None:
+            activities = [activity for activity in activities if epoch(activity) > after]
+        if before is not None:
+            activities = [activity for activity in activities if epoch(activity) < before]
+        # Like Strava: oldest first when paging forward from after, newest first otherwise
+        activities.sort(key=epoch, reverse=after is None)
+        self.send_json(activities[(page - 1) * per_page:page * per_page], usage=usage)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Strava API")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--activities", type=int, default=500, help="Activities of the athlete at startup")
+    parser.add_argument("--short-limit", type=int, default=100, help="Requests per short window")
+    parser.add_argument("--daily-limit", type=int, default=1000, help="Requests per day")
+    parser.add_argument("--short-window", type=int, default=15 * 60, help="Length of the short window in seconds")
+    args = parser.parse_args()
+    limits.update(short=args.short_limit, daily=args.daily_limit, short_window=args.short_window)
+
+    for _ in range(args.activities):
+        add_activity()
+    print(f"Mock Strava API on http://localhost:{args.port}/api/v3")
+    ThreadingHTTPServer(("localhost", args.port), MockStravaHandler).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import base64
+import hashlib
+import hmac
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore
+
+# Constants
+SCRYPT_N = int(os.environ.get("SCRYPT_N", 2 ** 14))  # CPU and memory cost (128 * N * R bytes per hash)
+SCRYPT_R = int(os.environ.get("SCRYPT_R", 8))
+SCRYPT_P = int(os.environ.get("SCRYPT_P", 1))
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", os.cpu_count() or 2))  # Hashes computed at the same time
+PASSWORD_HASH_QUEUE = int(os.environ.get("PASSWORD_HASH_QUEUE", 64))  # Hashes waiting for a worker before new ones are refused
+PASSWORD_HASH_WAIT = 5.0  # Seconds a request waits for room in the queue
+SALT_BYTES = 16
+# Hashes of the first version: a single SHA-256 of the password with a fixed salt
+LEGACY_SALT = "votre_sel_unique_secret"
+LEGACY_HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full"""
+    pass
+
+
+def _b64(data):
+    return base64.b64encode(data).decode("ascii")
+
+
+class PasswordHasher:
+    """
+    scrypt password hashes, computed on a fixed number of worker threads so a burst of logins
+    can't use more CPU and memory than PASSWORD_HASH_WORKERS hashes at a time (scrypt runs
+    outside the GIL). Hashes are stored as scrypt$n$r$p$salt$hash: changing the cost only
+    affects new hashes, older ones are recognized by needs_rehash.
+    """
+    def __init__(self, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, workers=PASSWORD_HASH_WORKERS, queue_size=PASSWORD_HASH_QUEUE):
+        self.n = n
+        self.r = r
+        self.p = p
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._slots = BoundedSemaphore(workers + queue_size)
+
+    def _run(self, function, *args):
+        """Runs function on the hashing workers and waits for its result"""
+        if not self._slots.acquire(timeout=PASSWORD_HASH_WAIT):
+            raise PasswordHasherBusy("Too many password hashes in progress")
+        try:
+            future = self._executor.submit(function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    @staticmethod
+    def _scrypt(password, salt, n, r, p):
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r * p + 2 ** 20)
+
+    def hash(self, password):
+        """Hashes a password with the configured cost"""
+        salt = os.urandom(SALT_BYTES)
+        digest = self._run(self._scrypt, password, salt, self.n, self.r, self.p)
+        return f"scrypt${self.n}${self.r}${self.p}${_b64(salt)}${_b64(digest)}"
+
+    def verify(self, password, stored_hash):
+        """Whether the password matches a stored hash, in the current or the legacy format"""
+        if LEGACY_HASH_PATTERN.match(stored_hash):
+            legacy_hash = hashlib.sha256((password + LEGACY_SALT).encode()).hexdigest()
+            return hmac.compare_digest(legacy_hash, stored_hash)
+        try:
+            _, n, r, p, salt, digest = stored_hash.split("$")
+            salt, digest = base64.b64decode(salt), base64.b64decode(digest)
+            n, r, p = int(n), int(r), int(p)
+        except ValueError:
+            return False
+        return hmac.compare_digest(self._run(self._scrypt, password, salt, n, r, p), digest)
+
+    def needs_rehash(self, stored_hash):
+        """Whether a stored hash is in the legacy format or uses another cost than the configured one"""
+        return not stored_hash.startswith(f"scrypt${self.n}${self.r}${self.p}$")
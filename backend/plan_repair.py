@@ -0,0 +1,139 @@
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+# Constants
+DATE_FORMAT = "%Y-%m-%d %H:%M"
+ACCEPTED_DATE_FORMATS = [DATE_FORMAT, "%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%d/%m/%Y %H:%M", "%Y-%m-%d %Hh%M"]
+SLOT_MINUTES = 5
+MIN_GAP = timedelta(hours=6)  # Same rule as INTERVAL_BETWEEN_SESSIONS in session_manager
+EARLIEST_HOUR = 6  # Sessions are only shifted to slots between 06:00...
+LATEST_HOUR = 21  # ...and 21:00
+MAX_SHIFT = timedelta(days=2)  # Sessions with no free slot within this range are dropped
+MAX_WEEKLY_INCREASE = 0.3  # Over the highest of the previous 3 weeks
+RACE_SESSION_TYPE = "Course"  # Its distance is the race's, never scaled
+
+
+def parse_session_date(value):
+    """Parses the session date formats seen in model outputs, or returns None"""
+    if not isinstance(value, str):
+        return None
+    for date_format in ACCEPTED_DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), date_format)
+        except ValueError:
+            continue
+    return None
+
+def snap_to_slot(date):
+    """Rounds a date to the nearest 5-minute slot"""
+    minutes = date.hour * 60 + date.minute + (1 if date.second >= 30 else 0)
+    snapped = round(minutes / SLOT_MINUTES) * SLOT_MINUTES
+    return datetime(date.year, date.month, date.day) + timedelta(minutes=snapped)
+
+def _parse_distance(value):
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        distance = float(str(value).lower().replace("km", "").replace(",", ".").strip())
+    except ValueError:
+        return None
+    return int(distance) if distance.is_integer() else distance
+
+def _is_free(taken, date, min_gap):
+    """Whether date is at least min_gap away from every date of the sorted list taken"""
+    position = bisect_left(taken, date)
+    if position < len(taken) and taken[position] - date < min_gap:
+        return False
+    if position > 0 and date - taken[position - 1] < min_gap:
+        return False
+    return True
+
+def _in_daytime(date):
+    return EARLIEST_HOUR <= date.hour and (date.hour, date.minute) <= (LATEST_HOUR, 0)
+
+def find_free_slot(taken, wanted, min_gap=MIN_GAP):
+    """
+    The closest 5-minute slot to wanted (earlier or later, within MAX_SHIFT and daytime hours)
+    at least min_gap away from the sorted dates taken, or None.
+    """
+    if _is_free(taken, wanted, min_gap):
+        return wanted
+    step = timedelta(minutes=SLOT_MINUTES)
+    for index in range(1, int(MAX_SHIFT / step) + 1):
+        for candidate in (wanted + index * step, wanted - index * step):
+            if _in_daytime(candidate) and _is_free(taken, candidate, min_gap):
+                return candidate
+    return None
+
+def _is_race(session):
+    return str(session.get("type_de_seance", "")).strip().lower() == RACE_SESSION_TYPE.lower()
+
+def _clamp_weekly_volume(sessions, repairs):
+    """
+    Scales down the sessions of weeks whose volume jumps by more than MAX_WEEKLY_INCREASE.
+    The race can't change distance: it is left out of the weekly volumes and never scaled.
+    """
+    weeks = {}
+    for session in sessions:
+        date = datetime.strptime(session["date"], DATE_FORMAT)
+        weeks.setdefault(date.date() - timedelta(days=date.weekday()), []).append(session)
+
+    # The first week is usually partial (the plan starts mid-week), so it is no reference
+    history = []
+    for week_start in sorted(weeks)[1:]:
+        week_sessions = [session for session in weeks[week_start] if not _is_race(session)]
+        volume = sum(session["distance"] for session in week_sessions)
+        if history:
+            limit = max(history[-3:]) * (1 + MAX_WEEKLY_INCREASE)
+            if volume > limit:
+                ratio = limit / volume
+                for session in week_sessions:
+                    distance = round(session["distance"] * ratio * 2) / 2
+                    session["distance"] = int(distance) if float(distance).is_integer() else distance
+                repairs.append(f"Week of {week_start}: volume reduced from {volume:g} to {limit:.0f} km")
+                volume = sum(session["distance"] for session in week_sessions)
+        history.append(volume)
+
+def repair_sessions(sessions, fixed_sessions=(), min_gap=MIN_GAP, clamp_volume=True):
+    """
+    Fixes the usual defects of generated sessions locally instead of asking the model again:
+    dates are normalized and snapped to 5-minute slots, sessions too close to another one are
+    shifted to the nearest free slot and weekly volume jumps are clamped.
+    fixed_sessions are kept as they are and only block their slots.
+
+    Returns:
+    - tuple: (repaired copies of the sessions sorted by date, list of repairs made)
+      Sessions with an unreadable date or distance, or without a free slot, are dropped.
+    """
+    repairs = []
+    candidates = []
+    for session in sessions:
+        date = parse_session_date(session.get("date"))
+        distance = _parse_distance(session.get("distance"))
+        if date is None or distance is None or distance <= 0:
+            repairs.append(f"Dropped session with invalid date or distance: {session.get('date')}")
+            continue
+        snapped = snap_to_slot(date)
+        if snapped.strftime(DATE_FORMAT) != session["date"]:
+            repairs.append(f"{session['date']} moved to the slot {snapped.strftime(DATE_FORMAT)}")
+        candidates.append((snapped, {**session, "distance": distance}))
+
+    taken = sorted(
+        date for date in (parse_session_date(session["date"]) for session in fixed_sessions) if date
+    )
+    repaired = []
+    for wanted, session in sorted(candidates, key=lambda candidate: candidate[0]):
+        slot = find_free_slot(taken, wanted, min_gap)
+        if slot is None:
+            repairs.append(f"Dropped session {wanted.strftime(DATE_FORMAT)}: no free slot nearby")
+            continue
+        if slot != wanted:
+            repairs.append(f"{wanted.strftime(DATE_FORMAT)} shifted to {slot.strftime(DATE_FORMAT)} to avoid an overlap")
+        insort(taken, slot)
+        session["date"] = slot.strftime(DATE_FORMAT)
+        repaired.append(session)
+
+    repaired.sort(key=lambda x: x["date"])
+    if clamp_volume:
+        _clamp_weekly_volume(repaired, repairs)
+    return repaired, repairs
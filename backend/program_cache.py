@@ -0,0 +1,136 @@
+import json
+import hashlib
+import os
+import re
+import unicodedata
+from datetime import datetime, timedelta
+
+# Constants
+TEMPLATE_FOLDER = "program_templates"
+CHRONO_BUCKET_MINUTES = 5  # Target times within the same 5 minutes share a template
+
+
+def _normalize_text(value):
+    """Lowercase, accent-free, whitespace-collapsed representation of a profile field"""
+    text = unicodedata.normalize("NFKD", str(value)).encode("ascii", "ignore").decode("ascii")
+    return " ".join(text.lower().split())
+
+def parse_distance_km(value):
+    """Parses a distance such as "21.1 km" or "semi marathon" into kilometers"""
+    text = _normalize_text(value)
+    if "semi" in text or "half" in text:
+        return 21.1
+    if "marathon" in text:
+        return 42.2
+    match = re.search(r"\d+(?:[.,]\d+)?", text)
+    if not match:
+        return text
+    return round(float(match.group(0).replace(",", ".")), 1)
+
+def _parse_chrono_minutes(value):
+    """Parses a target time such as "1h50", "1:50:00" or "55 minutes" into bucketed minutes"""
+    text = _normalize_text(value)
+    numbers = [int(n) for n in re.findall(r"\d+", text)]
+    if not numbers:
+        return text
+    # "1:50" reads as hours:minutes, "45:30" as minutes:seconds
+    if "h" in text or len(numbers) == 3 or (len(numbers) == 2 and ":" in text and numbers[0] < 6):
+        minutes = numbers[0] * 60 + (numbers[1] if len(numbers) > 1 else 0)
+    else:
+        minutes = numbers[0]
+    return round(minutes / CHRONO_BUCKET_MINUTES) * CHRONO_BUCKET_MINUTES
+
+def week_start(date):
+    """Monday 00:00 of the week containing date"""
+    return datetime(date.year, date.month, date.day) - timedelta(days=date.weekday())
+
+def _goal_week_start(profile_data):
+    return week_start(datetime.strptime(profile_data["goal_date"], "%Y-%m-%d"))
+
+def profile_fingerprint(profile_data, current_date):
+    """
+    Returns a fingerprint of the profile fields that shape a generated plan.
+    The number of weeks until the goal is part of it, so a template always spans the right length.
+    """
+    weeks_to_goal = (_goal_week_start(profile_data) - week_start(current_date)).days // 7
+    key = {
+        "objectif_principal": _normalize_text(profile_data["objectif_principal"]),
+        "distance_cible": parse_distance_km(profile_data["distance_cible"]),
+        "chrono_cible": _parse_chrono_minutes(profile_data["chrono_cible"]),
+        "jours_disponibles_par_semaine": int(profile_data["jours_disponibles_par_semaine"]),
+        "jour_sortie_longue": _normalize_text(profile_data["jour_sortie_longue"]),
+        "weeks_to_goal": weeks_to_goal
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:32]
+
+def get_template_path(fingerprint):
+    """Get the template file path for a given profile fingerprint"""
+    return os.path.join(TEMPLATE_FOLDER, f"{fingerprint}.json")
+
+def store_program_template(profile_data, sessions, explanation=None, current_date=None):
+    """
+    Stores a generated program as a template, with each session dated relative to the goal week
+    (day offset from its Monday and time of day) so it can be re-anchored for another athlete.
+    """
+    current_date = current_date or datetime.now()
+    try:
+        goal_week = _goal_week_start(profile_data)
+        fingerprint = profile_fingerprint(profile_data, current_date)
+    except (KeyError, ValueError, TypeError):
+        return None
+
+    template_sessions = []
+    for session in sessions:
+        session_date = datetime.strptime(session["date"], "%Y-%m-%d %H:%M")
+        template_sessions.append({
+            "day_offset": (session_date.date() - goal_week.date()).days,
+            "time": session_date.strftime("%H:%M"),
+            "type_de_seance": session["type_de_seance"],
+            "distance": session["distance"],
+            "description": session["description"]
+        })
+
+    os.makedirs(TEMPLATE_FOLDER, exist_ok=True)
+    template_path = get_template_path(fingerprint)
+    tmp_path = f"{template_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump({"explanation": explanation, "sessions": template_sessions}, file, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, template_path)
+    return fingerprint
+
+def get_cached_program(profile_data, current_date=None):
+    """
+    Returns (sessions, explanation) from a template matching the profile, re-anchored on the
+    athlete's goal week, or None on a miss. Sessions already in the past are dropped.
+    """
+    current_date = current_date or datetime.now()
+    try:
+        goal_week = _goal_week_start(profile_data)
+        template_path = get_template_path(profile_fingerprint(profile_data, current_date))
+    except (KeyError, ValueError, TypeError):
+        return None
+
+    if not os.path.exists(template_path):
+        return None
+    try:
+        with open(template_path, 'r', encoding='utf-8') as file:
+            template = json.load(file)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+    sessions = []
+    for template_session in template["sessions"]:
+        hours, minutes = map(int, template_session["time"].split(":"))
+        session_date = goal_week + timedelta(days=template_session["day_offset"], hours=hours, minutes=minutes)
+        if session_date <= current_date:
+            continue
+        sessions.append({
+            "date": session_date.strftime("%Y-%m-%d %H:%M"),
+            "type_de_seance": template_session["type_de_seance"],
+            "distance": template_session["distance"],
+            "description": template_session["description"]
+        })
+
+    if not sessions:
+        return None
+    return sessions, template.get("explanation")
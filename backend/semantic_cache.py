@@ -0,0 +1,182 @@
+import os
+import re
+import zlib
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+from command_parser import normalize
+
+# Constants
+# Cosine similarity needed for a hit, calibrated with semantic_cache_calibration.py: paraphrases score
+# 0.87 and above, close questions with another answer 0.75 at most
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", 0.8))
+SEMANTIC_CACHE_SIZE = int(os.environ.get("SEMANTIC_CACHE_SIZE", 32))  # Answers kept per conversation
+SEMANTIC_CACHE_CONVERSATIONS = 500  # Conversations whose answers are kept in memory
+MIN_CONTENT_TERMS = 2  # Shorter messages ("oui", "ok merci") depend on the conversation, they are never cached
+VECTOR_DIMENSIONS = 4096  # Content terms are hashed into this many dimensions, enough to make collisions rare
+# Words that don't change the answer
+STOP_WORDS = frozenset("""
+a ai au autant aux avec c ca ce cela ces cet cette choisir d de des dois doit du en est et fais faire fait il ils j je
+l la le les leur m ma me mes mon ok on ou par peux peut pour puis qu que quel quelle quelles quels qui
+quoi s sa se ses son stp suis svp t ta tant te tes ton tres trop tu un une vos votre y
+am an are at be best can could do does for how i in is it me my of on please really should the to useful what which
+with would you your
+""".split())
+STEM_SUFFIXES = ("ements", "ement", "ees", "ee", "es", "er", "ez", "e", "s", "ing", "ed")
+# Stems of training words with the same meaning
+SYNONYMS = {
+    "kilometr": "km", "leger": "alleg", "lighter": "alleg", "easier": "alleg", "douleur": "mal", "pain": "mal",
+    "progress": "amelior", "improv": "amelior", "courir": "run", "cour": "run", "session": "seanc"
+}
+# Words that change the answer however similar the rest of the question is
+KEY_TERMS_PATTERN = (r"\b(\d+(?:[.,]\d+)?|lundi|mardi|mercredi|jeudi|vendredi|samedi|dimanche|monday|tuesday|wednesday|"
+                     r"thursday|friday|saturday|sunday|aujourd'?hui|demain|apres-demain|hier|today|tomorrow|yesterday|"
+                     r"prochaine|derniere|next|last|n'|ne|pas|plus|jamais|aucune?|not|no|never|\w+n't|cannot)\b")
+# Program edits ("décale", "supprime", "remplace"...), in any form: their answer depends on the edit, never reused
+EDIT_WORDS_PATTERN = (r"\b(deplac|decal|boug|repouss|supprim|annul|enlev|retir|effac|remplac|modifi|chang|ajout|rajout|"
+                      r"raccourc|allong|rallong|alleg|move|reschedul|shift|postpon|delete|remov|cancel|skip|drop|replac|"
+                      r"edit|shorten|lengthen)\w*")
+
+
+def _stem(word):
+    for suffix in STEM_SUFFIXES:
+        if len(word) - len(suffix) >= 3 and word.endswith(suffix):
+            word = word[:-len(suffix)]
+            # running -> runn -> run
+            if suffix == "ing" and word[-1] == word[-2]:
+                word = word[:-1]
+            break
+    stem = word[:8]
+    return SYNONYMS.get(stem, stem)
+
+def content_terms(message):
+    """
+    Stems of the words of the normalized message (accents, case and punctuation removed) that can
+    change the answer: "je suis fatigué, allège jeudi" and "trop fatigué, séance plus légère jeudi ?"
+    both give fatigu, alleg, jeudi (and seanc).
+    """
+    words = re.sub(r"[^a-z0-9]", " ", normalize(message)).split()
+    return {_stem(word) for word in words if word not in STOP_WORDS}
+
+def vectorize(message):
+    """L2-normalized vector of the content terms of the message"""
+    vector = np.zeros(VECTOR_DIMENSIONS, dtype=np.float32)
+    for term in content_terms(message):
+        vector[zlib.crc32(term.encode()) % VECTOR_DIMENSIONS] = 1
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def is_cacheable(message):
+    """
+    Whether the message says enough to be answered without the rest of the conversation,
+    and asks no program edit
+    """
+    return len(content_terms(message)) >= MIN_CONTENT_TERMS and not re.search(EDIT_WORDS_PATTERN, normalize(message))
+
+def key_terms(message):
+    """Days, numbers and negations of the message: a cached answer is only reused when they are the same"""
+    return frozenset(re.findall(KEY_TERMS_PATTERN, normalize(message)))
+
+
+class _ConversationAnswers:
+    """
+    Answers of one conversation for one program version, with their message vectors as the rows of a
+    matrix (grown by doubling, then used as a ring buffer once it reaches its capacity)
+    """
+    def __init__(self, version, capacity):
+        self.version = version
+        self.capacity = capacity
+        self.vectors = np.zeros((min(8, capacity), VECTOR_DIMENSIONS), dtype=np.float32)
+        self.answers = [None] * capacity
+        self.key_terms = [None] * capacity
+        self.count = 0
+        self.next_index = 0
+
+    def nearest(self, vector, terms):
+        """(index, similarity) of the closest stored message with the same key terms"""
+        similarities = self.vectors[:self.count] @ vector
+        for index in np.argsort(similarities)[::-1]:
+            if self.key_terms[index] == terms:
+                return int(index), float(similarities[index])
+        return None, 0.0
+
+    def add(self, vector, terms, answer):
+        if self.next_index == len(self.vectors):
+            grown = np.zeros((min(2 * len(self.vectors), self.capacity), VECTOR_DIMENSIONS), dtype=np.float32)
+            grown[:len(self.vectors)] = self.vectors
+            self.vectors = grown
+        self.vectors[self.next_index] = vector
+        self.answers[self.next_index] = answer
+        self.key_terms[self.next_index] = terms
+        self.next_index = (self.next_index + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+
+class SemanticCache:
+    """
+    Reuses read-only coach answers (no program edit) for questions worded differently.
+    Answers are scoped by conversation, (user token, conversation id), since a reply may rely on
+    what was said before, and by program version: once the program changes, the previous
+    answers may describe a stale plan, so they are all dropped.
+    """
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, capacity=SEMANTIC_CACHE_SIZE, max_conversations=SEMANTIC_CACHE_CONVERSATIONS):
+        self.threshold = threshold
+        self.capacity = capacity
+        self.max_conversations = max_conversations
+        self._conversations = OrderedDict()  # (user token, conversation id) -> _ConversationAnswers
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _scope(self, conversation, version, create=False):
+        entry = self._conversations.get(conversation)
+        if entry is not None and entry.version != version:
+            del self._conversations[conversation]
+            entry = None
+        if entry is None and create:
+            entry = _ConversationAnswers(version, self.capacity)
+            self._conversations[conversation] = entry
+            while len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+        if entry is not None:
+            self._conversations.move_to_end(conversation)
+        return entry
+
+    def get(self, conversation, version, message):
+        """Returns the answer of the most similar question above the threshold, or None"""
+        if not is_cacheable(message):
+            return None
+        vector, terms = vectorize(message), key_terms(message)
+        with self._lock:
+            entry = self._scope(conversation, version)
+            if entry is not None and entry.count:
+                index, similarity = entry.nearest(vector, terms)
+                if similarity >= self.threshold:
+                    self.hits += 1
+                    return entry.answers[index]
+            self.misses += 1
+            return None
+
+    def put(self, conversation, version, message, answer):
+        """Stores a read-only answer"""
+        if not is_cacheable(message):
+            return
+        vector, terms = vectorize(message), key_terms(message)
+        with self._lock:
+            self._scope(conversation, version, create=True).add(vector, terms, answer)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "conversations": len(self._conversations),
+                "threshold": self.threshold
+            }
+
+
+semantic_cache = SemanticCache()
@@ -0,0 +1,96 @@
+"""
+Calibration of the semantic cache threshold on labelled question pairs.
+
+    python semantic_cache_calibration.py
+
+Paraphrases must have the same answer and score above the threshold; the other pairs are close
+wordings with different answers and must score below it. Pairs are scored as the cache compares
+them: a pair whose key terms (days, numbers, negations) differ, or whose second message asks for
+a program edit, is never matched and scores 0.
+"""
+import argparse
+import os
+import sys
+
+PARAPHRASES = [
+    ("je suis fatigué, je cours quand même jeudi ?", "trop fatigué, est-ce que je cours quand même jeudi"),
+    ("quelle allure pour ma prochaine sortie longue ?", "à quelle allure courir ma prochaine sortie longue"),
+    ("quelle allure pour ma sortie longue ?", "à quelle allure faire la sortie longue"),
+    ("combien de km cette semaine ?", "combien de kilomètres je cours cette semaine"),
+    ("comment m'échauffer avant le fractionné ?", "quel échauffement avant les fractionnés"),
+    ("je dois manger quoi avant une sortie longue", "que manger avant la sortie longue ?"),
+    ("j'ai mal au genou, que faire ?", "douleur au genou, je fais quoi"),
+    ("c'est quoi une séance de tempo ?", "qu'est-ce qu'une séance tempo"),
+    ("est-ce que je peux courir avec des courbatures ?", "courir avec des courbatures c'est ok ?"),
+    ("combien de temps de récupération après le semi ?", "récupération après un semi, combien de temps ?"),
+    ("pourquoi autant d'endurance fondamentale ?", "pourquoi il y a tant d'endurance fondamentale"),
+    ("quelle fréquence cardiaque en endurance ?", "à quelle fréquence cardiaque courir en endurance"),
+    ("comment améliorer ma VMA ?", "comment je peux progresser en VMA"),
+    ("quelles chaussures pour le trail ?", "quelles chaussures choisir pour faire du trail"),
+    ("what pace for my long run?", "what pace should I run my long run at"),
+    ("how should I warm up before intervals?", "best warm up before an interval session"),
+    ("should I stretch after running?", "is stretching after a run useful"),
+]
+DIFFERENT_ANSWERS = [
+    ("quelle allure en endurance ?", "quelle allure en tempo ?"),
+    ("quelle allure pour ma sortie longue ?", "quelle distance pour ma sortie longue ?"),
+    ("quelle allure pour le marathon ?", "quelle allure pour le semi ?"),
+    ("comment m'échauffer avant le fractionné ?", "comment récupérer après le fractionné ?"),
+    ("que manger avant une sortie longue", "que manger après une sortie longue"),
+    ("j'ai mal au genou, que faire ?", "j'ai mal au tendon d'achille, que faire ?"),
+    ("quelle fréquence cardiaque en endurance ?", "quelle fréquence cardiaque en tempo ?"),
+    ("combien de km cette semaine ?", "combien de séances cette semaine ?"),
+    ("c'est quoi une séance de tempo ?", "c'est quoi une séance de fartlek ?"),
+    ("est-ce que je peux courir avec des courbatures ?", "est-ce que je peux courir avec de la fièvre ?"),
+    ("comment améliorer ma VMA ?", "comment améliorer mon endurance ?"),
+    ("quelles chaussures pour le trail ?", "quelles chaussures pour la route ?"),
+    ("je suis fatigué, allège ma prochaine séance", "je suis en forme, rallonge ma prochaine séance"),
+    ("what pace for my long run?", "what pace for my intervals?"),
+    ("should I stretch after running?", "should I stretch before running?"),
+    ("how many rest days per week?", "how many runs per week?"),
+    ("je peux courir demain ?", "je ne peux pas courir demain"),
+    ("je peux courir demain ?", "je peux plus courir demain"),
+    ("je peux courir demain ?", "je ne peux pas courir demain, décale"),
+    ("est-ce que je dois m'étirer après la séance ?", "je ne dois jamais m'étirer après la séance ?"),
+    ("can I run tomorrow?", "I can't run tomorrow"),
+    ("can I run tomorrow?", "I cannot run tomorrow, move it"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Semantic cache threshold calibration")
+    parser.add_argument("--verbose", action="store_true", help="Print the score of every pair")
+    args = parser.parse_args()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from semantic_cache import SEMANTIC_CACHE_THRESHOLD, is_cacheable, key_terms, vectorize
+
+    def score(first, second):
+        if key_terms(first) != key_terms(second) or not is_cacheable(second):
+            return 0.0
+        return float(vectorize(first) @ vectorize(second))
+
+    def scores(pairs):
+        return [(score(first, second), first, second) for first, second in pairs]
+
+    paraphrases = scores(PARAPHRASES)
+    different = scores(DIFFERENT_ANSWERS)
+    if args.verbose:
+        for label, pairs in (("paraphrase", paraphrases), ("different", different)):
+            for score, first, second in sorted(pairs):
+                print(f"{label:<10} {score:.3f}  {first} / {second}")
+        print()
+
+    lowest_paraphrase = min(score for score, _, _ in paraphrases)
+    highest_different = max(score for score, _, _ in different)
+    missed = sum(score < SEMANTIC_CACHE_THRESHOLD for score, _, _ in paraphrases)
+    wrong = sum(score >= SEMANTIC_CACHE_THRESHOLD for score, _, _ in different)
+    print(f"Paraphrases: lowest score {lowest_paraphrase:.3f}, {missed}/{len(paraphrases)} missed")
+    print(f"Different answers: highest score {highest_different:.3f}, {wrong}/{len(different)} reused")
+    if lowest_paraphrase > highest_different:
+        print(f"Thresholds in ({highest_different:.3f}, {lowest_paraphrase:.3f}] separate the pairs, current {SEMANTIC_CACHE_THRESHOLD}")
+    else:
+        print(f"No threshold separates the pairs, current {SEMANTIC_CACHE_THRESHOLD}")
+
+
+if __name__ == "__main__":
+    main()
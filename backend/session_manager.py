@@ -1,18 +1,80 @@
 import json
-from datetime import datetime
+import hashlib
+import secrets
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime, timedelta
+from threading import Lock, RLock
 from profile_runner import profile_data
-from llm_handler import generate_training_program
+from llm_handler import generate_training_program, agenerate_training_program
+from program_cache import get_cached_program, store_program_template
+from plan_repair import repair_sessions
 import os
 
 # Constants
 LIST_ACTIONS = ["create", "remove"]
 INTERVAL_BETWEEN_SESSIONS = 6 * 60 * 60  # 6 hours in seconds
 BASE_FOLDER = "profiles"
+CHANGE_LOG_SIZE = 50  # Number of program versions for which diffs are kept
+
+# In-memory program versions, so conditional requests can be answered without reading the profile file
+_program_versions = {}
+
+# Epoch of each program, drawn when it is created and saved with it: versions restart from 0 when a
+# program is deleted then recreated after a restart, the epoch keeps their ETags apart
+_program_epochs = {}
+_versions_lock = Lock()
+
+# Per-user locks serializing read-modify-write updates of a profile file
+_user_locks = {}
+
+# Sorted session index per user, rebuilt when the program version changes
+_session_indexes = {}
+
+# Recent diffs per user: deque of (version, changes), changes is None when the save is not a diff
+_program_changes = {}
 
 class SessionValidationError(Exception):
     """Custom exception for session validation errors"""
     pass
 
+class SessionIndex:
+    """
+    Sessions of one program version sorted by date.
+    Dates are "%Y-%m-%d %H:%M" strings, whose lexical order is chronological, so they can be bisected directly.
+    """
+    def __init__(self, version, sessions):
+        self.version = version
+        self.sessions = sorted(sessions, key=lambda x: x["date"])
+        self.dates = [session["date"] for session in self.sessions]
+        self._next_position = 0
+        self._lock = Lock()
+
+    def window(self, start_key=None, end_key=None):
+        """Returns the (start, end) positions of sessions with start_key <= date < end_key"""
+        start = bisect_left(self.dates, start_key) if start_key else 0
+        end = bisect_left(self.dates, end_key) if end_key else len(self.dates)
+        return start, max(start, end)
+
+    def next_session(self, now_key):
+        """
+        Returns the first session at or after now_key.
+        Time only moves forward, so the search starts from the position found by the previous call.
+        """
+        with self._lock:
+            low = self._next_position
+            if low > 0 and self.dates[low - 1] >= now_key:
+                low = 0
+            self._next_position = bisect_left(self.dates, now_key, low)
+            if self._next_position < len(self.sessions):
+                return self.sessions[self._next_position]
+            return None
+
+def get_user_lock(user_token):
+    """Returns the lock guarding updates of a user's profile file"""
+    with _versions_lock:
+        return _user_locks.setdefault(user_token, RLock())
+
 def get_profile_path(user_token):
     """Get the profile file path for a given user token"""
     return os.path.join(BASE_FOLDER, f"{user_token}.json")
@@ -20,41 +82,78 @@ def get_profile_path(user_token):
 def initialize_or_load_program(user_token):
     """Initialize new program or load existing one"""
     try:
-        # Try to load existing program
-        existing_program = load_program(user_token)
+        existing = existing_program_result(user_token)
+        if existing:
+            return existing
         
-        # Check if the program has actual content
-        if existing_program and "profile" in existing_program and "sessions" in existing_program:
-            if existing_program["sessions"]:
-                return {
-                    'success': True,
-                    'profile': existing_program["profile"],
-                    'program': existing_program["sessions"],
-                    'explanation': "Programme chargé depuis le fichier existant.",
-                    'isNew': False
-                }
-        
-        # If no valid existing program, create new one
-        program, explanation, _ = generate_training_program(profile_data)
-        if program:
-            create_program(profile_data, program, user_token)
-            return {
-                'success': True,
-                'profile': profile_data,
-                'program': program,
-                'explanation': explanation,
-                'isNew': True
-            }
+        # If no valid existing program, reuse a plan generated for a similar profile or create a new one
+        cached = get_cached_program(profile_data)
+        if cached:
+            program, explanation = cached
+        else:
+            program, explanation, _ = generate_training_program(profile_data)
+            if program:
+                store_program_template(profile_data, program, explanation)
+        return new_program_result(user_token, program, explanation)
+    except Exception as e:
         return {
             'success': False,
-            'error': 'Failed to generate program'
+            'error': str(e)
         }
+
+async def ainitialize_or_load_program(user_token):
+    """Async version of initialize_or_load_program: the generation is awaited"""
+    try:
+        existing = existing_program_result(user_token)
+        if existing:
+            return existing
+        
+        cached = get_cached_program(profile_data)
+        if cached:
+            program, explanation = cached
+        else:
+            program, explanation, _ = await agenerate_training_program(profile_data)
+            if program:
+                store_program_template(profile_data, program, explanation)
+        return new_program_result(user_token, program, explanation)
     except Exception as e:
         return {
             'success': False,
             'error': str(e)
         }
 
+def existing_program_result(user_token):
+    """The user's program if it has sessions, else None"""
+    existing_program = load_program(user_token)
+    
+    # Check if the program has actual content
+    if existing_program and "profile" in existing_program and "sessions" in existing_program:
+        if existing_program["sessions"]:
+            return {
+                'success': True,
+                'profile': existing_program["profile"],
+                'program': existing_program["sessions"],
+                'explanation': "Programme chargé depuis le fichier existant.",
+                'isNew': False
+            }
+    return None
+
+def new_program_result(user_token, program, explanation):
+    """Saves a new program for the user"""
+    if program:
+        create_program(profile_data, program, user_token)
+        return {
+            'success': True,
+            'profile': profile_data,
+            'program': program,
+            'explanation': explanation,
+            'isNew': True
+        }
+    return {
+        'success': False,
+        'error': 'Failed to generate program'
+    }
+
 def load_program(user_token):
     """Loads the training program from the user's profile file"""
     profile_path = get_profile_path(user_token)
@@ -65,15 +164,22 @@ def load_program(user_token):
         }
     
     try:
-        with open(profile_path, 'r', encoding='utf-8') as file:
-            return json.load(file)
+        # Read under the user's lock, so the version recorded is never that of a file being replaced
+        with get_user_lock(user_token):
+            with open(profile_path, 'r', encoding='utf-8') as file:
+                program_data = json.load(file)
+            _record_version(user_token, program_data.get("version", 0), program_data.get("epoch", ""))
+        return program_data
     except json.JSONDecodeError:
         raise ValueError("Invalid JSON format in profile file")
     except Exception as e:
         raise Exception(f"Error loading profile: {str(e)}")
 
-def save_program(program_data, user_token):
-    """Saves the training program to the user's profile file"""
+def save_program(program_data, user_token, changes=None):
+    """
+    Saves the training program to the user's profile file.
+    changes ({'added': [...], 'removed': [...]}) records the diff from the previous version, if known.
+    """
     try:
         sorted_program = program_data.copy()
         
@@ -83,9 +189,24 @@ def save_program(program_data, user_token):
                 key=lambda x: datetime.strptime(x["date"], "%Y-%m-%d %H:%M")
             )
         
-        profile_path = get_profile_path(user_token)
-        with open(profile_path, 'w', encoding='utf-8') as file:
-            json.dump(sorted_program, file, indent=4, ensure_ascii=False)
+        with get_user_lock(user_token):
+            version = get_program_version(user_token) + 1
+            sorted_program["version"] = version
+            # A new program gets a new epoch, updates of an existing one keep it
+            sorted_program.setdefault("epoch", secrets.token_hex(8))
+            
+            # Write then rename, so that concurrent readers never see a partial file
+            profile_path = get_profile_path(user_token)
+            tmp_path = f"{profile_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(sorted_program, file, indent=4, ensure_ascii=False)
+            os.replace(tmp_path, profile_path)
+            
+            with _versions_lock:
+                _program_versions[user_token] = version
+                _program_epochs[user_token] = sorted_program["epoch"]
+                log = _program_changes.setdefault(user_token, deque(maxlen=CHANGE_LOG_SIZE))
+                log.append((version, changes))
             
     except Exception as e:
         raise Exception(f"Error saving profile: {str(e)}")
@@ -107,77 +228,141 @@ def create_program(profile_data, sessions, user_token):
 # verify_json_action and verify_json_overlap remain unchanged as they don't need user_token
 
 def apply_changes(json_data, user_token):
-    """Applies changes to a specific user's program"""
-    program_data = load_program(user_token)
-    stored_sessions = program_data["sessions"]
-    
-    for action in json_data:
-        error_message = verify_json_action(action)
-        if error_message:
-            raise SessionValidationError(f"Invalid JSON data: {error_message}")
-
-        if action["type_action"] == "create":
-            stored_sessions.append({
-                "date": action["date"],
-                "type_de_seance": action["type_de_seance"],
-                "distance": action["distance"],
-                "description": action["description"]
-            })
-        elif action["type_action"] == "remove":
-            stored_sessions = [session for session in stored_sessions if session["date"] != action["date"]]
-
-    error_message = verify_json_overlap(stored_sessions)
-    if error_message:
-        raise SessionValidationError(error_message)
+    """
+    Applies changes to a specific user's program.
+    Returns (program_data, repairs): repairs lists the created sessions moved to another slot,
+    so the reply to the user can say where they actually are.
+    """
+    with get_user_lock(user_token):
+        program_data = load_program(user_token)
+        stored_sessions = program_data["sessions"]
+        original_sessions = list(stored_sessions)
+        created_sessions = []
     
-    program_data["sessions"] = stored_sessions
-    save_program(program_data, user_token)
+        for action in json_data:
+            error_message = verify_json_action(action)
+            if error_message:
+                raise SessionValidationError(f"Invalid JSON data: {error_message}")
+
+            if action["type_action"] == "create":
+                new_session = {
+                    "date": action["date"],
+                    "type_de_seance": action["type_de_seance"],
+                    "distance": action["distance"],
+                    "description": action["description"]
+                }
+                stored_sessions.append(new_session)
+                created_sessions.append(new_session)
+            elif action["type_action"] == "remove":
+                stored_sessions = [session for session in stored_sessions if session["date"] != action["date"]]
+
+        # Created sessions overlapping another one are shifted to the nearest free slot,
+        # the sessions already in the program stay where they are
+        created_ids = {id(session) for session in created_sessions}
+        kept_sessions = [session for session in stored_sessions if id(session) not in created_ids]
+        new_sessions = [session for session in stored_sessions if id(session) in created_ids]
+        repaired_sessions, repairs = repair_sessions(
+            new_sessions,
+            fixed_sessions=kept_sessions,
+            min_gap=timedelta(seconds=INTERVAL_BETWEEN_SESSIONS),
+            clamp_volume=False
+        )
+        if len(repaired_sessions) < len(new_sessions):
+            raise SessionValidationError(f"Invalid sessions: {'; '.join(repairs)}")
+        stored_sessions = kept_sessions + repaired_sessions
     
-    return program_data
+        # Net diff of the applied actions: sessions created and still present, original sessions gone
+        kept_ids = {id(session) for session in kept_sessions}
+        changes = {
+            "added": repaired_sessions,
+            "removed": [session["date"] for session in original_sessions if id(session) not in kept_ids]
+        }
+    
+        program_data["sessions"] = stored_sessions
+        save_program(program_data, user_token, changes)
+    
+        return program_data, repairs
 
-def filter_sessions_by_date(user_token, from_date=None, to_date=None):
-    """Filters sessions by date range for a specific user"""
-    program_data = load_program(user_token)
-    sessions = program_data["sessions"]
-    filtered = []
+def get_session_index(user_token):
+    """Returns the sorted session index of a user's current program version"""
+    version = get_program_version(user_token)
+    with _versions_lock:
+        index = _session_indexes.get(user_token)
+    if index is not None and index.version == version:
+        return index
     
-    start_date = None
-    end_date = None
+    program_data = load_program(user_token)
+    index = SessionIndex(program_data.get("version", version), program_data["sessions"])
+    with _versions_lock:
+        _session_indexes[user_token] = index
+    return index
+
+def _parse_filter_dates(from_date, to_date):
+    """Parses dd-mm-yyyy bounds into index keys (start inclusive, end exclusive)"""
+    start_key = None
+    end_key = None
     
     if from_date:
         try:
-            start_date = datetime.strptime(from_date, "%d-%m-%Y")
+            start_key = datetime.strptime(from_date, "%d-%m-%Y").strftime("%Y-%m-%d")
         except ValueError:
             raise ValueError("Invalid from_date format. Use dd-mm-yyyy")
             
     if to_date:
         try:
-            end_date = datetime.strptime(to_date, "%d-%m-%Y")
+            end_date = datetime.strptime(to_date, "%d-%m-%Y") + timedelta(days=1)
+            end_key = end_date.strftime("%Y-%m-%d")
         except ValueError:
             raise ValueError("Invalid to_date format. Use dd-mm-yyyy")
+    
+    return start_key, end_key
 
-    for session in sessions:
-        session_date = datetime.strptime(session["date"], "%Y-%m-%d %H:%M")
-        
-        if start_date and session_date.date() < start_date.date():
-            continue
-        if end_date and session_date.date() > end_date.date():
-            continue
-            
-        filtered.append(session)
+def filter_sessions_by_date(user_token, from_date=None, to_date=None):
+    """Filters sessions by date range for a specific user"""
+    index = get_session_index(user_token)
+    start, end = index.window(*_parse_filter_dates(from_date, to_date))
+    return index.sessions[start:end]
+
+def query_sessions(user_token, from_date=None, to_date=None, limit=None, cursor=None):
+    """
+    Returns a page of sessions within a date range (dd-mm-yyyy, inclusive) for a specific user.
+    cursor is the date of the first session of the page, as returned in next_cursor by the previous page.
+    
+    Returns:
+    - tuple: (list of sessions, next_cursor or None on the last page)
+    """
+    index = get_session_index(user_token)
+    start, end = index.window(*_parse_filter_dates(from_date, to_date))
+    
+    if cursor:
+        try:
+            datetime.strptime(cursor, "%Y-%m-%d %H:%M")
+        except ValueError:
+            raise ValueError("Invalid cursor")
+        start = max(start, bisect_left(index.dates, cursor, start, end))
+    
+    if limit is not None:
+        if limit <= 0:
+            raise ValueError("limit must be positive")
+        page_end = min(end, start + limit)
+    else:
+        page_end = end
     
-    return filtered
+    next_cursor = index.dates[page_end] if page_end < end else None
+    return index.sessions[start:page_end], next_cursor
+
+def get_next_session(user_token, now=None):
+    """Returns the next upcoming session for a specific user, or None"""
+    now = now or datetime.now()
+    return get_session_index(user_token).next_session(now.strftime("%Y-%m-%d %H:%M"))
 
 def get_sorted_sessions(user_token, sort_order='asc'):
     """Returns sorted sessions for a specific user"""
-    program_data = load_program(user_token)
-    sessions = program_data["sessions"]
+    sessions = get_session_index(user_token).sessions
     
-    return sorted(
-        sessions,
-        key=lambda x: datetime.strptime(x["date"], "%Y-%m-%d %H:%M"),
-        reverse=(sort_order.lower() == 'desc')
-    )
+    if sort_order.lower() == 'desc':
+        return sessions[::-1]
+    return list(sessions)
 
 def get_profile(user_token):
     """Returns the profile data for a specific user"""
@@ -186,16 +371,92 @@ def get_profile(user_token):
 
 def update_profile(profile_data, user_token):
     """Updates the profile for a specific user"""
-    program_data = load_program(user_token)
-    program_data["profile"] = profile_data
-    save_program(program_data, user_token)
+    with get_user_lock(user_token):
+        program_data = load_program(user_token)
+        program_data["profile"] = profile_data
+        save_program(program_data, user_token)
     return program_data
 
+def _record_version(user_token, version, epoch):
+    """Records the version read from a profile file, unless a later one is already known"""
+    with _versions_lock:
+        if version >= _program_versions.get(user_token, -1):
+            _program_versions[user_token] = version
+            _program_epochs[user_token] = epoch
+
+def get_program_version(user_token):
+    """
+    Returns the current version of a user's program.
+    The version is read from the profile file once, then served from memory.
+    """
+    with _versions_lock:
+        if user_token in _program_versions:
+            return _program_versions[user_token]
+    
+    # Loading an existing file records its version
+    if os.path.exists(get_profile_path(user_token)):
+        load_program(user_token)
+    
+    with _versions_lock:
+        _program_epochs.setdefault(user_token, "")
+        return _program_versions.setdefault(user_token, 0)
+
+def get_program_etag(user_token, version=None):
+    """Returns a strong ETag identifying a version (by default the current one) of a user's program"""
+    current_version = get_program_version(user_token)
+    if version is None:
+        version = current_version
+    with _versions_lock:
+        epoch = _program_epochs[user_token]
+    digest = hashlib.sha256(f"{user_token}:{epoch}:{version}".encode()).hexdigest()[:16]
+    return f"{version}-{digest}"
+
+def get_changes_since(user_token, since_version):
+    """
+    Returns the sessions added and the dates removed since a given program version,
+    as {'version', 'added', 'removed'}, or None if the diff can't be rebuilt from the change log.
+    """
+    current_version = get_program_version(user_token)
+    if since_version is None or since_version < 0 or since_version > current_version:
+        return None
+    
+    with _versions_lock:
+        log = [entry for entry in _program_changes.get(user_token, ()) if entry[0] > since_version]
+    
+    # Every version in between must be a known diff
+    if [version for version, _ in log] != list(range(since_version + 1, current_version + 1)):
+        return None
+    if any(changes is None for _, changes in log):
+        return None
+    
+    added = {}
+    removed = set()
+    for _, changes in log:
+        for date in changes["removed"]:
+            if date in added:
+                del added[date]
+            else:
+                removed.add(date)
+        for session in changes["added"]:
+            added[session["date"]] = session
+    
+    return {
+        "version": current_version,
+        "added": sorted(added.values(), key=lambda x: datetime.strptime(x["date"], "%Y-%m-%d %H:%M")),
+        "removed": sorted(removed)
+    }
+
 def delete_program(user_token):
     """Deletes a specific user's program file"""
     profile_path = get_profile_path(user_token)
     if os.path.exists(profile_path):
+        version = get_program_version(user_token)
         os.remove(profile_path)
+        # Deleting is a change too: bump the version so cached copies and indexes are invalidated
+        with _versions_lock:
+            _program_versions[user_token] = version + 1
+            log = _program_changes.setdefault(user_token, deque(maxlen=CHANGE_LOG_SIZE))
+            log.append((version + 1, None))
         
 def verify_json_action(json_data):
     """
@@ -229,11 +490,9 @@ def verify_json_overlap(stored_sessions):
     Verifies that there are no overlapping sessions in the stored sessions.
     Returns an error message if verification fails.
     """
-    for i, session1 in enumerate(stored_sessions):
-        for j, session2 in enumerate(stored_sessions):
-            if i != j:
-                date1 = datetime.strptime(session1["date"], "%Y-%m-%d %H:%M")
-                date2 = datetime.strptime(session2["date"], "%Y-%m-%d %H:%M")
-                if abs((date1 - date2).total_seconds()) < INTERVAL_BETWEEN_SESSIONS:
-                    return f"Overlapping sessions found. Ensure at least {INTERVAL_BETWEEN_SESSIONS // 3600} hours between sessions."
+    # Once sorted, only consecutive sessions need to be compared
+    dates = sorted(datetime.strptime(session["date"], "%Y-%m-%d %H:%M") for session in stored_sessions)
+    for previous, current in zip(dates, dates[1:]):
+        if (current - previous).total_seconds() < INTERVAL_BETWEEN_SESSIONS:
+            return f"Overlapping sessions found. Ensure at least {INTERVAL_BETWEEN_SESSIONS // 3600} hours between sessions."
     return None
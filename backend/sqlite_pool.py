@@ -0,0 +1,86 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Constants
+SQLITE_POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE", 8))  # Idle connections kept open (0 disables pooling)
+SQLITE_BUSY_TIMEOUT = 5.0  # Seconds a writer waits for the lock before failing
+SQLITE_CACHED_STATEMENTS = 128  # Prepared statements kept by each connection
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",  # Readers no longer block on the writer (stored in the database file)
+    "PRAGMA synchronous = NORMAL",  # Safe with WAL, and no fsync on each commit
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -8000",  # 8 MB of page cache per connection
+)
+
+
+class SQLitePool:
+    """
+    Pool of SQLite connections opened once with the pragmas above.
+    A thread borrows a connection for the duration of an operation, so connection setup
+    is paid once per pooled connection and the statements each connection prepared are
+    reused by the next operations. Nested uses in the same thread share the borrowed connection.
+    """
+    def __init__(self, db_file, size=SQLITE_POOL_SIZE):
+        self.db_file = db_file
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size) if size else None
+        self._local = threading.local()
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.db_file,
+            timeout=SQLITE_BUSY_TIMEOUT,
+            check_same_thread=False,
+            cached_statements=SQLITE_CACHED_STATEMENTS
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _take(self):
+        if self._idle is not None:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+        return self._open()
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._idle is not None:
+            try:
+                self._idle.put_nowait(conn)
+                return
+            except queue.Full:
+                pass
+        conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Borrows a connection; an uncommitted transaction is rolled back when it is returned"""
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            yield held
+            return
+
+        conn = self._take()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._release(conn)
+
+    def close(self):
+        """Closes the idle connections"""
+        while self._idle is not None:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
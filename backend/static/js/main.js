@@ -1,6 +1,9 @@
 // Global state
 let currentlySelectedSession = null;
 let messageHistory = [];
+let currentProgram = [];
+let programVersion = null;
+let conversationId = null;
 
 // Initialize the app
 window.addEventListener('DOMContentLoaded', async () => {
@@ -13,6 +16,7 @@ window.addEventListener('DOMContentLoaded', async () => {
         
         if (data.success) {
             updateProfile(data.profile);
+            programVersion = data.version;
             updateProgram(data.program);
             
             if (data.isNew) {
@@ -57,7 +61,10 @@ document.getElementById('chat-form').addEventListener('submit', async (e) => {
             credentials: 'include',
             body: JSON.stringify({ 
                 message,
-                history: messageHistory.slice(-10)
+                // The server keeps the history once the conversation exists
+                conversation_id: conversationId,
+                history: conversationId ? undefined : messageHistory.slice(-10),
+                version: programVersion
             })
         });
         
@@ -65,13 +72,10 @@ document.getElementById('chat-form').addEventListener('submit', async (e) => {
         const data = await response.json();
         
         if (data.success) {
+            conversationId = data.conversation_id;
             addMessage('coach', data.response);
             if (data.changes_made) {
-                const programResponse = await fetch('/get-program');
-                const programData = await programResponse.json();
-                if (programData.success) {
-                    updateProgram(programData.program);
-                }
+                applyProgramChanges(data);
             }
         } else {
             addMessage('error', data.error);
@@ -142,7 +146,24 @@ function updateProfile(profile) {
 }
 
 
+// Apply a program diff ({added, removed}) or a full program returned by the server
+function applyProgramChanges(changes) {
+    if (changes.full) {
+        programVersion = changes.version;
+        updateProgram(changes.program);
+        return;
+    }
+    const removed = new Set(changes.removed);
+    const sessions = currentProgram
+        .filter(session => !removed.has(session.date))
+        .concat(changes.added)
+        .sort((a, b) => a.date.localeCompare(b.date));
+    programVersion = changes.version;
+    updateProgram(sessions);
+}
+
 function updateProgram(sessions) {
+    currentProgram = sessions;
     const programSection = document.getElementById('program-section');
     programSection.innerHTML = `
         <h2 class="text-xl font-bold mb-4 text-[#FF6B35]">Programme d'entraînement</h2>
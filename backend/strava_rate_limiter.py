@@ -0,0 +1,170 @@
+import os
+import time
+from threading import Lock
+from typing import Mapping, Optional, Tuple
+
+# Constants
+SHORT_WINDOW = 15 * 60  # Strava's short window, reset on the quarter hour (UTC)
+DAILY_WINDOW = 24 * 3600  # Reset at midnight UTC
+STRAVA_SHORT_LIMIT = int(os.environ.get("STRAVA_SHORT_LIMIT", 100))  # Read requests per 15 minutes, until the headers tell otherwise
+STRAVA_DAILY_LIMIT = int(os.environ.get("STRAVA_DAILY_LIMIT", 1000))  # Read requests per day
+RESET_MARGIN = 2  # Seconds waited after a reset, in case our clock is ahead of Strava's
+# Read limits are the binding ones for GET requests; the overall limits are used when they are missing
+LIMIT_HEADERS = (
+    ("X-ReadRateLimit-Limit", "X-ReadRateLimit-Usage"),
+    ("X-RateLimit-Limit", "X-RateLimit-Usage"),
+)
+
+
+def parse_rate_limit_headers(headers: Mapping[str, str]) -> Optional[Tuple[Tuple[int, int], Tuple[int, int]]]:
+    """
+    Returns ((short limit, daily limit), (short usage, daily usage)) from the headers
+    of a Strava response ("100,1000" and "37,420"), or None if they are missing
+    """
+    for limit_header, usage_header in LIMIT_HEADERS:
+        limit, usage = headers.get(limit_header), headers.get(usage_header)
+        if limit and usage:
+            try:
+                short_limit, daily_limit = (int(value) for value in limit.split(","))
+                short_usage, daily_usage = (int(value) for value in usage.split(","))
+            except ValueError:
+                continue
+            return (short_limit, daily_limit), (short_usage, daily_usage)
+    return None
+
+
+class RateWindow:
+    """
+    A fixed Strava window, seen as a bucket of `limit` tokens refilled at each reset.
+    `used` counts the requests sent in the current window, ours or (through the usage
+    headers) those of other processes sharing the application's quota.
+    """
+    def __init__(self, period, limit):
+        self.period = period
+        self.limit = limit
+        self.start = None
+        self.ready_at = 0
+        self.used = 0
+
+    def window_start(self, now):
+        return now - now % self.period
+
+    def _roll(self, now):
+        start = self.window_start(now)
+        if start != self.start:
+            # After an exhausted window, wait a little more in case our clock is ahead of Strava's
+            exhausted = self.start is not None and self.used >= self.limit
+            self.ready_at = start + RESET_MARGIN if exhausted else start
+            self.start = start
+            self.used = 0
+
+    def wait_time(self, now):
+        """0 if a request can be sent now, else the seconds to wait"""
+        self._roll(now)
+        if self.used >= self.limit:
+            return self.start + self.period + RESET_MARGIN - now
+        return max(0, self.ready_at - now)
+
+    def take(self):
+        self.used += 1
+
+    def update(self, limit, usage, now, sent_at):
+        self._roll(now)
+        self.limit = limit
+        # The usage of a request sent before the reset belongs to the previous window.
+        # Our count includes requests still in flight, which the usage header may not.
+        if self.window_start(sent_at) == self.start:
+            self.used = max(self.used, usage)
+
+    def exhaust(self, now, sent_at):
+        self._roll(now)
+        if self.window_start(sent_at) == self.start:
+            self.used = max(self.used, self.limit)
+        else:
+            # Strava had not reset its window yet when it answered
+            self.ready_at = max(self.ready_at, now + RESET_MARGIN)
+
+
+class StravaRateLimiter:
+    """
+    Paces the requests of every Strava sync of the process so that they never exceed the
+    application's 15-minute and daily limits: requests go out as fast as the allowance of both
+    windows permits, then wait for the next reset instead of hitting a 429.
+    Limits and usage are corrected from the headers of every response.
+    """
+    def __init__(self, short_limit=STRAVA_SHORT_LIMIT, daily_limit=STRAVA_DAILY_LIMIT,
+                 short_window=SHORT_WINDOW, daily_window=DAILY_WINDOW, clock=time.time):
+        self.short = RateWindow(short_window, short_limit)
+        self.daily = RateWindow(daily_window, daily_limit)
+        self.clock = clock
+        self._lock = Lock()
+        self.requests = 0
+        self.rate_limited = 0
+        self.waited = 0.0
+
+    def _take(self):
+        """Takes a request from both windows and returns 0, or returns the seconds until it can be sent"""
+        with self._lock:
+            now = self.clock()
+            wait = max(self.short.wait_time(now), self.daily.wait_time(now))
+            if wait > 0:
+                return wait
+            self.short.take()
+            self.daily.take()
+            self.requests += 1
+            return 0
+
+    def acquire(self, timeout=None):
+        """Waits until a request can be sent, at most `timeout` seconds. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._take()
+            if not wait:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            with self._lock:
+                self.waited += wait
+            time.sleep(wait)
+
+    def update(self, headers, sent_at):
+        """Applies the limits and usage reported by the response to a request sent at sent_at (clock time)"""
+        parsed = parse_rate_limit_headers(headers)
+        if parsed is None:
+            return
+        (short_limit, daily_limit), (short_usage, daily_usage) = parsed
+        with self._lock:
+            now = self.clock()
+            self.short.update(short_limit, short_usage, now, sent_at)
+            self.daily.update(daily_limit, daily_usage, now, sent_at)
+
+    def on_rate_limited(self, headers, sent_at):
+        """
+        After a 429 (the quota was used by another process), blocks the exhausted window
+        until its reset: the daily one if the daily usage reached its limit, else the short one
+        """
+        self.update(headers, sent_at)
+        with self._lock:
+            now = self.clock()
+            self.rate_limited += 1
+            if self.daily.used >= self.daily.limit:
+                self.daily.exhaust(now, sent_at)
+            else:
+                self.short.exhaust(now, sent_at)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "rate_limited": self.rate_limited,
+                "waited_seconds": round(self.waited, 1),
+                "short_window": f"{self.short.used}/{self.short.limit}",
+                "daily_window": f"{self.daily.used}/{self.daily.limit}"
+            }
+
+
+# Shared by all the syncs of the process, which draw on the same application quota
+strava_rate_limiter = StravaRateLimiter()
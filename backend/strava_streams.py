@@ -0,0 +1,172 @@
+"""
+Downloads the time series (streams) of the synced Strava activities, in the format read by
+ActivitySimulator and model/LstmTrain.py:
+
+    python strava_streams.py --folder strava_run --output strava_run/streams --workers 4
+
+Each activity is written to activity_data_<id>.csv (timestamp, pace_min_per_km,
+elevation_meters, heart_rate_bpm) as soon as its streams arrive, and its GPS track to
+activity_latlng_<id>.csv. Activities already written are skipped, so an interrupted
+download resumes where it stopped.
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from threading import Lock
+from typing import Dict, List, Optional
+
+import pandas as pd
+import requests
+
+from get_data_strava import StravaActivityFetcher, load_saved_activities
+
+# Constants
+STREAM_KEYS = "time,velocity_smooth,altitude,heartrate,latlng"
+REQUIRED_STREAMS = ("time", "velocity_smooth", "altitude", "heartrate")
+RUN_TYPES = {"Run", "TrailRun", "VirtualRun"}
+MIN_SPEED = 0.5  # m/s, below it the runner is stopped and the previous pace is kept
+STREAMS_WORKERS = int(os.environ.get("STRAVA_STREAMS_WORKERS", 4))
+STATE_FILE = "streams_state.json"
+
+
+def activity_data_path(output_dir: str, activity_id) -> str:
+    return os.path.join(output_dir, f"activity_data_{activity_id}.csv")
+
+
+def activity_latlng_path(output_dir: str, activity_id) -> str:
+    return os.path.join(output_dir, f"activity_latlng_{activity_id}.csv")
+
+
+def streams_to_frames(activity: Dict, streams: Dict):
+    """
+    Converts the streams of an activity (key_by_type) to (data frame, latlng frame or None).
+    Timestamps are local times, like those of the GPX exports the model was trained on.
+    """
+    start = datetime.strptime(activity['start_date_local'], "%Y-%m-%dT%H:%M:%SZ")
+    timestamps = pd.Timestamp(start) + pd.to_timedelta(streams['time']['data'], unit='s')
+    speed = pd.Series(streams['velocity_smooth']['data'], dtype=float)
+    # Same conversion as ActivitySimulator (m/s to min/km)
+    pace = (16.666667 / speed.where(speed >= MIN_SPEED)).ffill().bfill()
+
+    data = pd.DataFrame({
+        'timestamp': timestamps.strftime("%Y-%m-%d %H:%M:%S"),
+        'pace_min_per_km': pace.values,
+        'elevation_meters': streams['altitude']['data'],
+        'heart_rate_bpm': pd.Series(streams['heartrate']['data']).round().astype(int).values
+    })
+
+    latlng = None
+    if 'latlng' in streams:
+        points = streams['latlng']['data']
+        latlng = pd.DataFrame({
+            'timestamp': data['timestamp'],
+            'latitude': [point[0] for point in points],
+            'longitude': [point[1] for point in points]
+        })
+    return data, latlng
+
+
+def write_atomically(frame: pd.DataFrame, path: str) -> None:
+    """Writes a CSV through a temporary file, so an interrupted download never leaves a partial file"""
+    temporary_path = f"{path}.part"
+    frame.to_csv(temporary_path, index=False)
+    os.replace(temporary_path, path)
+
+
+class StravaStreamsDownloader:
+    """
+    Downloads activity streams concurrently. Requests go through the fetcher, so they are
+    paced by the shared rate limiter and share its pooled connections.
+    Activities without usable streams (manual entries, no heart rate) are recorded in
+    streams_state.json and not requested again.
+    """
+    def __init__(self, fetcher: StravaActivityFetcher, output_dir: str = "strava_run/streams", max_workers: int = STREAMS_WORKERS):
+        self.fetcher = fetcher
+        self.output_dir = output_dir
+        self.max_workers = max_workers
+        os.makedirs(output_dir, exist_ok=True)
+        self._state_lock = Lock()
+        self.state = self._load_state()
+
+    def _load_state(self) -> Dict:
+        try:
+            with open(os.path.join(self.output_dir, STATE_FILE), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'skipped': {}}
+
+    def _skip(self, activity_id, reason: str) -> None:
+        with self._state_lock:
+            self.state['skipped'][str(activity_id)] = reason
+            with open(os.path.join(self.output_dir, STATE_FILE), 'w') as f:
+                json.dump(self.state, f, indent=2)
+
+    def pending(self, activities: List[Dict], run_only: bool = True) -> List[Dict]:
+        """Activities whose streams were neither written nor skipped yet"""
+        return [
+            activity for activity in activities
+            if (not run_only or activity.get('sport_type', activity.get('type')) in RUN_TYPES)
+            and str(activity['id']) not in self.state['skipped']
+            and not os.path.exists(activity_data_path(self.output_dir, activity['id']))
+        ]
+
+    def download(self, activity: Dict) -> Optional[str]:
+        """Downloads and writes the streams of an activity; returns the data file, or None if skipped"""
+        try:
+            streams = self.fetcher.get(
+                f"/activities/{activity['id']}/streams",
+                {'keys': STREAM_KEYS, 'key_by_type': 'true'}
+            )
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                self._skip(activity['id'], "no streams")
+                return None
+            raise
+
+        missing = [key for key in REQUIRED_STREAMS if key not in streams]
+        if missing:
+            self._skip(activity['id'], f"missing {', '.join(missing)}")
+            return None
+
+        data, latlng = streams_to_frames(activity, streams)
+        if latlng is not None:
+            write_atomically(latlng, activity_latlng_path(self.output_dir, activity['id']))
+        # Written last: its presence marks the activity as done
+        path = activity_data_path(self.output_dir, activity['id'])
+        write_atomically(data, path)
+        return path
+
+    def download_all(self, activities: List[Dict], run_only: bool = True) -> Dict[str, int]:
+        """Downloads the pending activities concurrently; returns the number written, skipped and failed"""
+        pending = self.pending(activities, run_only)
+        counts = {'pending': len(pending), 'written': 0, 'skipped': 0, 'failed': 0}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.download, activity): activity for activity in pending}
+            for future in as_completed(futures):
+                try:
+                    counts['written' if future.result() else 'skipped'] += 1
+                except Exception as e:
+                    # Left pending, the next run retries it
+                    print(f"Failed to download the streams of {futures[future]['id']}: {e}")
+                    counts['failed'] += 1
+        return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download the streams of the synced Strava activities")
+    parser.add_argument("--folder", default="strava_run", help="Folder of the synced activities")
+    parser.add_argument("--output", default="strava_run/streams", help="Folder of the activity_data_<id>.csv files")
+    parser.add_argument("--workers", type=int, default=STREAMS_WORKERS, help="Concurrent downloads")
+    parser.add_argument("--all-types", action="store_true", help="Also download the activities that are not runs")
+    args = parser.parse_args()
+
+    fetcher = StravaActivityFetcher(os.environ.get("STRAVA_CLIENT_ID"), os.environ.get("STRAVA_CLIENT_SECRET"))
+    downloader = StravaStreamsDownloader(fetcher, args.output, args.workers)
+    counts = downloader.download_all(load_saved_activities(args.folder), run_only=not args.all_types)
+    print(counts, fetcher.rate_limiter.stats())
+
+
+if __name__ == "__main__":
+    main()
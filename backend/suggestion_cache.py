@@ -0,0 +1,101 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from llm_handler import process_suggestions_request
+
+# Constants
+SUGGESTION_TTL_SECONDS = 120  # Prefetched suggestions older than this are dropped
+PREFETCH_WORKERS = 4
+WAIT_FOR_PREFETCH_SECONDS = 3  # How long a request waits for a prefetch still running, before generating its own
+
+
+def _normalize_message(message):
+    return " ".join(message.lower().split())
+
+
+class SuggestionPrefetcher:
+    """
+    Generates chat suggestions in the background right after a coach reply, and keeps them
+    for a short time so that the follow-up /chat-suggestions request is served immediately.
+    Entries are keyed by conversation, program version and message; a conversation holds at
+    most one prefetch, cancelled as soon as the user sends something new.
+    """
+    def __init__(self, ttl=SUGGESTION_TTL_SECONDS, workers=PREFETCH_WORKERS):
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="suggestions")
+        self._entries = {}  # conversation key -> (entry key, future, created_at)
+        self._lock = Lock()
+
+    def prefetch(self, conversation_key, version, message, context_program, message_history, history_summary=None):
+        """Starts generating the suggestions of a conversation turn in the background"""
+        self.purge_expired()
+        entry_key = (version, _normalize_message(message))
+        future = self._executor.submit(
+            process_suggestions_request,
+            message,
+            context_program=context_program,
+            message_history=message_history,
+            history_summary=history_summary
+        )
+        with self._lock:
+            previous = self._entries.get(conversation_key)
+            self._entries[conversation_key] = (entry_key, future, time.monotonic())
+        if previous:
+            previous[1].cancel()
+        return future
+
+    def cancel(self, conversation_key):
+        """Drops the prefetch of a conversation, cancelling it if it hasn't started"""
+        with self._lock:
+            entry = self._entries.pop(conversation_key, None)
+        if entry:
+            entry[1].cancel()
+
+    def _pending(self, conversation_key, version, message):
+        """The prefetch of this conversation turn, or None if there is none or it expired"""
+        with self._lock:
+            entry = self._entries.get(conversation_key)
+        if not entry:
+            return None
+
+        entry_key, future, created_at = entry
+        if entry_key != (version, _normalize_message(message)) or time.monotonic() - created_at > self.ttl:
+            return None
+        return future
+
+    def get(self, conversation_key, version, message, timeout=WAIT_FOR_PREFETCH_SECONDS):
+        """
+        Returns the prefetched suggestions for this conversation turn, waiting at most timeout
+        for a prefetch still running, or None if there is none (or it failed, expired or doesn't match).
+        """
+        future = self._pending(conversation_key, version, message)
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=timeout)
+        except Exception:
+            return None
+
+    async def aget(self, conversation_key, version, message, timeout=WAIT_FOR_PREFETCH_SECONDS):
+        """Async get, for async views: waits for a running prefetch without blocking the event loop"""
+        future = self._pending(conversation_key, version, message)
+        if future is None:
+            return None
+        try:
+            # Shielded: a request giving up doesn't cancel the prefetch
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+        except Exception:
+            return None
+
+    def purge_expired(self):
+        """Removes expired entries"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (_, _, created_at) in self._entries.items() if now - created_at > self.ttl]
+            for key in expired:
+                self._entries.pop(key)[1].cancel()
+
+
+suggestion_prefetcher = SuggestionPrefetcher()